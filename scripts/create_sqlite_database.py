@@ -1,77 +1,371 @@
 '''
 A script to convert dataset files into SQLite databases.
 This is useful for leveraging the LLM's proficiency in writing SQL code.
+
+The parquet file is streamed in record batches into a temporary database file with bulk-load
+pragmas, which then atomically replaces the previous database. Besides the `products` table
+(with a numeric `price`), the categories and details of every product are normalized into
+the `product_categories` and `product_details` side tables, so that price ranges and
+category or detail filters can use indexes. A full-text index of the titles and features
+(`products_fts`) serves keyword search, and `product_cards` holds the compact card of every
+product that retrieval returns to the LLM (rebuild the database after running
+`src/chunk_rewriting.py` to put the rewritten descriptions in the cards).
 '''
+import ast
+import json
+import os
+import re
 import sqlite3
+from contextlib import closing
+
 import polars as pl
 
-def create_database_and_table(db_name: str, table_name: str):
+CREATE_TABLES_SQL = """
+CREATE TABLE {table_name} (
+    main_category TEXT,
+    title TEXT,
+    average_rating FLOAT,
+    rating_number BIGINT,
+    features TEXT,
+    description TEXT,
+    price REAL,
+    store TEXT,
+    categories TEXT,
+    details TEXT,
+    parent_asin TEXT,
+    rewritten_description TEXT
+);
+CREATE TABLE product_categories (
+    parent_asin TEXT,
+    position INTEGER,
+    category TEXT
+);
+CREATE TABLE product_details (
+    parent_asin TEXT,
+    name TEXT,
+    value TEXT
+);
+CREATE TABLE product_cards (
+    parent_asin TEXT PRIMARY KEY,
+    card TEXT,
+    token_count INTEGER
+) WITHOUT ROWID;
+"""
+
+CREATE_INDEXES_SQL = """
+CREATE UNIQUE INDEX idx_{table_name}_parent_asin ON {table_name} (parent_asin);
+CREATE INDEX idx_{table_name}_price ON {table_name} (price);
+CREATE INDEX idx_{table_name}_average_rating ON {table_name} (average_rating);
+CREATE INDEX idx_{table_name}_main_category ON {table_name} (main_category);
+CREATE INDEX idx_{table_name}_store ON {table_name} (store);
+CREATE INDEX idx_product_categories_category ON product_categories (category, parent_asin);
+CREATE INDEX idx_product_categories_parent_asin ON product_categories (parent_asin);
+CREATE INDEX idx_product_details_name_value ON product_details (name, value);
+CREATE INDEX idx_product_details_parent_asin ON product_details (parent_asin);
+"""
+
+# Keyword index of the titles and features, used when vector search is unavailable.
+CREATE_FTS_SQL = """
+CREATE VIRTUAL TABLE {table_name}_fts USING fts5(
+    title, features, content='{table_name}', content_rowid='rowid'
+);
+INSERT INTO {table_name}_fts ({table_name}_fts) VALUES ('rebuild');
+"""
+
+# Product cards are what retrieval puts in the LLM's context: a compact JSON object per product
+# with a description of at most this many characters.
+CARD_DESCRIPTION_CHARS = 400
+# Rough size of a token, for the token count stored with every card.
+CHARS_PER_TOKEN = 4
+
+# Safe while building a fresh file that nobody reads until it is renamed into place.
+BULK_LOAD_PRAGMAS = """
+PRAGMA journal_mode = OFF;
+PRAGMA synchronous = OFF;
+PRAGMA temp_store = MEMORY;
+PRAGMA cache_size = -262144;
+PRAGMA locking_mode = EXCLUSIVE;
+"""
+
+def parse_price(price: str | None) -> float | None:
     """
-    Create a SQLite database and a table if it doesn't already exist.
-    
+    Convert a price string from the dataset (e.g. "29.99" or "None") into a number.
+
     Parameters:
-    - db_name: The name of the SQLite database file.
+    - price: The raw price value.
+    """
+    try:
+        return float(price)
+    except (TypeError, ValueError):
+        return None
+
+def parse_categories(categories: str | None) -> list[str]:
+    """
+    Parse the categories of a product, stored as a Python list literal in the dataset.
+
+    Parameters:
+    - categories: The raw categories value.
+    """
+    try:
+        parsed = ast.literal_eval(categories) if categories else []
+    except (ValueError, SyntaxError):
+        return []
+    return [str(category) for category in parsed] if isinstance(parsed, list) else []
+
+def parse_details(details: str | None) -> dict:
+    """
+    Parse the details of a product, stored as a JSON object in the dataset.
+    Nested values (e.g. the best sellers rank) are kept as JSON text.
+
+    Parameters:
+    - details: The raw details value.
+    """
+    try:
+        parsed = json.loads(details) if details else {}
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    return {
+        name: value if isinstance(value, str) else json.dumps(value)
+        for name, value in parsed.items()
+    }
+
+def short_description(row: dict) -> str | None:
+    """
+    Return the short description of a product for its card: the description written by
+    `src/chunk_rewriting.py` if there is one, else its features, without HTML tags and cut
+    to `CARD_DESCRIPTION_CHARS` characters.
+
+    Parameters:
+    - row: The product row, with its `rewritten_description` and `features`.
+    """
+    text = row["rewritten_description"]
+    if not text:
+        try:
+            features = ast.literal_eval(row["features"]) if row["features"] else []
+        except (ValueError, SyntaxError):
+            features = [row["features"]]
+        text = " ".join(str(feature) for feature in features) if isinstance(features, list) else str(features)
+    text = " ".join(re.sub(r"<[^>]+>", " ", text).split())
+    if len(text) > CARD_DESCRIPTION_CHARS:
+        text = text[:CARD_DESCRIPTION_CHARS].rsplit(" ", 1)[0] + "..."
+    return text or None
+
+def build_product_card(row: dict) -> str:
+    """
+    Build the card of a product, as compact JSON without the missing fields.
+
+    Parameters:
+    - row: The product row.
+    """
+    card = {
+        "parent_asin": row["parent_asin"],
+        "title": row["title"],
+        "price": row["price"],
+        "average_rating": row["average_rating"],
+        "rating_number": row["rating_number"],
+        "store": row["store"],
+        "description": short_description(row),
+    }
+    return json.dumps(
+        {key: value for key, value in card.items() if value is not None},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+def build_product_cards(connection: sqlite3.Connection, table_name: str):
+    """
+    Precompute the card of every product, with its approximate number of tokens, into `product_cards`.
+
+    Parameters:
+    - connection: Connection to the database being built.
+    - table_name: The name of the product table.
+    """
+    connection.row_factory = sqlite3.Row
+    try:
+        rows = connection.execute(
+            f"""
+            SELECT parent_asin, title, price, average_rating, rating_number, store, features,
+                rewritten_description
+            FROM {table_name}
+            """
+        )
+        cards = []
+        for row in rows:
+            card = build_product_card(row)
+            cards.append((row["parent_asin"], card, -(-len(card) // CHARS_PER_TOKEN)))
+    finally:
+        connection.row_factory = None
+    with connection:
+        connection.executemany("INSERT INTO product_cards VALUES (?, ?, ?)", cards)
+
+def create_database_and_table(connection: sqlite3.Connection, table_name: str):
+    """
+    Create the product table and its side tables in an empty database.
+
+    Parameters:
+    - connection: Connection to the database being built.
     - table_name: The name of the table to create within the database.
     """
-    connection = sqlite3.connect(db_name)
-    cursor = connection.cursor()
-    
-    create_table_sql = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        main_category TEXT,
-        title TEXT,
-        average_rating FLOAT,
-        rating_number BIGINT,
-        features TEXT,
-        description TEXT,
-        price TEXT,
-        store TEXT,
-        categories TEXT,
-        details TEXT,
-        parent_asin TEXT
-    );
-    """
-    cursor.execute(create_table_sql)
-    connection.commit()
-    connection.close()
-    print(f"Database '{db_name}' and table '{table_name}' created successfully.")
-
-def insert_data_into_table(db_name: str, table_name: str, df: pl.DataFrame):
-    """
-    Insert data from a Polars DataFrame into a specified SQLite table.
+    connection.executescript(BULK_LOAD_PRAGMAS)
+    connection.executescript(CREATE_TABLES_SQL.format(table_name=table_name))
+
+def insert_data_into_table(connection: sqlite3.Connection, table_name: str, df: pl.DataFrame):
+    """
+    Insert one batch of products, with their categories and details, in a single transaction.
 
     Parameters:
-    - db_name: The name of the SQLite database file.
+    - connection: Connection to the database being built.
     - table_name: The name of the table to insert data into.
     - df: A Polars DataFrame containing the data to be inserted.
     """
-    connection = sqlite3.connect(db_name)
-    cursor = connection.cursor()
-    
-    # Convert the DataFrame rows into a list of tuples for insertion
-    data = df.rows()
-    
-    # SQL command to insert data rows into the table
-    insert_sql = f"""
-    INSERT INTO {table_name} (
-        main_category,
-        title,
-        average_rating,
-        rating_number,
-        features,
-        description,
-        price,
-        store,
-        categories,
-        details,
-        parent_asin
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """
-    
-    cursor.executemany(insert_sql, data)
-    connection.commit()
-    connection.close()
-    print(f"Data inserted into table '{table_name}' successfully.")
+    products, categories, details = [], [], []
+    for row in df.iter_rows(named=True):
+        asin = row["parent_asin"]
+        products.append(
+            (
+                row["main_category"],
+                row["title"],
+                row["average_rating"],
+                row["rating_number"],
+                row["features"],
+                row["description"],
+                parse_price(row["price"]),
+                row["store"],
+                row["categories"],
+                row["details"],
+                asin,
+            )
+        )
+        categories.extend(
+            (asin, position, category)
+            for position, category in enumerate(parse_categories(row["categories"]))
+        )
+        details.extend(
+            (asin, name, value) for name, value in parse_details(row["details"]).items()
+        )
+
+    with connection:
+        connection.executemany(
+            f"""
+            INSERT INTO {table_name} (
+                main_category,
+                title,
+                average_rating,
+                rating_number,
+                features,
+                description,
+                price,
+                store,
+                categories,
+                details,
+                parent_asin
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """,
+            products,
+        )
+        connection.executemany("INSERT INTO product_categories VALUES (?, ?, ?)", categories)
+        connection.executemany("INSERT INTO product_details VALUES (?, ?, ?)", details)
+
+def copy_rewritten_descriptions(connection: sqlite3.Connection, table_name: str, previous_db: str):
+    """
+    Carry over the descriptions written by `src/chunk_rewriting.py` from the previous database.
+
+    Parameters:
+    - connection: Connection to the database being built.
+    - table_name: The name of the product table.
+    - previous_db: Path of the database being replaced.
+    """
+    connection.execute("ATTACH DATABASE ? AS previous", (f"file:{previous_db}?mode=ro",))
+    try:
+        columns = [row[1] for row in connection.execute(f"PRAGMA previous.table_info({table_name})")]
+        if "rewritten_description" in columns:
+            with connection:
+                connection.execute(
+                    f"""
+                    UPDATE {table_name} SET rewritten_description = (
+                        SELECT p.rewritten_description FROM previous.{table_name} AS p
+                        WHERE p.parent_asin = {table_name}.parent_asin
+                    )
+                    """
+                )
+    finally:
+        connection.execute("DETACH DATABASE previous")
+
+def read_catalog_version(db_name: str) -> int:
+    """
+    Return the catalog version (the database's `user_version`), or 0 if there is no database yet.
+
+    Parameters:
+    - db_name: The name of the SQLite database file.
+    """
+    if not os.path.exists(db_name):
+        return 0
+    with closing(sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)) as connection:
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+
+def iter_parquet_batches(dataset_file_path: str, batch_size: int, spool_path: str):
+    """
+    Yield the rows of a parquet file in batches of `batch_size` rows, without loading the file
+    in memory.
+
+    The file is streamed once into an uncompressed Arrow IPC spool file, which is then read
+    through a memory map: every batch is a zero-copy slice of it, so only the pages of the
+    batch being inserted are read. (Slicing a parquet scan at a non-zero offset panics in
+    polars 1.18, and would re-scan the file for every batch.)
+
+    Parameters:
+    - dataset_file_path: Path to the parquet file.
+    - batch_size: Number of rows per batch.
+    - spool_path: Path of the temporary spool file, removed once every batch has been read.
+    """
+    pl.scan_parquet(dataset_file_path).sink_ipc(spool_path, compression=None)
+    try:
+        dataset = pl.read_ipc(spool_path, memory_map=True)
+        yield from dataset.iter_slices(batch_size)
+        del dataset
+    finally:
+        os.remove(spool_path)
+
+def build_database(dataset_file_path: str, db_name: str, table_name: str, batch_size: int = 10000):
+    """
+    Build the product database from a parquet file, then atomically replace `db_name` with it.
+
+    The catalog version is incremented so that the API servers drop every cache derived from
+    the previous catalog, and they reopen the new file on their next query.
+
+    Parameters:
+    - dataset_file_path: Path to the product parquet file.
+    - db_name: The name of the SQLite database file.
+    - table_name: The name of the product table.
+    - batch_size: Number of rows read and inserted per transaction.
+    """
+    tmp_db_name = f"{db_name}.tmp"
+    if os.path.exists(tmp_db_name):
+        os.remove(tmp_db_name)
+
+    version = read_catalog_version(db_name) + 1
+    # URI filenames are enabled for attaching the previous database read-only.
+    with closing(sqlite3.connect(tmp_db_name, uri=True)) as connection:
+        create_database_and_table(connection, table_name)
+        inserted = 0
+        for batch in iter_parquet_batches(dataset_file_path, batch_size, f"{tmp_db_name}.arrow"):
+            insert_data_into_table(connection, table_name, batch)
+            inserted += batch.height
+            print(f"Inserted {inserted} rows into '{table_name}'.")
+
+        connection.executescript(CREATE_INDEXES_SQL.format(table_name=table_name))
+        connection.executescript(CREATE_FTS_SQL.format(table_name=table_name))
+        if os.path.exists(db_name):
+            copy_rewritten_descriptions(connection, table_name, db_name)
+        build_product_cards(connection, table_name)
+        connection.execute("ANALYZE")
+        connection.execute(f"PRAGMA user_version = {version}")
+        connection.execute("PRAGMA journal_mode = DELETE")
+
+    os.replace(tmp_db_name, db_name)
+    print(f"Database '{db_name}' built with catalog version {version}.")
 
 def main(args: dict):
     """
@@ -80,15 +374,18 @@ def main(args: dict):
     Parameters:
     - args: A dictionary containing configurations for file paths and database details.
     """
-    create_database_and_table(args['sqlite_db'], args['table_name'])
-    # Read the data from the specified Parquet file into a Polars DataFrame
-    df = pl.read_parquet(args['dataset_file_path'])
-    insert_data_into_table(args['sqlite_db'], args['table_name'], df)
+    build_database(
+        dataset_file_path=args['dataset_file_path'],
+        db_name=args['sqlite_db'],
+        table_name=args['table_name'],
+        batch_size=args['batch_size'],
+    )
 
 if __name__ == "__main__":
     args = {
         "dataset_file_path": "data/product_information.parquet",
         "sqlite_db": "data/products_information.db",
         "table_name": "products",
+        "batch_size": 10000,
     }
-    main(args)
\ No newline at end of file
+    main(args)
@@ -0,0 +1,86 @@
+'''
+A script to report how long it takes to import a module and which imports dominate.
+It runs `python -X importtime` in a fresh interpreter, so nothing is cached from this process.
+'''
+import argparse
+import os
+import subprocess
+import sys
+
+
+def measure_imports(module: str) -> list[tuple[str, int, int]]:
+    """
+    Import a module in a fresh interpreter and collect the `-X importtime` measurements.
+
+    Args:
+        module (str): Dotted name of the module to import, e.g. "src.main".
+
+    Returns:
+        list[tuple[str, int, int]]: (module name, self time in µs, cumulative time in µs) per imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PRELOAD_IN_BACKGROUND": "false"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    measurements = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative_time, name = line[len("import time:") :].split("|")
+        measurements.append((name.strip(), int(self_time), int(cumulative_time)))
+    return measurements
+
+
+def print_report(module: str, measurements: list[tuple[str, int, int]], top: int):
+    """
+    Print the total import time, the slowest imports and the time spent per top-level package.
+    """
+    total = next(
+        cumulative for name, _, cumulative in measurements if name == module
+    )
+    print(f"Importing {module} took {total / 1e6:.3f}s ({len(measurements)} modules)\n")
+
+    print(f"Slowest {top} imports by cumulative time:")
+    for name, _, cumulative in sorted(measurements, key=lambda m: -m[2])[:top]:
+        print(f"  {cumulative / 1e3:10.1f} ms  {name}")
+
+    packages = {}
+    for name, self_time, _ in measurements:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_time
+    print(f"\nSlowest {top} top-level packages by self time:")
+    for package, self_time in sorted(packages.items(), key=lambda p: -p[1])[:top]:
+        print(f"  {self_time / 1e3:10.1f} ms  {package}")
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for the import-time report.
+
+    Returns:
+        args: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Report the import time of a module.")
+    parser.add_argument(
+        "--module",
+        type=str,
+        default="src.main",
+        help="Dotted name of the module to import.",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=15,
+        help="Number of entries to show in each section.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    print_report(args.module, measure_imports(args.module), args.top)
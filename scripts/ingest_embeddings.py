@@ -1,25 +1,181 @@
 import argparse
+import json
 import os
+import re
+from datetime import datetime, timezone
 from pathlib import Path
 
+import numpy as np
 import openai
 import polars as pl
 from tqdm import tqdm
 from qdrant_client import QdrantClient, models
 from qdrant_client.models import Distance, VectorParams
 
-from src.utils import create_logger, log_execution_time
-from src.emb import embed_chunks
+# The payload's price must match the `price` column of the product database.
+from create_sqlite_database import parse_price
+from src.utils import bump_catalog_version, create_logger, log_execution_time
+from src.emb import EMBEDDING_MODEL, embed_chunks
+from src.embedding_snapshot import SNAPSHOT_FORMAT_VERSION, read_snapshot, upload_snapshot
 
 COLLECTION_NAME = os.environ.get("QDRANT_COLLECTION_NAME", "products_information")
 
+# Typed payload fields that retrieval can filter on inside the vector search, with their index type.
+PAYLOAD_INDEXES = {
+    "price": models.PayloadSchemaType.FLOAT,
+    "average_rating": models.PayloadSchemaType.FLOAT,
+    "rating_number": models.PayloadSchemaType.INTEGER,
+    "main_category": models.PayloadSchemaType.KEYWORD,
+    "store": models.PayloadSchemaType.KEYWORD,
+}
+
+QUANTIZATION_TYPES = ("none", "scalar", "binary")
+
+# Points read or uploaded per request when exporting or importing an embedding snapshot
+# (see `src/embedding_snapshot.py` for the format).
+SNAPSHOT_BATCH_SIZE = 1000
+# Qdrant's default; indexing is turned off while a snapshot is bulk-loaded, then back on.
+INDEXING_THRESHOLD_KB = 20000
 
 logger = create_logger(logger_name="script", log_file="api.log", log_level="info")
 
 
+def build_payload(row: dict) -> dict:
+    """
+    Build the Qdrant payload of a product: its identifiers plus typed fields to filter on.
+
+    Args:
+        row (dict): A row of the product dataset.
+
+    Returns:
+        dict: The payload, without the fields whose value is missing.
+    """
+    payload = {
+        "parent_asin": row["parent_asin"],
+        "title": row["title"],
+        "price": parse_price(row["price"]),
+        "average_rating": row["average_rating"],
+        "rating_number": row["rating_number"],
+        "main_category": row["main_category"],
+        "store": row["store"],
+    }
+    return {key: value for key, value in payload.items() if value is not None}
+
+
+def create_payload_indexes(client: QdrantClient) -> None:
+    """
+    Create the payload indexes used by filtered vector search. Existing indexes are kept.
+
+    Args:
+        client (QdrantClient): Instance of the QdrantClient to interact with the vectordb.
+    """
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(
+            collection_name=COLLECTION_NAME,
+            field_name=field_name,
+            field_schema=field_schema,
+        )
+    logger.info(f"Payload indexes ensured for {list(PAYLOAD_INDEXES)}.")
+
+
+@log_execution_time(logger=logger)
+def update_payloads(dataset_file: Path, client: QdrantClient, batch_size: int) -> None:
+    """
+    Rewrite the payload of every point of an existing collection without re-embedding,
+    e.g. to add the typed filter fields to a collection ingested before they existed.
+
+    Args:
+        dataset_file (Path): Path to the dataset parquet file the collection was built from.
+        client (QdrantClient): Instance of the QdrantClient to interact with the vectordb.
+        batch_size (int): Number of points updated per request.
+    """
+    dataset = pl.read_parquet(dataset_file).with_row_index("id")
+    for i in tqdm(range(0, dataset.shape[0], batch_size), desc="Updating payloads"):
+        batch_df = dataset[i : i + batch_size]
+        client.batch_update_points(
+            collection_name=COLLECTION_NAME,
+            update_operations=[
+                models.SetPayloadOperation(
+                    set_payload=models.SetPayload(
+                        payload=build_payload(row), points=[row["id"]]
+                    )
+                )
+                for row in batch_df.iter_rows(named=True)
+            ],
+        )
+    create_payload_indexes(client)
+
+
+def build_quantization_config(
+    quantization: str,
+) -> models.ScalarQuantization | models.BinaryQuantization | None:
+    """
+    Build the quantization config of a collection.
+
+    Scalar quantization stores int8 vectors (4x smaller, small recall loss); binary quantization
+    stores one bit per dimension (32x smaller, needs rescoring to keep recall). The quantized
+    vectors are kept in RAM, so they can be searched even when the original vectors are on disk.
+
+    Args:
+        quantization (str): One of `QUANTIZATION_TYPES`.
+
+    Returns:
+        ScalarQuantization | BinaryQuantization | None: The config, or None for no quantization.
+    """
+    if quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    if quantization != "none":
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATION_TYPES}.")
+    return None
+
+
+def build_collection_config(
+    embedding_dimension: int,
+    hnsw_m: int | None = None,
+    hnsw_ef_construct: int | None = None,
+    on_disk: bool = False,
+    quantization: str = "none",
+) -> dict:
+    """
+    Build the arguments of `QdrantClient.create_collection` for the product vectors.
+
+    Args:
+        embedding_dimension (int): Dimensionality of the embedding vectors.
+        hnsw_m (int | None): Number of edges per node of the HNSW graph; None keeps Qdrant's default.
+        hnsw_ef_construct (int | None): Beam width used while building the graph; None keeps the default.
+        on_disk (bool): Whether to keep the original vectors on disk (memmapped) instead of in RAM.
+        quantization (str): One of `QUANTIZATION_TYPES`.
+
+    Returns:
+        dict: The `vectors_config`, `hnsw_config` and `quantization_config` arguments.
+    """
+    return {
+        "vectors_config": VectorParams(
+            size=embedding_dimension, distance=Distance.DOT, on_disk=on_disk
+        ),
+        "hnsw_config": models.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct),
+        "quantization_config": build_quantization_config(quantization),
+    }
+
+
 @log_execution_time(logger=logger)
 def ingest_dataset(
-    dataset_file: Path, client: QdrantClient, embedding_dimension: int, batch_size: int
+    dataset_file: Path,
+    client: QdrantClient,
+    embedding_dimension: int,
+    batch_size: int,
+    hnsw_m: int | None = None,
+    hnsw_ef_construct: int | None = None,
+    on_disk: bool = False,
+    quantization: str = "none",
 ) -> None:
     """
     Ingest a dataset parquet file into Qdrant by creating a collection, embedding text into vectors,
@@ -29,6 +185,9 @@ def ingest_dataset(
         dataset_file (Path): Path to the dataset parquet file.
         client (QdrantClient): Instance of the QdrantClient to interact with the vectordb.
         embedding_dimension (int): Dimensionality of the embedding vectors.
+        batch_size (int): Number of texts embedded and upserted per request.
+        hnsw_m, hnsw_ef_construct, on_disk, quantization: Index settings of the collection
+            (see `build_collection_config`).
     """
     if client.collection_exists(collection_name=COLLECTION_NAME):
         logger.info("Collection already exists! Skipping embedding and insertion.")
@@ -37,8 +196,18 @@ def ingest_dataset(
     # Create a new collection within Qdrant
     client.create_collection(
         collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=embedding_dimension, distance=Distance.DOT),
+        **build_collection_config(
+            embedding_dimension,
+            hnsw_m=hnsw_m,
+            hnsw_ef_construct=hnsw_ef_construct,
+            on_disk=on_disk,
+            quantization=quantization,
+        ),
+    )
+    logger.info(
+        f"Collection created with {hnsw_m=}, {hnsw_ef_construct=}, {on_disk=}, {quantization=}."
     )
+    create_payload_indexes(client)
 
     # Read data from the parquet and prepare for processing
     dataset = pl.read_parquet(dataset_file).with_row_index("id")
@@ -56,10 +225,7 @@ def ingest_dataset(
                 points=models.Batch(
                     ids=batch_df["id"].to_list(),
                     payloads=[
-                        {"parent_asin": parent_asin, "title": title}
-                        for title, parent_asin in batch_df[
-                            ["title", "parent_asin"]
-                        ].iter_rows()
+                        build_payload(row) for row in batch_df.iter_rows(named=True)
                     ],
                     vectors=embedding_vectors,
                 ),
@@ -71,6 +237,128 @@ def ingest_dataset(
             logger.exception(f"Failed to upsert: {e}")
             raise
 
+    # Invalidate the retrieval caches of the running API servers
+    catalog_version = bump_catalog_version()
+    logger.info(f"Catalog version bumped to {catalog_version}.")
+
+
+@log_execution_time(logger=logger)
+def export_snapshot(client: QdrantClient, output_dir: Path, batch_size: int) -> Path:
+    """
+    Export the ids, payloads and vectors of the collection into a new snapshot directory,
+    named after the collection, the embedding model, the dimension and the time.
+
+    Args:
+        client (QdrantClient): Instance of the QdrantClient to interact with the vectordb.
+        output_dir (Path): Directory in which the snapshot directory is created.
+        batch_size (int): Number of points read per request.
+
+    Returns:
+        Path: The snapshot directory.
+    """
+    dimension = client.get_collection(collection_name=COLLECTION_NAME).config.params.vectors.size
+    count = client.count(collection_name=COLLECTION_NAME, exact=True).count
+    created_at = datetime.now(timezone.utc)
+    model_slug = re.sub(r"[^\w.-]+", "-", EMBEDDING_MODEL)
+    snapshot_dir = output_dir / (
+        f"{COLLECTION_NAME}-{model_slug}-{dimension}d-{created_at:%Y%m%dT%H%M%SZ}"
+    )
+    snapshot_dir.mkdir(parents=True)
+
+    vectors = np.lib.format.open_memmap(
+        snapshot_dir / "vectors.npy", mode="w+", dtype=np.float32, shape=(count, dimension)
+    )
+    ids, asins, payloads = [], [], []
+    offset = None
+    with tqdm(total=count, desc="Exporting snapshot") as progress:
+        while True:
+            points, offset = client.scroll(
+                collection_name=COLLECTION_NAME,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if len(ids) + len(points) > count:
+                raise RuntimeError("The collection changed during the export.")
+            vectors[len(ids) : len(ids) + len(points)] = [point.vector for point in points]
+            for point in points:
+                ids.append(point.id)
+                asins.append(point.payload.get("parent_asin"))
+                payloads.append(json.dumps(point.payload))
+            progress.update(len(points))
+            if offset is None:
+                break
+    if len(ids) != count:
+        raise RuntimeError("The collection changed during the export.")
+    vectors.flush()
+    del vectors
+
+    pl.DataFrame(
+        {"id": ids, "parent_asin": asins, "payload": payloads},
+        schema={"id": pl.UInt64, "parent_asin": pl.Utf8, "payload": pl.Utf8},
+    ).write_parquet(snapshot_dir / "points.parquet")
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "collection": COLLECTION_NAME,
+        "model": EMBEDDING_MODEL,
+        "dimension": dimension,
+        "distance": "dot",
+        "count": count,
+        "created_at": created_at.isoformat(),
+    }
+    (snapshot_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    logger.info(f"Exported {count} points to {snapshot_dir}.")
+    return snapshot_dir
+
+
+@log_execution_time(logger=logger)
+def import_snapshot(
+    snapshot_dir: Path,
+    client: QdrantClient,
+    embedding_dimension: int,
+    batch_size: int,
+    **collection_config,
+) -> None:
+    """
+    Bulk-load a snapshot written by `export_snapshot` into a new collection, without embedding.
+
+    Indexing is disabled while the points are uploaded and the HNSW graph is built once at the
+    end. The snapshot must have been made with the configured embedding model and dimension,
+    otherwise query embeddings wouldn't match the stored vectors.
+
+    Args:
+        snapshot_dir (Path): The snapshot directory.
+        client (QdrantClient): Instance of the QdrantClient to interact with the vectordb.
+        embedding_dimension (int): Dimensionality of the embedding vectors.
+        batch_size (int): Number of points uploaded per request.
+        **collection_config: Index settings of the collection (see `build_collection_config`).
+
+    Raises:
+        ValueError: If the snapshot doesn't match the format, embedding model or dimension.
+    """
+    _, vectors, points = read_snapshot(snapshot_dir, embedding_dimension)
+    if client.collection_exists(collection_name=COLLECTION_NAME):
+        logger.info("Collection already exists! Skipping the snapshot import.")
+        return
+
+    client.create_collection(
+        collection_name=COLLECTION_NAME,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0),
+        **build_collection_config(embedding_dimension, **collection_config),
+    )
+    upload_snapshot(client, COLLECTION_NAME, vectors, points, batch_size=batch_size)
+    client.update_collection(
+        collection_name=COLLECTION_NAME,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=INDEXING_THRESHOLD_KB),
+    )
+    create_payload_indexes(client)
+    logger.info(f"Imported {len(points)} points from {snapshot_dir}.")
+
+    # Invalidate the retrieval caches of the running API servers
+    catalog_version = bump_catalog_version()
+    logger.info(f"Catalog version bumped to {catalog_version}.")
+
 
 def parse_arguments():
     """
@@ -108,6 +396,49 @@ def parse_arguments():
         default=os.environ.get("OPENAI_API_KEY"),
         help="The API key for the OpenAI API.",
     )
+    parser.add_argument(
+        "--update-payloads",
+        action="store_true",
+        help="Only rewrite the payloads (and payload indexes) of an existing collection.",
+    )
+    parser.add_argument(
+        "--hnsw-m",
+        type=int,
+        default=None,
+        help="Edges per node of the HNSW graph (Qdrant's default is 16).",
+    )
+    parser.add_argument(
+        "--hnsw-ef-construct",
+        type=int,
+        default=None,
+        help="Beam width used while building the HNSW graph (Qdrant's default is 100).",
+    )
+    parser.add_argument(
+        "--on-disk",
+        action="store_true",
+        help="Keep the original vectors on disk instead of in RAM.",
+    )
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATION_TYPES,
+        default="none",
+        help="Quantize the vectors kept in RAM. Use `scripts/qdrant_sweep.py` to pick the settings.",
+    )
+    parser.add_argument(
+        "--export-snapshot",
+        type=Path,
+        default=None,
+        metavar="OUTPUT_DIR",
+        help="Export the ids, payloads and vectors of the collection into a new snapshot in OUTPUT_DIR.",
+    )
+    parser.add_argument(
+        "--import-snapshot",
+        type=Path,
+        default=None,
+        metavar="SNAPSHOT_DIR",
+        help="Create the collection from a snapshot instead of embedding the dataset. "
+        "The API can also serve a snapshot without Qdrant, see QDRANT_SNAPSHOT_PATH.",
+    )
 
     return parser.parse_args()
 
@@ -123,9 +454,36 @@ if __name__ == "__main__":
         base_url=args.openai_base_url, api_key=args.openai_api_key
     )
 
-    ingest_dataset(
-        dataset_file=Path("data/product_information.parquet"),
-        client=vectordb_client,
-        embedding_dimension=args.embedding_dimension,
-        batch_size=batch_size,
-    )
\ No newline at end of file
+    collection_config = {
+        "hnsw_m": args.hnsw_m,
+        "hnsw_ef_construct": args.hnsw_ef_construct,
+        "on_disk": args.on_disk,
+        "quantization": args.quantization,
+    }
+    if args.export_snapshot:
+        export_snapshot(
+            client=vectordb_client, output_dir=args.export_snapshot, batch_size=SNAPSHOT_BATCH_SIZE
+        )
+    elif args.import_snapshot:
+        import_snapshot(
+            snapshot_dir=args.import_snapshot,
+            client=vectordb_client,
+            embedding_dimension=args.embedding_dimension,
+            batch_size=SNAPSHOT_BATCH_SIZE,
+            **collection_config,
+        )
+    elif args.update_payloads:
+        update_payloads(
+            dataset_file=Path("data/product_information.parquet"),
+            client=vectordb_client,
+            batch_size=batch_size,
+        )
+        bump_catalog_version()
+    else:
+        ingest_dataset(
+            dataset_file=Path("data/product_information.parquet"),
+            client=vectordb_client,
+            embedding_dimension=args.embedding_dimension,
+            batch_size=batch_size,
+            **collection_config,
+        )
\ No newline at end of file
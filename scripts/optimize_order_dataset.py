@@ -0,0 +1,103 @@
+'''
+A script to rewrite the order dataset in a layout that suits lazy scanning (`ORDER_DATA_MODE=lazy`).
+
+- "sorted": one parquet file sorted by Customer_Id with small row groups, so that the row group
+  statistics let the reader skip everything but the requested customer.
+- "partitioned": a hive-partitioned directory with one partition per Product_Category (each
+  sorted by Customer_Id), so that category filters only open the matching files.
+
+Point `ORDER_DATASET_PATH` to the output afterwards.
+'''
+import argparse
+import shutil
+from pathlib import Path
+
+import polars as pl
+
+SORT_COLUMNS = ["Customer_Id", "Order_Date", "Time"]
+
+
+def write_sorted(dataset_file: Path, output_path: Path, row_group_size: int):
+    """
+    Write the dataset as a single parquet file sorted by customer, with per-row-group statistics.
+
+    Args:
+        dataset_file (Path): Path to the source parquet file.
+        output_path (Path): Path of the parquet file to write.
+        row_group_size (int): Number of rows per row group.
+    """
+    pl.scan_parquet(dataset_file).sort(SORT_COLUMNS).collect().write_parquet(
+        output_path, row_group_size=row_group_size, statistics=True
+    )
+
+
+def write_partitioned(dataset_file: Path, output_path: Path, row_group_size: int):
+    """
+    Write the dataset as a hive-partitioned directory, one partition per product category.
+
+    Args:
+        dataset_file (Path): Path to the source parquet file.
+        output_path (Path): Directory to write the partitions into. It is replaced if it exists.
+        row_group_size (int): Number of rows per row group.
+    """
+    if output_path.exists():
+        shutil.rmtree(output_path)
+    pl.scan_parquet(dataset_file).sort(SORT_COLUMNS).collect().write_parquet(
+        output_path,
+        partition_by="Product_Category",
+        row_group_size=row_group_size,
+        statistics=True,
+    )
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for rewriting the order dataset.
+
+    Returns:
+        args: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Rewrite the order dataset for predicate pushdown."
+    )
+    parser.add_argument(
+        "--dataset-file",
+        type=Path,
+        default=Path("data/order_data.parquet"),
+        help="Path to the source parquet file.",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=["sorted", "partitioned"],
+        default="sorted",
+        help="Layout of the rewritten dataset.",
+    )
+    parser.add_argument(
+        "--output-path",
+        type=Path,
+        default=None,
+        help="Output file (sorted) or directory (partitioned). Defaults to a path next to the source.",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=8192,
+        help="Number of rows per row group.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.layout == "sorted":
+        output_path = args.output_path or args.dataset_file.with_name(
+            f"{args.dataset_file.stem}_sorted.parquet"
+        )
+        write_sorted(args.dataset_file, output_path, args.row_group_size)
+    else:
+        output_path = args.output_path or args.dataset_file.with_name(
+            f"{args.dataset_file.stem}_partitioned"
+        )
+        write_partitioned(args.dataset_file, output_path, args.row_group_size)
+    print(f"Wrote the {args.layout} order dataset to '{output_path}'.")
+    print(f"Use it with ORDER_DATA_MODE=lazy ORDER_DATASET_PATH={output_path}")
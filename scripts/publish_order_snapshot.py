@@ -0,0 +1,41 @@
+'''
+A script to (re)publish the order dataset as a memory-mappable Arrow IPC snapshot.
+
+With `ORDER_DATA_MODE=mmap`, every API worker maps the same snapshot file, so adding workers
+doesn't multiply resident memory. Re-running this script swaps the file atomically and the
+workers pick up the new data within `ORDER_SNAPSHOT_CHECK_INTERVAL` seconds.
+'''
+import argparse
+
+from src.mock_api import DATASET_PATH, ORDER_SNAPSHOT_PATH, publish_order_snapshot
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for publishing the order snapshot.
+
+    Returns:
+        args: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Publish the order dataset as a shared Arrow IPC snapshot."
+    )
+    parser.add_argument(
+        "--dataset-path",
+        type=str,
+        default=DATASET_PATH,
+        help="Path to the source parquet dataset.",
+    )
+    parser.add_argument(
+        "--snapshot-path",
+        type=str,
+        default=ORDER_SNAPSHOT_PATH,
+        help="Path of the Arrow IPC snapshot that the workers memory-map.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    publish_order_snapshot(dataset_path=args.dataset_path, snapshot_path=args.snapshot_path)
+    print(f"Published '{args.dataset_path}' to '{args.snapshot_path}'.")
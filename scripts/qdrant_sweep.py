@@ -0,0 +1,318 @@
+'''
+A script to choose the Qdrant index settings of the product collection by measuring their
+recall and latency.
+
+A held-out query set (vectors left out of the index) is searched in one collection per index
+setting (HNSW `m` / `ef_construct`, on-disk vectors, quantization), with every requested search
+setting (`hnsw_ef`). For each combination it reports recall@k against exact (brute-force) search
+and the p50/p99 search latency. The vectors come from an existing collection (e.g. the
+production one), a `.npy` file, or are generated with a fixed seed.
+
+Run it against a local Qdrant server, e.g. `docker run -p 6333:6333 qdrant/qdrant`.
+`--qdrant-url :memory:` runs Qdrant's embedded mode, which always searches exhaustively: use it
+only to try the script.
+
+The chosen settings are then passed to `scripts/ingest_embeddings.py` (`--hnsw-m`,
+`--hnsw-ef-construct`, `--on-disk`, `--quantization`) and to the API (`QDRANT_HNSW_EF`).
+'''
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from ingest_embeddings import QUANTIZATION_TYPES, build_collection_config
+
+COLLECTION_NAME = os.environ.get("QDRANT_COLLECTION_NAME", "products_information")
+SWEEP_COLLECTION_NAME = "qdrant_sweep"
+UPSERT_BATCH_SIZE = 1000
+
+
+def load_source_vectors(client: QdrantClient, collection_name: str, limit: int | None) -> np.ndarray:
+    """
+    Read the vectors stored in an existing collection.
+
+    Args:
+        client (QdrantClient): Client of the Qdrant instance holding the collection.
+        collection_name (str): Name of the collection.
+        limit (int | None): Maximum number of vectors to read; None reads all of them.
+
+    Returns:
+        np.ndarray: The vectors, one per row.
+    """
+    vectors, offset = [], None
+    while limit is None or len(vectors) < limit:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=UPSERT_BATCH_SIZE,
+            offset=offset,
+            with_payload=False,
+            with_vectors=True,
+        )
+        vectors.extend(point.vector for point in points)
+        if offset is None:
+            break
+    return np.asarray(vectors[:limit], dtype=np.float32)
+
+
+def make_vectors(n_vectors: int, dimension: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Generate normalized vectors grouped in clusters, closer to real embeddings than uniform noise.
+
+    Args:
+        n_vectors (int): Number of vectors.
+        dimension (int): Dimension of the vectors.
+        rng (np.random.Generator): Seeded random generator.
+
+    Returns:
+        np.ndarray: The vectors, one per row.
+    """
+    centers = rng.standard_normal((max(1, n_vectors // 100), dimension))
+    vectors = centers[rng.integers(len(centers), size=n_vectors)]
+    vectors = vectors + 0.5 * rng.standard_normal((n_vectors, dimension))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the ids of the `k` vectors with the highest dot product with each query.
+    """
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def build_collection(
+    client: QdrantClient, vectors: np.ndarray, setting: dict, index_timeout: float
+) -> float:
+    """
+    (Re)create the sweep collection with the given index setting, upload the vectors and
+    wait until they are indexed.
+
+    Args:
+        client (QdrantClient): Client of the Qdrant instance to sweep.
+        vectors (np.ndarray): The vectors to index; their row number is their id.
+        setting (dict): `hnsw_m`, `hnsw_ef_construct`, `on_disk` and `quantization`.
+        index_timeout (float): Maximum number of seconds to wait for the index.
+
+    Returns:
+        float: Seconds spent uploading and indexing.
+    """
+    start_time = time.perf_counter()
+    client.delete_collection(collection_name=SWEEP_COLLECTION_NAME)
+    client.create_collection(
+        collection_name=SWEEP_COLLECTION_NAME,
+        # Index every segment, however small, so the sweep measures HNSW rather than a full scan.
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1),
+        **build_collection_config(vectors.shape[1], **setting),
+    )
+    for i in range(0, len(vectors), UPSERT_BATCH_SIZE):
+        client.upsert(
+            collection_name=SWEEP_COLLECTION_NAME,
+            points=models.Batch(
+                ids=list(range(i, min(i + UPSERT_BATCH_SIZE, len(vectors)))),
+                vectors=vectors[i : i + UPSERT_BATCH_SIZE].tolist(),
+            ),
+            wait=True,
+        )
+
+    if client.init_options.get("location") != ":memory:":
+        while True:
+            info = client.get_collection(collection_name=SWEEP_COLLECTION_NAME)
+            if (
+                info.status == models.CollectionStatus.GREEN
+                and (info.indexed_vectors_count or 0) >= len(vectors)
+            ):
+                break
+            if time.perf_counter() - start_time > index_timeout:
+                print(f"WARNING: index not complete after {index_timeout}s, measuring anyway.")
+                break
+            time.sleep(0.5)
+    return time.perf_counter() - start_time
+
+
+def measure_search(
+    client: QdrantClient,
+    queries: np.ndarray,
+    expected: np.ndarray,
+    k: int,
+    search_params: models.SearchParams,
+) -> dict:
+    """
+    Search every query in the sweep collection and compare the results with exact search.
+
+    Args:
+        client (QdrantClient): Client of the Qdrant instance to sweep.
+        queries (np.ndarray): The held-out query vectors.
+        expected (np.ndarray): The exact top-k ids of every query.
+        k (int): Number of results per query.
+        search_params (models.SearchParams): The search setting to measure.
+
+    Returns:
+        dict: Mean recall@k and latency percentiles in milliseconds.
+    """
+    recalls, durations = [], []
+    for query, neighbours in zip(queries, expected):
+        start_time = time.perf_counter()
+        points = client.query_points(
+            collection_name=SWEEP_COLLECTION_NAME,
+            query=query.tolist(),
+            limit=k,
+            search_params=search_params,
+        ).points
+        durations.append((time.perf_counter() - start_time) * 1000)
+        recalls.append(len({point.id for point in points} & set(neighbours.tolist())) / k)
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(durations, 50)),
+        "p99_ms": float(np.percentile(durations, 99)),
+    }
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for the index settings sweep.
+
+    Returns:
+        args: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Measure recall@k and latency of Qdrant index and search settings."
+    )
+    parser.add_argument(
+        "--qdrant-url",
+        type=str,
+        default="http://localhost:6333",
+        help="URL of the Qdrant server to sweep on; its '%s' collection is overwritten." % SWEEP_COLLECTION_NAME,
+    )
+    parser.add_argument(
+        "--source-url",
+        type=str,
+        default=None,
+        help="Read the vectors of the product collection from this Qdrant URL.",
+    )
+    parser.add_argument(
+        "--vectors-file",
+        type=Path,
+        default=None,
+        help="Read the vectors from a .npy file (one vector per row).",
+    )
+    parser.add_argument(
+        "--num-vectors",
+        type=int,
+        default=20000,
+        help="Number of vectors to use (generated ones when no source is given).",
+    )
+    parser.add_argument(
+        "--dimension", type=int, default=1024, help="Dimension of generated vectors."
+    )
+    parser.add_argument(
+        "--num-queries",
+        type=int,
+        default=200,
+        help="Number of vectors held out of the index and used as queries.",
+    )
+    parser.add_argument("--k", type=int, default=10, help="Recall is measured on the top k results.")
+    parser.add_argument("--hnsw-m", type=int, nargs="+", default=[16])
+    parser.add_argument("--hnsw-ef-construct", type=int, nargs="+", default=[100])
+    parser.add_argument(
+        "--quantization", choices=QUANTIZATION_TYPES, nargs="+", default=list(QUANTIZATION_TYPES)
+    )
+    parser.add_argument(
+        "--on-disk",
+        action="store_true",
+        help="Also measure every setting with the original vectors on disk.",
+    )
+    parser.add_argument("--hnsw-ef", type=int, nargs="+", default=[32, 64, 128, 256])
+    parser.add_argument(
+        "--oversampling",
+        type=float,
+        default=None,
+        help="Oversampling of quantized searches (like QDRANT_QUANTIZATION_OVERSAMPLING).",
+    )
+    parser.add_argument("--index-timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output-file", type=Path, default=None, help="Write the results as JSON to this file."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    rng = np.random.default_rng(args.seed)
+    n_vectors = args.num_vectors + args.num_queries
+
+    if args.source_url:
+        source_client = QdrantClient(url=args.source_url, api_key=os.environ.get("QDRANT_API_KEY"))
+        vectors = load_source_vectors(source_client, COLLECTION_NAME, n_vectors)
+    elif args.vectors_file:
+        vectors = np.load(args.vectors_file)[:n_vectors].astype(np.float32)
+    else:
+        vectors = make_vectors(n_vectors, args.dimension, rng)
+    if len(vectors) <= args.num_queries:
+        sys.exit(f"Only {len(vectors)} vectors available for {args.num_queries} queries.")
+
+    vectors = vectors[rng.permutation(len(vectors))]
+    queries, vectors = vectors[: args.num_queries], vectors[args.num_queries :]
+    expected = exact_neighbours(vectors, queries, args.k)
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries.")
+
+    client = QdrantClient(location=args.qdrant_url, api_key=os.environ.get("QDRANT_API_KEY"))
+    results = []
+    settings = itertools.product(
+        args.hnsw_m,
+        args.hnsw_ef_construct,
+        [False, True] if args.on_disk else [False],
+        args.quantization,
+    )
+    for hnsw_m, hnsw_ef_construct, on_disk, quantization in settings:
+        setting = {
+            "hnsw_m": hnsw_m,
+            "hnsw_ef_construct": hnsw_ef_construct,
+            "on_disk": on_disk,
+            "quantization": quantization,
+        }
+        build_seconds = build_collection(client, vectors, setting, args.index_timeout)
+        for hnsw_ef in args.hnsw_ef:
+            search_params = models.SearchParams(
+                hnsw_ef=hnsw_ef,
+                quantization=models.QuantizationSearchParams(
+                    rescore=True, oversampling=args.oversampling
+                ),
+            )
+            result = {
+                **setting,
+                "hnsw_ef": hnsw_ef,
+                "build_seconds": build_seconds,
+                **measure_search(client, queries, expected, args.k, search_params),
+            }
+            results.append(result)
+            print(
+                f"m={hnsw_m:<3} ef_construct={hnsw_ef_construct:<4} on_disk={on_disk!s:<5}"
+                f" quantization={quantization:<6} hnsw_ef={hnsw_ef:<4}"
+                f" recall@{args.k} {result['recall']:.4f}"
+                f"  p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms"
+            )
+    client.delete_collection(collection_name=SWEEP_COLLECTION_NAME)
+
+    if args.output_file:
+        report = {
+            "meta": {
+                "num_vectors": len(vectors),
+                "dimension": int(vectors.shape[1]),
+                "num_queries": len(queries),
+                "k": args.k,
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        args.output_file.write_text(json.dumps(report, indent=2))
+        print(f"Results written to '{args.output_file}'.")
@@ -0,0 +1,91 @@
+'''
+A script to run a JSONL file of chat threads through the assistant, e.g. for nightly evaluation.
+Results are written as JSON lines as soon as each thread finishes, followed by a report line.
+'''
+import argparse
+import asyncio
+import json
+import os
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+
+from src.batch import BATCH_CONCURRENCY, stream_batch
+from src.llm import LLM_REQUESTS_PER_MINUTE, rate_limiter
+
+
+async def run(input_file: Path, output_file: Path | None, concurrency: int) -> dict:
+    """
+    Stream the batch results into the output file (or stdout) and return the final report.
+
+    Args:
+        input_file (Path): JSONL file where every line is a serialized `Thread`.
+        output_file (Path | None): Where to write the result lines. Defaults to stdout.
+        concurrency (int): Maximum number of threads processed at the same time.
+
+    Returns:
+        dict: The report record emitted at the end of the batch.
+    """
+    # Read off the event loop, so that the batch's requests don't wait on the disk.
+    lines = (await asyncio.to_thread(Path(input_file).read_text)).splitlines()
+
+    with open(output_file, "w") if output_file else nullcontext(sys.stdout) as output:
+        async for record in stream_batch(lines=lines, concurrency=concurrency):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    return record
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for configuring the batch run.
+
+    Returns:
+        args: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Run a JSONL file of chat threads through the assistant."
+    )
+    parser.add_argument(
+        "input_file", type=Path, help="JSONL file with one `Thread` per line."
+    )
+    parser.add_argument(
+        "--output-file",
+        type=Path,
+        default=None,
+        help="Where to write the result lines. Defaults to stdout.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=BATCH_CONCURRENCY,
+        help="Maximum number of threads processed at the same time.",
+    )
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        default=float(os.environ.get("BATCH_REQUESTS_PER_MINUTE", LLM_REQUESTS_PER_MINUTE)),
+        help="Maximum number of LLM requests per minute across the whole batch. 0 disables the limit.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    rate_limiter.set_rate(requests_per_minute=args.requests_per_minute)
+
+    report = asyncio.run(
+        run(
+            input_file=args.input_file,
+            output_file=args.output_file,
+            concurrency=args.concurrency,
+        )
+    )
+    print(
+        f"Processed {report['total']} threads in {report['elapsed_seconds']}s "
+        f"({report['threads_per_second']} threads/s): "
+        f"{report['succeeded']} succeeded, {report['failed']} failed.",
+        file=sys.stderr,
+    )
+    for failure in report["failures"]:
+        print(f"  line {failure['index']}: {failure['error']}", file=sys.stderr)
@@ -0,0 +1,401 @@
+'''
+A script to run offline micro-benchmarks of the components `/chat` is built from.
+
+Every benchmark runs on synthetic data generated with a fixed seed at each requested scale
+(1x, 10x, 100x by default), so results are comparable between commits and machines of the
+same kind. Nothing is sent to the LLM, embedding or Qdrant services.
+
+Results are printed as a table and can be written as JSON. Pass a previous JSON report with
+`--baseline` to fail (exit code 1) when a benchmark got slower than `--max-slowdown` times
+its baseline median.
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+import src.mock_api as mock_api
+import src.models as models
+import src.vectorstore as vectorstore
+from src.conversation import ChatMessage, Conversation, ToolCall
+from create_sqlite_database import build_database
+from src.utils import handle_function_calls, query_product_database
+
+# Size of every synthetic dataset at scale 1.
+BASE_ORDERS = 1000
+BASE_PRODUCTS = 500
+BASE_MESSAGES = 20
+BASE_VECTORS = 1000
+VECTOR_DIMENSION = 64
+
+PRODUCT_QUERIES = {
+    "count": "SELECT COUNT(*) AS n FROM products",
+    "lookup_asin": "SELECT title, price, average_rating FROM products WHERE parent_asin = 'B{asin:09d}'",
+    "top_rated": "SELECT title, average_rating FROM products WHERE rating_number > 100 ORDER BY average_rating DESC LIMIT 10",
+    "price_range": "SELECT title, price FROM products WHERE price BETWEEN 20 AND 25 ORDER BY average_rating DESC LIMIT 10",
+    "by_category": "SELECT p.title, p.price FROM products AS p JOIN product_categories AS c ON c.parent_asin = p.parent_asin WHERE c.category = 'Drums' LIMIT 10",
+    "title_like": "SELECT title, price FROM products WHERE title LIKE '%guitar%' LIMIT 10",
+    "avg_by_category": "SELECT main_category, AVG(average_rating) AS rating FROM products GROUP BY main_category",
+}
+
+
+def make_orders(n_rows: int, rng: np.random.Generator) -> pl.DataFrame:
+    """
+    Generate a synthetic order dataset with the schema of `data/order_data.parquet`.
+
+    Args:
+        n_rows (int): Number of orders.
+        rng (np.random.Generator): Seeded random generator.
+
+    Returns:
+        pl.DataFrame: The orders.
+    """
+    dates = np.datetime64("2018-01-01") + rng.integers(0, 365, n_rows)
+    seconds = rng.integers(0, 24 * 3600, n_rows)
+    sales = rng.uniform(20, 250, n_rows).round(1)
+    return pl.DataFrame(
+        {
+            "Order_Date": dates.astype(str),
+            "Time": [f"{t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d}" for t in seconds],
+            "Aging": rng.integers(1, 11, n_rows).astype(float),
+            "Customer_Id": rng.integers(10000, 10000 + max(n_rows // 5, 1), n_rows),
+            "Gender": rng.choice(["Male", "Female"], n_rows),
+            "Device_Type": rng.choice(["Web", "Mobile"], n_rows),
+            "Customer_Login_type": rng.choice(["Member", "Guest", "New"], n_rows),
+            "Product_Category": rng.choice([c.value for c in mock_api.ProductCategory], n_rows),
+            "Product": rng.choice(["Tyre", "Car Speakers", "Sofa Covers", "T - Shirts", "Watch"], n_rows),
+            "Sales": sales,
+            "Quantity": rng.integers(1, 6, n_rows).astype(float),
+            "Discount": rng.choice([0.1, 0.2, 0.3], n_rows),
+            "Profit": (sales * rng.uniform(0.2, 0.6, n_rows)).round(1),
+            "Shipping_Cost": (sales * 0.05).round(1),
+            "Order_Priority": rng.choice(["Medium", "High", "Critical", "Low", None], n_rows).tolist(),
+            "Payment_method": rng.choice(["credit_card", "money_order", "e_wallet"], n_rows),
+        }
+    )
+
+
+def make_product_database(db_path: Path, n_rows: int, rng: np.random.Generator) -> None:
+    """
+    Generate a synthetic product dataset and build the product database from it, like
+    `scripts/create_sqlite_database.py` does for `data/products_information.db`.
+
+    Args:
+        db_path (Path): Path of the SQLite file to create.
+        n_rows (int): Number of products.
+        rng (np.random.Generator): Seeded random generator.
+    """
+    words = ["guitar", "strings", "drum", "pedal", "cable", "microphone", "stand", "capo", "amp"]
+    products = pl.DataFrame(
+        {
+            "main_category": rng.choice(["Musical Instruments", "Amazon Home", "All Electronics"], n_rows),
+            "title": [" ".join(rng.choice(words, 5)) for _ in range(n_rows)],
+            "average_rating": rng.integers(10, 51, n_rows) / 10,
+            "rating_number": rng.integers(0, 20000, n_rows),
+            "features": [str([" ".join(rng.choice(words, 8)) for _ in range(3)]) for _ in range(n_rows)],
+            "description": [str([" ".join(rng.choice(words, 30))]) for _ in range(n_rows)],
+            "price": [f"{price:.2f}" for price in rng.uniform(5, 300, n_rows)],
+            "store": rng.choice(["Fender", "Ernie Ball", "Elixir", "Shure"], n_rows),
+            "categories": [
+                str(["Musical Instruments", *rng.choice(["Strings", "Drums", "Amplifiers"], 2)])
+                for _ in range(n_rows)
+            ],
+            "details": [
+                json.dumps({"Brand": str(rng.choice(["Fender", "Shure"])), "Item Weight": "1 pound"})
+                for _ in range(n_rows)
+            ],
+            "parent_asin": [f"B{i:09d}" for i in range(n_rows)],
+        }
+    )
+    dataset_path = db_path.with_suffix(".parquet")
+    products.write_parquet(dataset_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_database(str(dataset_path), str(db_path), table_name="products")
+
+
+def make_conversation(n_messages: int) -> dict:
+    """
+    Generate a serialized thread of alternating user and assistant messages.
+    """
+    messages = [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Message {i}: what is the status of my last order of car speakers? " * 3,
+        }
+        for i in range(n_messages + 1 - n_messages % 2)
+    ]
+    return {"id": "benchmark", "messages": messages, "user_id": "benchmark"}
+
+
+def make_vector_index(n_points: int, rng: np.random.Generator):
+    """
+    Generate an in-memory Qdrant collection of random unit vectors.
+
+    Args:
+        n_points (int): Number of points.
+        rng (np.random.Generator): Seeded random generator.
+
+    Returns:
+        QdrantClient: A local client holding the collection.
+    """
+    from qdrant_client import QdrantClient, models as qdrant_models
+
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        collection_name=vectorstore.COLLECTION_NAME,
+        vectors_config=qdrant_models.VectorParams(
+            size=VECTOR_DIMENSION, distance=qdrant_models.Distance.DOT
+        ),
+    )
+    vectors = rng.normal(size=(n_points, VECTOR_DIMENSION)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for start in range(0, n_points, 10000):
+        end = min(start + 10000, n_points)
+        client.upsert(
+            collection_name=vectorstore.COLLECTION_NAME,
+            points=qdrant_models.Batch(
+                ids=list(range(start, end)),
+                payloads=[{"parent_asin": f"B{i // 2:09d}"} for i in range(start, end)],
+                vectors=vectors[start:end].tolist(),
+            ),
+        )
+    return client
+
+
+def measure(fn, repeat: int) -> dict:
+    """
+    Call `fn` once to warm up, then `repeat` times, and summarize the durations in milliseconds.
+    """
+    fn()
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start_time) * 1000)
+    durations.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": durations[0],
+        "median_ms": statistics.median(durations),
+        "p95_ms": durations[min(len(durations) - 1, round(0.95 * (len(durations) - 1)))],
+        "mean_ms": statistics.fmean(durations),
+    }
+
+
+def build_benchmarks(scale: int, workdir: Path, seed: int) -> dict:
+    """
+    Generate the synthetic datasets of one scale and return the benchmarks to run on them.
+
+    Args:
+        scale (int): Multiplier applied to every base dataset size.
+        workdir (Path): Directory for the generated files.
+        seed (int): Seed of the random generators.
+
+    Returns:
+        dict: Benchmark name mapped to a function without arguments.
+    """
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+
+    orders = make_orders(BASE_ORDERS * scale, rng)
+    orders_path = workdir / f"orders_{scale}x.parquet"
+    orders.write_parquet(orders_path)
+    mock_api.DATASET_PATH = str(orders_path)
+    if mock_api.ORDER_DATA_MODE == "mmap":
+        mock_api.ORDER_SNAPSHOT_PATH = str(workdir / f"orders_{scale}x.arrow")
+        mock_api.publish_order_snapshot(mock_api.DATASET_PATH, mock_api.ORDER_SNAPSHOT_PATH)
+    mock_api.reload_order_data()
+    customer_id = int(orders["Customer_Id"][0])
+
+    db_path = workdir / f"products_{scale}x.db"
+    n_products = BASE_PRODUCTS * scale
+    make_product_database(db_path, n_products, rng)
+    asin = int(rng.integers(0, n_products))
+
+    conversation = make_conversation(BASE_MESSAGES * scale)
+
+    tool_rows = orders.head(20 * scale).to_dicts()
+    tool_response = ChatMessage(
+        role="assistant",
+        content=None,
+        tool_calls=(
+            ToolCall(
+                id="call_0",
+                name="get_customer_data",
+                arguments=json.dumps({"customer_id": customer_id}),
+            ),
+        ),
+    )
+
+    def run_tool_call():
+        # `handle_function_calls` prints the arguments of every call.
+        with contextlib.redirect_stdout(io.StringIO()):
+            handle_function_calls(
+                function_map={"get_customer_data": lambda customer_id: tool_rows},
+                response_message=tool_response,
+                messages=[],
+            )
+
+    # Point the retrieval code at the synthetic index instead of the Qdrant server.
+    qdrant_client = make_vector_index(BASE_VECTORS * scale, rng)
+    vectorstore.get_qdrant_client = lambda: qdrant_client
+    query_vector = rng.normal(size=VECTOR_DIMENSION).astype(np.float32).tolist()
+
+    benchmarks = {
+        "mock_api.get_all_data": mock_api.get_all_data,
+        "mock_api.get_customer_data": lambda: mock_api.get_customer_data(customer_id),
+        "mock_api.get_product_category_data": lambda: mock_api.get_product_category_data(
+            mock_api.ProductCategory.fashion
+        ),
+        "mock_api.get_orders_by_priority": lambda: mock_api.get_orders_by_priority(
+            "High", sort_by_date=True, sort_descendingly=True, limit=10
+        ),
+        "mock_api.get_total_sales_by_category": mock_api.get_total_sales_by_category,
+        "mock_api.get_high_profit_products": lambda: mock_api.get_high_profit_products(100.0),
+        "mock_api.get_shipping_cost_summary": mock_api.get_shipping_cost_summary,
+        "mock_api.get_profit_by_gender": mock_api.get_profit_by_gender,
+    }
+    for name, sql_query in PRODUCT_QUERIES.items():
+        sql_query = sql_query.format(asin=asin)
+        benchmarks[f"query_product_database.{name}"] = (
+            lambda sql_query=sql_query: query_product_database(sql_query, db_url=str(db_path))
+        )
+    benchmarks["models.Thread.validate"] = lambda: models.Thread.model_validate(conversation)
+    thread = models.Thread.model_validate(conversation)
+    benchmarks["conversation.Conversation.from_thread"] = lambda: Conversation.from_thread(
+        thread, "system"
+    )
+    benchmarks["utils.handle_function_calls"] = run_tool_call
+    benchmarks["vectorstore.select_product_asins"] = lambda: vectorstore.select_product_asins(
+        query_vector, mmr_lambda=None
+    )
+    benchmarks["vectorstore.select_product_asins.mmr"] = lambda: vectorstore.select_product_asins(
+        query_vector, mmr_lambda=0.5
+    )
+    return benchmarks
+
+
+def compare(results: list[dict], baseline_file: Path, max_slowdown: float) -> list[str]:
+    """
+    Return a description of every benchmark whose median is more than `max_slowdown` times
+    its median in the baseline report.
+    """
+    baseline = {
+        (result["name"], result["scale"]): result
+        for result in json.loads(baseline_file.read_text())["results"]
+    }
+    regressions = []
+    for result in results:
+        reference = baseline.get((result["name"], result["scale"]))
+        if reference and result["median_ms"] > max_slowdown * reference["median_ms"]:
+            regressions.append(
+                f"{result['name']} @ {result['scale']}x: {reference['median_ms']:.3f} ms -> {result['median_ms']:.3f} ms"
+            )
+    return regressions
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for running the benchmarks.
+
+    Returns:
+        args: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Run offline micro-benchmarks of the chat components."
+    )
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100],
+        help="Dataset size multipliers to benchmark.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=20,
+        help="Number of timed runs per benchmark and scale.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the synthetic data.",
+    )
+    parser.add_argument(
+        "--only",
+        type=str,
+        default=None,
+        help="Only run the benchmarks whose name contains this string.",
+    )
+    parser.add_argument(
+        "--output-file",
+        type=Path,
+        default=None,
+        help="Write the results as JSON to this file.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help="JSON results of a previous run to compare against.",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.25,
+        help="Maximum allowed ratio of median to baseline median.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scales:
+            benchmarks = build_benchmarks(scale, Path(workdir), args.seed)
+            for name, fn in benchmarks.items():
+                if args.only and args.only not in name:
+                    continue
+                result = {"name": name, "scale": scale, **measure(fn, args.repeat)}
+                results.append(result)
+                print(
+                    f"{name:<45} {scale:>4}x  median {result['median_ms']:10.3f} ms"
+                    f"  p95 {result['p95_ms']:10.3f} ms"
+                )
+
+    report = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "polars": pl.__version__,
+            "order_data_mode": mock_api.ORDER_DATA_MODE,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.output_file:
+        args.output_file.write_text(json.dumps(report, indent=2))
+        print(f"Results written to '{args.output_file}'.")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_slowdown)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
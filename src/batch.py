@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterable
+
+import src.models as models
+from src.llm import complete_thread
+from src.scheduler import get_scheduler
+from src.utils import create_logger
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "64"))
+
+logger = create_logger(logger_name="batch", log_file="api.log", log_level="info")
+
+
+@dataclass
+class BatchReport:
+    """
+    Summary of a batch run.
+
+    Attributes:
+        total (int): Number of input lines processed.
+        succeeded (int): Number of threads answered successfully.
+        failed (int): Number of lines that failed to parse or to run.
+        elapsed_seconds (float): Wall-clock duration of the run.
+        failures (list[dict]): Index and error message of every failed line.
+    """
+
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list, repr=False)
+    failures: list[dict] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "type": "report",
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "threads_per_second": (
+                round(self.total / self.elapsed_seconds, 3)
+                if self.elapsed_seconds
+                else 0.0
+            ),
+            "p50_latency_seconds": _percentile(latencies, 0.50),
+            "p95_latency_seconds": _percentile(latencies, 0.95),
+            "failures": self.failures,
+        }
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float | None:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return round(sorted_values[index], 3)
+
+
+async def _run_line(index: int, line: str) -> dict:
+    """
+    Parse one JSONL line into a `Thread` and run the chat loop on it in a worker thread.
+    """
+    start_time = time.perf_counter()
+    try:
+        thread = models.Thread.model_validate_json(line)
+        async with get_scheduler().slot(thread.user_id, lane="batch"):
+            response = await asyncio.to_thread(complete_thread, thread)
+        return {
+            "type": "result",
+            "index": index,
+            "status": "ok",
+            "latency_seconds": round(time.perf_counter() - start_time, 3),
+            "thread": response.model_dump(),
+        }
+    except Exception as e:
+        logger.error(f"Batch line {index} failed: {traceback.format_exc()}")
+        return {
+            "type": "result",
+            "index": index,
+            "status": "error",
+            "latency_seconds": round(time.perf_counter() - start_time, 3),
+            "error": f"{type(e).__name__}: {e}",
+        }
+
+
+async def stream_batch(
+    lines: Iterable[str], concurrency: int = BATCH_CONCURRENCY
+) -> AsyncIterator[dict]:
+    """
+    Run every thread of a JSONL batch with bounded concurrency and yield the results as they finish.
+
+    LLM calls made by the batch go through the process-wide rate limiter in `src.llm`,
+    so a batch can't exceed the provider's limits, and every thread waits for a slot in the
+    batch lane of the scheduler (`src.scheduler`), behind interactive chats.
+
+    Args:
+        lines (Iterable[str]): JSONL lines, each one a serialized `Thread`. Blank lines are skipped.
+        concurrency (int): Maximum number of threads processed at the same time.
+
+    Yields:
+        dict: One `result` record per input line, in completion order, followed by a final `report` record.
+    """
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    pending = ((i, line) for i, line in enumerate(lines) if line.strip())
+    results: asyncio.Queue = asyncio.Queue()
+    report = BatchReport()
+    start_time = time.perf_counter()
+
+    async def worker():
+        # Workers share one generator, so at most `concurrency` lines are in flight.
+        for index, line in pending:
+            await results.put(await _run_line(index, line))
+
+    async def run_workers():
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            await results.put(None)
+
+    runner = asyncio.create_task(run_workers())
+    try:
+        while (result := await results.get()) is not None:
+            report.total += 1
+            report.latencies.append(result["latency_seconds"])
+            if result["status"] == "ok":
+                report.succeeded += 1
+            else:
+                report.failed += 1
+                report.failures.append(
+                    {"index": result["index"], "error": result["error"]}
+                )
+            yield result
+        await runner
+    finally:
+        runner.cancel()
+
+    report.elapsed_seconds = time.perf_counter() - start_time
+    logger.info(f"Batch finished: {json.dumps(report.to_dict())}")
+    yield report.to_dict()
@@ -0,0 +1,125 @@
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable
+
+import src.metrics as metrics
+from src.singleflight import SingleFlight
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries optionally expire after a fixed time-to-live.
+
+    Hits and misses are counted in `src.metrics` under "cache.<name>.hits" and "cache.<name>.misses".
+
+    Attributes:
+        name (str): Name used for the metrics of this cache.
+        maxsize (int): Maximum number of entries; the least recently used entry is evicted first.
+        ttl (float | None): Seconds after which an entry expires. None keeps entries until evicted.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float | None = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the cached value for `key`, or `default` if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    metrics.increment(f"cache.{self.name}.hits")
+                    return value
+                del self._entries[key]
+        metrics.increment(f"cache.{self.name}.misses")
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Store `value` under `key`, evicting the least recently used entries if the cache is full.
+        """
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass(frozen=True)
+class MemoizePolicy:
+    """
+    How the results of a deterministic function are memoized (see `memoize`).
+
+    Attributes:
+        version (Callable[[], Hashable]): Returns the version of the data the function reads;
+                                          results of older versions are never returned.
+        maxsize (int): Maximum number of memoized results.
+        ttl (float | None): Seconds after which a result expires. None keeps results until evicted.
+    """
+
+    version: Callable[[], Hashable]
+    maxsize: int
+    ttl: float | None = None
+
+
+def canonical_arguments(kwargs: dict) -> str:
+    """
+    Serialize keyword arguments as canonical JSON, so that equal arguments give equal keys.
+    """
+    return json.dumps(kwargs, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def memoize(name: str, fn: Callable, policy: MemoizePolicy) -> Callable:
+    """
+    Wrap `fn` so that its results are cached per keyword arguments and data version.
+
+    Concurrent calls with the same key are coalesced, exceptions are not cached, and
+    memoized results are shared between callers, so they must not be mutated.
+
+    Args:
+        name (str): Name of the cache in `src.metrics` ("cache.<name>.hits" / ".misses").
+        fn (Callable): The function to memoize. It must be called with keyword arguments only.
+        policy (MemoizePolicy): The versioning, size and TTL of the cache.
+
+    Returns:
+        Callable: The memoized function.
+    """
+    results = TTLCache(name=name, maxsize=policy.maxsize, ttl=policy.ttl)
+    flight = SingleFlight(name=name)
+
+    @functools.wraps(fn)
+    def wrapper(**kwargs):
+        key = (policy.version(), canonical_arguments(kwargs))
+        result = results.get(key, _MISSING)
+        if result is _MISSING:
+            result = flight.do(key, fn, **kwargs)
+            results.set(key, result)
+        return result
+
+    return wrapper
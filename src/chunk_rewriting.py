@@ -111,6 +111,7 @@ def process_database():
 
     # Close the database connection
     conn.close()
+    print("Run `scripts/create_sqlite_database.py` to put the new descriptions in the product cards.")
 
 if __name__ == "__main__":
     process_database()
\ No newline at end of file
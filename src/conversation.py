@@ -0,0 +1,151 @@
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Literal
+
+import src.models as models
+
+
+@dataclass(slots=True, frozen=True)
+class ToolCall:
+    """
+    A function call requested by the LLM.
+
+    Attributes:
+        id (str): Identifier the result of the call must refer to.
+        name (str): Name of the function to call.
+        arguments (str): The arguments, as a JSON object.
+    """
+
+    id: str
+    name: str
+    arguments: str
+
+
+@dataclass(slots=True)
+class ChatMessage:
+    """
+    A message of the agent loop's conversation: a user or assistant message, an assistant
+    message requesting tool calls, or the result of a tool call.
+
+    Its chat completions representation is built once, when the message is created.
+
+    Attributes:
+        role (Literal["user", "assistant", "tool"]): The role of the message sender.
+        content (str | None): The content of the message. None for assistant messages
+                              that only request tool calls.
+        tool_calls (tuple[ToolCall, ...]): The tool calls requested by an assistant message.
+        tool_call_id (str | None): For tool results, the id of the call they answer.
+        name (str | None): For tool results, the name of the function that was called.
+        wire (dict): The message as sent to the chat completions API.
+    """
+
+    role: Literal["user", "assistant", "tool"]
+    content: str | None
+    tool_calls: tuple[ToolCall, ...] = ()
+    tool_call_id: str | None = None
+    name: str | None = None
+    wire: dict = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        wire: dict[str, Any] = {"role": self.role, "content": self.content}
+        if self.tool_calls:
+            wire["tool_calls"] = [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {"name": tool_call.name, "arguments": tool_call.arguments},
+                }
+                for tool_call in self.tool_calls
+            ]
+        if self.role == "tool":
+            wire["tool_call_id"] = self.tool_call_id
+            wire["name"] = self.name
+        self.wire = wire
+
+    @classmethod
+    def from_completion(cls, message) -> "ChatMessage":
+        """
+        Convert a message returned by the chat completions API.
+
+        Args:
+            message (ChatCompletionMessage): The message of a completion choice.
+
+        Returns:
+            ChatMessage: The assistant message, with its tool calls.
+        """
+        return cls(
+            role=message.role,
+            content=message.content,
+            tool_calls=tuple(
+                ToolCall(
+                    id=tool_call.id,
+                    name=tool_call.function.name,
+                    arguments=tool_call.function.arguments,
+                )
+                for tool_call in message.tool_calls or ()
+            ),
+        )
+
+    @classmethod
+    def tool_result(cls, tool_call: ToolCall, content: str) -> "ChatMessage":
+        """
+        Build the message answering a tool call.
+
+        Args:
+            tool_call (ToolCall): The call that was run.
+            content (str): The result of the call.
+
+        Returns:
+            ChatMessage: The tool message.
+        """
+        return cls(
+            role="tool", content=content, tool_call_id=tool_call.id, name=tool_call.name
+        )
+
+
+class Conversation:
+    """
+    The messages exchanged by the agent loop for one chat request, with the system message.
+
+    `wire` is the list of messages sent to the chat completions API. It is extended in place as
+    messages are appended, so every completion only adds the new messages instead of validating
+    and serializing the whole conversation again.
+
+    Attributes:
+        messages (list[ChatMessage]): The conversation, without the system message.
+        wire (list[dict]): The system message followed by the `wire` of every message.
+    """
+
+    __slots__ = ("messages", "wire")
+
+    def __init__(self, system_message: str, messages: Iterable[ChatMessage] = ()):
+        self.messages: list[ChatMessage] = []
+        self.wire: list[dict] = [{"role": "system", "content": system_message}]
+        for message in messages:
+            self.append(message)
+
+    @classmethod
+    def from_thread(cls, thread: models.Thread, system_message: str) -> "Conversation":
+        """
+        Start the conversation of a chat request from the thread sent by the user.
+
+        Args:
+            thread (models.Thread): The validated thread.
+            system_message (str): The system message to start the conversation with.
+
+        Returns:
+            Conversation: The conversation.
+        """
+        return cls(
+            system_message,
+            (ChatMessage(role=message.role, content=message.content) for message in thread.messages),
+        )
+
+    def append(self, message: ChatMessage) -> None:
+        """
+        Append a message to the conversation.
+        """
+        self.messages.append(message)
+        self.wire.append(message.wire)
+
+    def __len__(self) -> int:
+        return len(self.messages)
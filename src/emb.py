@@ -1,47 +1,288 @@
 import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache
 
-import openai
-
+import src.metrics as metrics
 from src.utils import create_logger, log_execution_time
 
 EMBEDDING_URL = os.environ.get("EMBEDDING_URL", "https://api.jina.ai/v1")
 EMBEDDING_API_KEY = os.environ.get("EMBEDDING_API_KEY", "dumb_key")
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "jina-embeddings-v3")
 EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "16"))
+# Batches are also capped by their estimated token count, so long texts get smaller batches.
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", "8192"))
+# Number of batches sent to the embedding service at the same time.
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", "4"))
+# Rate limited (429) and server error (5xx) responses are retried with jittered exponential backoff.
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_BACKOFF_SECONDS = float(os.environ.get("EMBEDDING_BACKOFF_SECONDS", "0.5"))
+EMBEDDING_MAX_BACKOFF_SECONDS = float(os.environ.get("EMBEDDING_MAX_BACKOFF_SECONDS", "30"))
+# Whether to send the `task` (e.g. "retrieval.query") to the provider. Jina's API uses it to
+# pick a task-specific adapter, other OpenAI-compatible APIs may reject unknown fields.
+EMBEDDING_SEND_TASK = os.environ.get(
+    "EMBEDDING_SEND_TASK", str("jina" in EMBEDDING_URL or "jina" in EMBEDDING_MODEL)
+).lower() == "true"
+# Rough number of characters per token, used to estimate the size of a batch.
+CHARS_PER_TOKEN = 4
+# Concurrent `embed_query` calls are collected for up to this many milliseconds (or until
+# EMBEDDING_QUERY_BATCH_SIZE queries are waiting) and embedded in one request; 0 disables it.
+EMBEDDING_BATCH_WAIT_MS = float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_QUERY_BATCH_SIZE = int(os.environ.get("EMBEDDING_QUERY_BATCH_SIZE", "32"))
+# Seconds a caller of the batcher waits for its embedding, retries included.
+EMBEDDING_QUERY_TIMEOUT_SECONDS = float(os.environ.get("EMBEDDING_QUERY_TIMEOUT_SECONDS", "60"))
 
 
 logger = create_logger(logger_name="embedding", log_file="api.log", log_level="info")
 
 
+@cache
+def get_embedding_client():
+    """
+    Return the shared embedding client. The OpenAI package is imported on first use.
+    """
+    import openai
+
+    # Retries are handled by `embed_batch`, with backoff suited to large ingestion jobs.
+    return openai.OpenAI(base_url=EMBEDDING_URL, api_key=EMBEDDING_API_KEY, max_retries=0)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the number of tokens of a text, without loading a tokenizer.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def plan_batches(
+    texts: list[str], batch_size: int, max_tokens: int = EMBEDDING_BATCH_TOKENS
+) -> list[tuple[int, int]]:
+    """
+    Split texts into consecutive batches of at most `batch_size` texts and about `max_tokens` tokens.
+
+    A text longer than `max_tokens` gets a batch of its own.
+
+    Args:
+        texts (list[str]): The texts to embed.
+        batch_size (int): Maximum number of texts per batch.
+        max_tokens (int): Maximum estimated number of tokens per batch.
+
+    Returns:
+        list[tuple[int, int]]: The start and end index of every batch.
+    """
+    batches = []
+    start, batch_tokens = 0, 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if i > start and (i - start >= batch_size or batch_tokens + tokens > max_tokens):
+            batches.append((start, i))
+            start, batch_tokens = i, 0
+        batch_tokens += tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Return whether a failed embedding request is worth retrying (rate limits, server errors
+    and connection problems).
+    """
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, openai.APIConnectionError)
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Return how long to wait before retrying: the server's Retry-After if it sent one,
+    otherwise a full-jitter exponential backoff.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(retry_after), EMBEDDING_MAX_BACKOFF_SECONDS)
+    except (TypeError, ValueError):
+        return random.uniform(
+            0, min(EMBEDDING_MAX_BACKOFF_SECONDS, EMBEDDING_BACKOFF_SECONDS * 2**attempt)
+        )
+
+
+def embed_batch(texts: list[str], task: str = None) -> list[list[float]]:
+    """
+    Embed one batch of texts, retrying transient failures.
+
+    Args:
+        texts (list[str]): The texts of the batch.
+        task (str, optional): Specific task the embeddings are intended for. Defaults to None.
+
+    Returns:
+        list[list[float]]: One embedding per text.
+
+    Raises:
+        openai.OpenAIError: If the request fails with a non-retryable error or runs out of retries.
+        ValueError: If the response doesn't have one embedding per text.
+    """
+    extra_body = {"task": task} if task and EMBEDDING_SEND_TASK else None
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        try:
+            response = get_embedding_client().embeddings.create(
+                input=texts, model=EMBEDDING_MODEL, extra_body=extra_body
+            )
+            metrics.increment("embedding.batches")
+            if len(response.data) != len(texts):
+                raise ValueError(
+                    f"The embedding service returned {len(response.data)} embeddings for {len(texts)} texts."
+                )
+            return [x.embedding for x in response.data]
+        except Exception as e:
+            if attempt == EMBEDDING_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            metrics.increment("embedding.retries")
+            logger.warning(
+                f"Embedding request failed ({e}), retry {attempt + 1}/{EMBEDDING_MAX_RETRIES} in {delay:.2f}s"
+            )
+            time.sleep(delay)
+
+
 def batch_embed(
-    texts: list[str], task: str = None, batch_size: int = EMBEDDING_BATCH_SIZE
+    texts: list[str],
+    task: str = None,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    concurrency: int = EMBEDDING_CONCURRENCY,
 ) -> list[list[float]]:
     """
     Generate embeddings for a batch of text strings.
 
+    The texts are split by count and estimated token length (see `plan_batches`) and up to
+    `concurrency` batches are embedded at the same time. Embeddings keep the order of `texts`.
+
     Args:
         texts (list[str]): A list of text strings to be embedded.
         task (str, optional): Specific task the embeddings are intended for. Defaults to None.
-        batch_size (int, optional): The number of text strings to process in each batch. Defaults to EMBEDDING_BATCH_SIZE.
+        batch_size (int, optional): The maximum number of text strings in each batch. Defaults to EMBEDDING_BATCH_SIZE.
+        concurrency (int, optional): The maximum number of batches in flight. Defaults to EMBEDDING_CONCURRENCY.
 
     Returns:
         list[list[float]]: A list of embeddings, where each embedding corresponds to a text string and consists of a list of floats.
     """
-    embedding_client = openai.OpenAI(base_url=EMBEDDING_URL, api_key=EMBEDDING_API_KEY)
+    batches = plan_batches(texts, batch_size=batch_size)
+    if len(batches) <= 1 or concurrency <= 1:
+        batch_results = [embed_batch(texts[start:end], task=task) for start, end in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as executor:
+            batch_results = list(
+                executor.map(
+                    lambda batch: embed_batch(texts[batch[0] : batch[1]], task=task),
+                    batches,
+                )
+            )
 
     result = []
+    for embeddings in batch_results:
+        result.extend(embeddings)
+    return result
+
+
+class EmbeddingBatcher:
+    """
+    Groups texts submitted by concurrent callers into shared embedding requests.
+
+    A collector thread waits for the first text, keeps collecting for `max_wait_ms`
+    milliseconds or until `max_batch_size` texts are waiting, then embeds the texts on
+    a small thread pool, in requests of at most `max_batch_tokens` estimated tokens (see
+    `plan_batches`), and hands every embedding back to its caller.
+    """
 
-    # Process texts in batches
-    for i in range(0, len(texts), batch_size):
-        batch_input = texts[i : i + batch_size]
-        response = embedding_client.embeddings.create(
-            input=batch_input, model=EMBEDDING_MODEL
+    def __init__(
+        self,
+        max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS,
+        max_batch_size: int = EMBEDDING_QUERY_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+    ):
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self._pending: queue.SimpleQueue[tuple[str, str | None, Future]] = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(concurrency, 1), thread_name_prefix="embedding-batch"
+        )
+        self._collector = threading.Thread(
+            target=self._collect, name="embedding-batcher", daemon=True
         )
+        self._collector.start()
 
-        # Extract and accumulate embeddings from the response.
-        result.extend(x.embedding for x in response.data)
+    def embed(
+        self, text: str, task: str = None, timeout: float = EMBEDDING_QUERY_TIMEOUT_SECONDS
+    ) -> list[float]:
+        """
+        Embed one text as part of the next batch and wait for its embedding.
 
-    return result
+        Args:
+            text (str): The text to embed.
+            task (str, optional): Specific task the embedding is intended for. Defaults to None.
+            timeout (float, optional): Seconds to wait for the embedding. Defaults to
+                                       EMBEDDING_QUERY_TIMEOUT_SECONDS.
+
+        Returns:
+            list[float]: The embedding of `text`.
+
+        Raises:
+            TimeoutError: If the embedding isn't ready within `timeout` seconds.
+            Exception: The error of the embedding request.
+        """
+        future = Future()
+        self._pending.put((text, task, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            # A request carries a single task, so texts of different tasks go out separately.
+            by_task: dict[str | None, list] = {}
+            for item in batch:
+                by_task.setdefault(item[1], []).append(item)
+            for task, items in by_task.items():
+                texts = [text for text, _, _ in items]
+                for start, end in plan_batches(
+                    texts, batch_size=self.max_batch_size, max_tokens=self.max_batch_tokens
+                ):
+                    self._executor.submit(self._embed_items, task, items[start:end])
+
+    def _embed_items(self, task: str | None, items: list[tuple[str, str | None, Future]]):
+        metrics.observe("embedding.query_batch_size", len(items))
+        try:
+            embeddings = embed_batch([text for text, _, _ in items], task=task)
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        for (_, _, future), embedding in zip(items, embeddings, strict=True):
+            future.set_result(embedding)
+
+
+@cache
+def get_query_batcher() -> EmbeddingBatcher:
+    """
+    Return the process-wide batcher of query embeddings, starting it on first use.
+    """
+    return EmbeddingBatcher()
 
 
 @log_execution_time(logger=logger)
@@ -63,11 +304,16 @@ def embed_query(query: str) -> list[float]:
     """
     Generate an embedding for a single query string.
 
+    Unless `EMBEDDING_BATCH_WAIT_MS` is 0, the query is embedded together with the queries
+    of concurrent requests (see `EmbeddingBatcher`).
+
     Args:
         query (str): The query text to be embedded.
 
     Returns:
         list[float]: The embedding for the query, represented as a list of floats.
     """
+    if EMBEDDING_BATCH_WAIT_MS > 0:
+        return get_query_batcher().embed(query, task="retrieval.query")
     batch_embeddings = batch_embed(texts=[query], task="retrieval.query")
     return batch_embeddings[0]
@@ -0,0 +1,108 @@
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.emb import EMBEDDING_MODEL
+
+if TYPE_CHECKING:
+    import polars as pl
+    from qdrant_client import QdrantClient
+
+# An embedding snapshot is a directory with `vectors.npy` (float32, one row per point),
+# `points.parquet` (point id, parent_asin and JSON payload, in the same order) and
+# `manifest.json`, written last. See `scripts/ingest_embeddings.py --export-snapshot`.
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def read_snapshot(
+    snapshot_dir: Path, embedding_dimension: int | None = None
+) -> tuple[dict, np.ndarray, "pl.DataFrame"]:
+    """
+    Read an embedding snapshot, checking that it can serve the configured embedding model.
+
+    Args:
+        snapshot_dir (Path): The snapshot directory.
+        embedding_dimension (int | None): The expected dimension of the vectors, if known.
+
+    Returns:
+        tuple[dict, np.ndarray, pl.DataFrame]: The manifest, the vectors (memory-mapped)
+                                               and the points.
+
+    Raises:
+        ValueError: If the snapshot is incomplete or doesn't match the format, embedding
+                    model or dimension, since query embeddings wouldn't match its vectors.
+    """
+    import polars as pl
+
+    snapshot_dir = Path(snapshot_dir)
+    manifest = json.loads((snapshot_dir / "manifest.json").read_text())
+    if manifest["format_version"] != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version {manifest['format_version']}.")
+    if manifest["model"] != EMBEDDING_MODEL or (
+        embedding_dimension is not None and manifest["dimension"] != embedding_dimension
+    ):
+        raise ValueError(
+            f"The snapshot was made with {manifest['model']} ({manifest['dimension']} dimensions), "
+            f"but {EMBEDDING_MODEL} ({embedding_dimension or 'any'} dimensions) is configured."
+        )
+
+    vectors = np.load(snapshot_dir / "vectors.npy", mmap_mode="r")
+    points = pl.read_parquet(snapshot_dir / "points.parquet")
+    if not len(points) == len(vectors) == manifest["count"]:
+        raise ValueError("The snapshot is incomplete: its files don't have the same number of points.")
+    return manifest, vectors, points
+
+
+def upload_snapshot(
+    client: "QdrantClient",
+    collection_name: str,
+    vectors: np.ndarray,
+    points: "pl.DataFrame",
+    batch_size: int = 1000,
+) -> None:
+    """
+    Upload the points of a snapshot into an existing collection.
+
+    Args:
+        client (QdrantClient): Client of the Qdrant instance to load.
+        collection_name (str): Name of the collection.
+        vectors (np.ndarray): The vectors of the snapshot.
+        points (pl.DataFrame): The points of the snapshot.
+        batch_size (int): Number of points uploaded per request.
+    """
+    client.upload_collection(
+        collection_name=collection_name,
+        vectors=vectors,
+        payload=(json.loads(payload) for payload in points["payload"]),
+        ids=points["id"].to_list(),
+        batch_size=batch_size,
+        wait=True,
+    )
+
+
+def load_in_memory_index(snapshot_dir: Path, collection_name: str) -> "QdrantClient":
+    """
+    Load a snapshot into an in-memory (embedded) Qdrant index, to search products without a
+    Qdrant server. Every worker process keeps its own copy of the vectors.
+
+    Args:
+        snapshot_dir (Path): The snapshot directory.
+        collection_name (str): Name of the collection to create.
+
+    Returns:
+        QdrantClient: The client of the in-memory index.
+    """
+    from qdrant_client import QdrantClient, models
+
+    manifest, vectors, points = read_snapshot(snapshot_dir)
+    client = QdrantClient(location=":memory:")
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(
+            size=manifest["dimension"], distance=models.Distance.DOT
+        ),
+    )
+    upload_snapshot(client, collection_name, vectors, points)
+    return client
@@ -1,8 +1,12 @@
+import itertools
 import os
+import time
+from functools import cache
 
-from langfuse.openai import openai
-
+import src.metrics as metrics
 import src.models as models
+from src.conversation import ChatMessage, Conversation
+from src.emb import is_retryable, retry_delay
 from src.prompts import (
     ORDER_SYSTEM_MESSAGE,
 )
@@ -12,10 +16,18 @@ from src.tools import (
     order_dataset_tools,
     product_dataset_tools,
 )
-from src.utils import create_logger, handle_function_calls, log_execution_time
+from src.utils import (
+    RateLimiter,
+    create_logger,
+    handle_function_calls,
+    log_execution_time,
+)
+from src.vectorstore import finish_speculative_retrieval, start_speculative_retrieval
 
 TEMPERATURE = 0
 MAX_COMPLETION_TOKENS = 2048
+# Shared by every chat and batch request in the process; 0 disables the limit.
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "0"))
 
 logger = create_logger(logger_name="llm", log_file="api.log", log_level="info")
 
@@ -24,7 +36,25 @@ if not model:
     logger.error("CHAT_MODEL environment variable is not set.")
     raise ValueError("CHAT_MODEL environment variable is not set.")
 
-client = openai.OpenAI()
+rate_limiter = RateLimiter(requests_per_minute=LLM_REQUESTS_PER_MINUTE)
+
+# Budget of a chat request, unless the thread sets its own. Once it is used up, no more tools
+# are run and the model has to answer with what it has. The deadline is hard: tools stop
+# AGENT_FINAL_ANSWER_SECONDS (at most half the budget) before it, to leave time for the final
+# answer, and the request fails with `DeadlineExceededError` if a completion runs past it.
+AGENT_MAX_TOOL_ITERATIONS = int(os.environ.get("AGENT_MAX_TOOL_ITERATIONS", "6"))
+AGENT_DEADLINE_SECONDS = float(os.environ.get("AGENT_DEADLINE_SECONDS", "60"))
+AGENT_FINAL_ANSWER_SECONDS = float(os.environ.get("AGENT_FINAL_ANSWER_SECONDS", "10"))
+BUDGET_EXHAUSTED_MESSAGE = (
+    "Not run: the time or tool budget of this request is used up. "
+    "Answer the user with the information gathered so far."
+)
+
+
+class DeadlineExceededError(TimeoutError):
+    """
+    Exception raised when a chat request runs out of time before the LLM has answered.
+    """
 
 
 @log_execution_time(logger=logger)
@@ -32,6 +62,11 @@ def handle_user_chat(thread: models.Thread) -> models.Message:
     """
     Process a user's chat thread and generate a response using language model tools.
 
+    The request has a hard time budget (AGENT_DEADLINE_SECONDS, or `thread.deadline_seconds` if lower):
+    every completion is sent with the time left as its timeout, and tool calls still running
+    `AGENT_FINAL_ANSWER_SECONDS` before the deadline are answered with a timeout message, so
+    that the model can give a final answer in the remaining time.
+
     Args:
         thread (models.Thread): The conversation thread containing user messages.
 
@@ -40,25 +75,75 @@ def handle_user_chat(thread: models.Thread) -> models.Message:
 
     Raises:
         DirectReturnException: If the LLM flow needs to be returned directly to the user.
+        DeadlineExceededError: If a completion doesn't return before the deadline.
         Exception: For any errors during generating responses.
     """
-    input_messages = thread.messages
+    conversation = Conversation.from_thread(thread, ORDER_SYSTEM_MESSAGE)
+    # A thread can only tighten the server's budget, never extend it.
+    max_tool_iterations = (
+        AGENT_MAX_TOOL_ITERATIONS
+        if thread.max_tool_iterations is None
+        else min(thread.max_tool_iterations, AGENT_MAX_TOOL_ITERATIONS)
+    )
+    deadline_seconds = min(
+        thread.deadline_seconds or AGENT_DEADLINE_SECONDS, AGENT_DEADLINE_SECONDS
+    )
+    started_at = time.monotonic()
+    deadline = started_at + deadline_seconds
+    tools_deadline = deadline - min(AGENT_FINAL_ANSWER_SECONDS, deadline_seconds / 2)
+    tool_iterations = 0
+    # Product questions usually end up in `retrieve_relevant_products`; with
+    # SPECULATIVE_RETRIEVAL enabled, search for the user's message in the meantime.
+    speculation_token = start_speculative_retrieval(thread.messages[-1].content)
     try:
         while True:
             # Generate initial completion
             response = create_completion(
-                thread=thread, tools=order_dataset_tools + product_dataset_tools
+                conversation=conversation,
+                session_id=thread.id,
+                tools=order_dataset_tools + product_dataset_tools,
+                deadline=deadline,
             )
-            thread.messages.append(response)
+            conversation.append(response)
 
             if not response.tool_calls:
                 break
-            thread.messages = handle_function_calls(
-                function_map=llm_tools_map,
-                response_message=response,
-                messages=thread.messages,
+
+            if tool_iterations >= max_tool_iterations:
+                exhausted = "iterations"
+            elif time.monotonic() >= tools_deadline:
+                exhausted = "deadline"
+            else:
+                handle_function_calls(
+                    function_map=llm_tools_map,
+                    response_message=response,
+                    messages=conversation,
+                    deadline=tools_deadline,
+                )
+                tool_iterations += 1
+                continue
+
+            # Out of budget: answer the pending tool calls without running them and
+            # force a final answer.
+            logger.info(f"Chat budget exhausted ({exhausted}), forcing a final answer.")
+            metrics.increment(f"agent.budget_exhausted.{exhausted}")
+            for tool_call in response.tool_calls:
+                conversation.append(
+                    ChatMessage.tool_result(tool_call, BUDGET_EXHAUSTED_MESSAGE)
+                )
+            response = create_completion(
+                conversation=conversation,
+                session_id=thread.id,
+                tools=order_dataset_tools + product_dataset_tools,
+                tool_choice="none",
+                deadline=deadline,
             )
+            conversation.append(response)
+            break
 
+        elapsed = time.monotonic() - started_at
+        metrics.observe("agent.tool_iterations", tool_iterations)
+        metrics.observe("agent.deadline_used", elapsed / deadline_seconds)
         return models.Message(role=response.role, content=response.content)
 
     except DirectReturnException as e:
@@ -66,52 +151,140 @@ def handle_user_chat(thread: models.Thread) -> models.Message:
         raise
     except Exception as e:
         logger.error(
-            f"Error generating responses for chat:\n'{input_messages}'\n\nError:\n{e}"
+            f"Error generating responses for chat:\n'{thread.messages}'\n\nError:\n{e}"
         )
         raise
+    finally:
+        finish_speculative_retrieval(speculation_token)
+
+
+@cache
+def get_client():
+    """
+    Return the shared, Langfuse-instrumented OpenAI client.
+
+    The client (and the Langfuse and OpenAI packages) are only imported on first use
+    to keep worker start-up fast.
+    """
+    from langfuse.openai import openai
+
+    return openai.OpenAI()
+
+
+def complete_thread(thread: models.Thread) -> models.Thread:
+    """
+    Run the chat loop on a thread and return a copy of it with the assistant's reply appended.
+
+    The input thread is left unchanged (the chat loop keeps tool calls and results in its own
+    `Conversation`). The copy is shallow: messages are shared, only the message list is new.
+
+    Args:
+        thread (models.Thread): The conversation thread containing user messages.
+
+    Returns:
+        models.Thread: The updated thread. Replies returned directly by a tool
+                       (see `DirectReturnException`) are appended as-is.
+
+    Raises:
+        Exception: For any errors during generating responses.
+    """
+    try:
+        assistant_response = handle_user_chat(thread=thread)
+    except DirectReturnException as direct_return_response:
+        assistant_response = models.Message(**direct_return_response.message)
+    return thread.model_copy(update={"messages": [*thread.messages, assistant_response]})
 
 
 @log_execution_time(logger=logger)
 def create_completion(
-    thread: models.Thread,
-    system_message: str = ORDER_SYSTEM_MESSAGE,
+    conversation: Conversation,
+    session_id: str | None = None,
     tools: list = order_dataset_tools,
-):
+    tool_choice: str | None = None,
+    deadline: float | None = None,
+) -> ChatMessage:
     """
-    Create a completion response from the language model based on the conversation thread.
+    Create a completion response from the language model based on the conversation.
 
     Args:
-        thread (models.Thread): The conversation thread containing all messages.
-        system_message (str): The system message to be included in the prompt.
+        conversation (Conversation): The conversation so far, starting with the system message.
+        session_id (str | None): The thread id, to group the completions of a chat in Langfuse.
         tools (list): A list of tools available for LLM to use.
+        tool_choice (str | None): Set to "none" to forbid tool calls. Defaults to the provider's choice.
+        deadline (float | None): Optional `time.monotonic()` time by which the completion must
+                                 have returned (see `create_completion_before`).
 
     Returns:
-        models.Message: The response message generated by the LLM.
+        ChatMessage: The response message generated by the LLM.
 
     Raises:
+        DeadlineExceededError: If the completion doesn't return before the deadline.
         Exception: If the LLM fails to generate a response.
     """
     try:
         logger.info(
-            f" create_completition |{thread.messages = }\n\n{system_message = }"
+            f" create_completition | {len(conversation)} messages, last: {conversation.messages[-1]}"
         )
-        completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_message},
-                *thread.messages,
-            ],
+        rate_limiter.acquire()
+        request = dict(
+            # A copy of the list (not of the messages), since Langfuse may keep a reference
+            # to it while the conversation keeps growing.
+            messages=list(conversation.wire),
             model=model,
             temperature=TEMPERATURE,
             max_tokens=MAX_COMPLETION_TOKENS,
             tools=tools,
-            session_id=thread.id,
+            session_id=session_id,
+            **({"tool_choice": tool_choice} if tool_choice else {}),
         )
+        if deadline is None:
+            completion = get_client().chat.completions.create(**request)
+        else:
+            completion = create_completion_before(request, deadline)
 
         logger.info(f" create_completion | {completion = }")
-        response = completion.choices[0].message
-        return response
+        return ChatMessage.from_completion(completion.choices[0].message)
     except Exception as e:
         logger.error(
-            f" create_completion | Error generating responses for chat '{thread.messages}': {e}"
+            f" create_completion | Error generating responses for chat '{conversation.messages}': {e}"
         )
         raise
+
+
+def create_completion_before(request: dict, deadline: float):
+    """
+    Send a chat completion request that must return before `deadline`, with the time left as
+    its timeout. Rate limited, server and connection errors are retried while time is left;
+    the client's own retries are disabled since each of them would get a full timeout again.
+
+    Args:
+        request (dict): The arguments of `chat.completions.create`.
+        deadline (float): The `time.monotonic()` time by which the completion must have returned.
+
+    Returns:
+        ChatCompletion: The completion.
+
+    Raises:
+        DeadlineExceededError: If no attempt returned before the deadline.
+        Exception: The error of the request, if it isn't worth retrying.
+    """
+    client = get_client().with_options(max_retries=0)
+    error = None
+    for attempt in itertools.count():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            return client.chat.completions.create(**request, timeout=remaining)
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            error = e
+        delay = retry_delay(error, attempt)
+        if time.monotonic() + delay >= deadline:
+            break
+        time.sleep(delay)
+    metrics.increment("agent.deadline_exceeded")
+    raise DeadlineExceededError(
+        "The chat request ran out of time before the LLM answered."
+    ) from error
@@ -1,18 +1,49 @@
+import json
+import os
+import threading
 import traceback
-from copy import deepcopy
+from contextlib import asynccontextmanager
+from typing import Literal
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-import gradio as gr
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import src.metrics as metrics
 import src.models as models
-from src.llm import handle_user_chat
-from src.utils import DirectReturnException, create_logger
+from src.batch import BATCH_CONCURRENCY, stream_batch
+from src.llm import DeadlineExceededError, complete_thread
+from src.resilience import breaker_states
+from src.scheduler import get_scheduler
+from src.utils import create_logger
+from src.warmup import is_ready, mark_ready, run_warmup, warmup_state
 import uuid
 import time
 
+# The Gradio UI pulls in a large dependency tree, so it is only mounted when asked for.
+ENABLE_GRADIO_UI = os.environ.get("ENABLE_GRADIO_UI", "false").lower() == "true"
+# Warm up clients, datasets and caches in a background thread once the server has started;
+# `/ready` answers 503 until the warm-up has finished. See `src/warmup.py`.
+PRELOAD_IN_BACKGROUND = (
+    os.environ.get("PRELOAD_IN_BACKGROUND", "true").lower() == "true"
+)
+# Responses larger than this many bytes are gzipped for clients that accept it.
+GZIP_MINIMUM_SIZE = int(os.environ.get("GZIP_MINIMUM_SIZE", "1024"))
+
 logger = create_logger(logger_name="main", log_file="api.log", log_level="info")
 
-fastapi_app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PRELOAD_IN_BACKGROUND:
+        threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+    else:
+        mark_ready()
+    yield
+
+
+fastapi_app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS settings to allow all origins
 origins = ["*"]
@@ -30,6 +61,7 @@ fastapi_app.add_middleware(
         "X-User-Identifier",
     ],
 )
+fastapi_app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
 
 @fastapi_app.get("/")
 async def root() -> dict:
@@ -44,8 +76,43 @@ async def root() -> dict:
     return {"message": "Hello World"}
 
 
+@fastapi_app.get("/ready")
+async def ready() -> dict:
+    """
+    Readiness endpoint for the load balancer: traffic should only be sent to this worker once
+    its warm-up has finished. Unlike `/`, it fails while the worker is starting.
+
+    Returns:
+        dict: The warm-up status and the outcome of every warm-up step, with a 200 status code
+              once the worker is ready and 503 before.
+    """
+    state = warmup_state()
+    if not is_ready():
+        return ORJSONResponse(state, status_code=503)
+    return state
+
+
+@fastapi_app.get("/metrics")
+async def get_metrics() -> dict:
+    """
+    Metrics endpoint that returns the counters and summaries collected by this worker process,
+    the current load of the chat scheduler and the state of the dependencies' circuit breakers.
+
+    Returns:
+        dict: Dictionary with a "counters", a "summaries", a "scheduler" and a "breakers" section.
+    """
+    return {
+        **metrics.snapshot(),
+        "scheduler": get_scheduler().stats(),
+        "breakers": breaker_states(),
+    }
+
+
 @fastapi_app.post("/chat")
-async def create_chat(thread: models.Thread) -> models.Thread:
+async def create_chat(
+    thread: models.Thread,
+    response_mode: Literal["full", "delta"] = Query("full"),
+) -> models.Thread | models.ChatDelta:
     """
     Handle chat interactions by processing the conversation thread.
 
@@ -55,27 +122,38 @@ async def create_chat(thread: models.Thread) -> models.Thread:
         thread (Thread): An object containing a list of messages in the chat.
                          Each message must have a role of either 'user' or 'assistant'
                          and must follow an alternating role sequence starting with 'user'.
+        response_mode (str): "full" returns the whole updated thread, "delta" only returns
+                             the assistant's reply and the thread metadata.
 
     Returns:
-        Thread: The updated thread with the assistant's response appended.
+        Thread | ChatDelta: The updated thread with the assistant's response appended,
+                            or just the response in "delta" mode.
 
     Raises:
-        HTTPException: Raised if an error occurs during chat processing.
+        HTTPException: Raised if an error occurs during chat processing (504 if the chat
+                       runs past its deadline).
     """
     logger.info("Chat endpoint accessed with thread: %s", thread)
-    response = deepcopy(thread)
     try:
-        # Process chat interaction
-        assistant_response = handle_user_chat(thread=thread)
-        response.messages.append(assistant_response)
-        logger.info("Assistant response generated: %s", assistant_response)
+        # Process chat interaction in a worker thread so the event loop keeps serving other
+        # requests, once the scheduler gives this user a slot
+        async with get_scheduler().slot(thread.user_id, lane="interactive"):
+            response = await run_in_threadpool(complete_thread, thread)
+        logger.info("Assistant response generated: %s", response.messages[-1])
+        if response_mode == "delta":
+            return models.ChatDelta(
+                id=response.id,
+                user_id=response.user_id,
+                message=response.messages[-1],
+                message_count=len(response.messages),
+            )
         return response
-    except DirectReturnException as direct_return_response:
-        response.messages.append(models.Message(**direct_return_response.message))
-        logger.info(
-            "Direct return response appended: %s", direct_return_response.message
+    except DeadlineExceededError:
+        logger.warning("Chat ran out of time: %s", thread)
+        raise HTTPException(
+            status_code=504,
+            detail=f"Chat took longer than its deadline to answer: {str(thread)}",
         )
-        return response
     except Exception:
         # Log the traceback and raise an HTTP exception if an error occurs
         logger.error("Error processing chat: %s", traceback.format_exc())
@@ -83,7 +161,44 @@ async def create_chat(thread: models.Thread) -> models.Thread:
             status_code=500, detail=f"Error generating response for chat: {str(thread)}"
         )
 
+
+@fastapi_app.post("/chat/batch")
+async def create_chat_batch(
+    file: UploadFile,
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1),
+) -> StreamingResponse:
+    """
+    Run a JSONL file of threads through the chat loop, e.g. for offline evaluation.
+
+    Results are streamed back as JSON lines in completion order. Every line but the last
+    is a `result` record carrying the input line's index and the updated thread (or the error);
+    the last line is a `report` record with throughput and failures.
+
+    Args:
+        file (UploadFile): A JSONL file where every line is a serialized `Thread`.
+        concurrency (int): Maximum number of threads processed at the same time.
+
+    Returns:
+        StreamingResponse: An `application/x-ndjson` stream of result records.
+    """
+    lines = (await file.read()).decode("utf-8").splitlines()
+    logger.info("Batch chat endpoint accessed with %d lines", len(lines))
+
+    async def serialize():
+        async for record in stream_batch(lines=lines, concurrency=concurrency):
+            yield json.dumps(record) + "\n"
+
+    # GZipMiddleware buffers streamed chunks until tens of KB are compressed, which would hold
+    # back results; a content encoding is set so that it leaves this response alone.
+    return StreamingResponse(
+        serialize(),
+        media_type="application/x-ndjson",
+        headers={"Content-Encoding": "identity"},
+    )
+
+
 def add_gradio_ui(fastapi_app: FastAPI) -> FastAPI:
+    import gradio as gr
 
     async def gradio_chat_interface(message, history, request: gr.Request):
         """
@@ -106,7 +221,7 @@ def add_gradio_ui(fastapi_app: FastAPI) -> FastAPI:
 
             # Send the thread to the `/chat` endpoint
             print(message, history)
-            response = await create_chat(thread=thread)
+            response = await create_chat(thread=thread, response_mode="full")
             assistant_message = response.messages[-1].content  # Fetch assistant response
             print(f"assistant_message = {assistant_message}")
 
@@ -120,5 +235,5 @@ def add_gradio_ui(fastapi_app: FastAPI) -> FastAPI:
 
     return app
 
-app = add_gradio_ui(fastapi_app=fastapi_app)
+app = add_gradio_ui(fastapi_app=fastapi_app) if ENABLE_GRADIO_UI else fastapi_app
 logger.info("Starting the application")
@@ -0,0 +1,57 @@
+import threading
+
+# Counters and summaries are kept per worker process and exposed through the `/metrics` endpoint.
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_summaries: dict[str, dict] = {}
+
+
+def increment(name: str, value: float = 1) -> None:
+    """
+    Add `value` to the counter called `name`.
+
+    :param name: Counter name, dot-separated by convention (e.g. "singleflight.embed_query.coalesced").
+    :param value: Amount to add, defaults to 1.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, value: float) -> None:
+    """
+    Record one observation (e.g. a latency) in the summary called `name`.
+
+    :param name: Summary name.
+    :param value: Observed value.
+    """
+    with _lock:
+        summary = _summaries.get(name)
+        if summary is None:
+            _summaries[name] = {"count": 1, "sum": value, "min": value, "max": value}
+            return
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["min"] = min(summary["min"], value)
+        summary["max"] = max(summary["max"], value)
+
+
+def get_counter(name: str) -> float:
+    """
+    Return the current value of a counter, 0 if it was never incremented.
+    """
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> dict:
+    """
+    Return a copy of all counters and summaries.
+
+    :return: Dictionary with a "counters" and a "summaries" section.
+    """
+    with _lock:
+        summaries = {
+            name: {**summary, "mean": summary["sum"] / summary["count"]}
+            for name, summary in _summaries.items()
+        }
+        return {"counters": dict(_counters), "summaries": summaries}
@@ -1,3 +1,8 @@
+import fcntl
+import glob
+import os
+import threading
+import time
 from enum import Enum
 from typing import Literal
 
@@ -5,8 +10,17 @@ import polars as pl
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.responses import JSONResponse
 
-# Load dataset with Polars
-DATASET_PATH = "data/order_data.parquet"
+# Load dataset with Polars. The path can also be a glob or a (hive-partitioned) directory in lazy mode.
+DATASET_PATH = os.environ.get("ORDER_DATASET_PATH", "data/order_data.parquet")
+# "eager" keeps the whole dataset in memory, "lazy" scans the parquet file(s) on every request
+# and only reads the rows and columns that the request needs, "mmap" memory-maps a shared
+# Arrow IPC snapshot so that all worker processes use the same pages of the OS page cache.
+ORDER_DATA_MODE = os.environ.get("ORDER_DATA_MODE", "eager")
+ORDER_SNAPSHOT_PATH = os.environ.get("ORDER_SNAPSHOT_PATH", "data/order_data.arrow")
+# How often (in seconds) workers check whether the snapshot file has been replaced.
+ORDER_SNAPSHOT_CHECK_INTERVAL = float(
+    os.environ.get("ORDER_SNAPSHOT_CHECK_INTERVAL", "5")
+)
 
 
 # Define data models for Product_Category and Order_Priorirty fields to allow only valid values
@@ -25,10 +39,156 @@ class OrderPriority(str, Enum):
     low = "Low"
 
 
-irrelevant_cols = ["Gender", "Device_Type", "Customer_Login_type", "Profit"]
-df = pl.read_parquet(DATASET_PATH)
 # These columns aren't needed by the user.
-df = df.fill_null("")
+irrelevant_cols = ["Gender", "Device_Type", "Customer_Login_type", "Profit"]
+
+
+_order_data_lock = threading.Lock()
+_order_data: pl.DataFrame | None = None
+_order_data_version: tuple | None = None
+_order_data_checked_at = 0.0
+
+
+def publish_order_snapshot(
+    dataset_path: str = DATASET_PATH, snapshot_path: str = ORDER_SNAPSHOT_PATH
+) -> None:
+    """
+    Write the order dataset to an uncompressed Arrow IPC file that workers can memory-map.
+
+    The snapshot is written next to its destination and then renamed over it, so readers
+    either see the old or the new file, never a partial one. Workers that still map the
+    old file keep using it until they notice the swap.
+
+    Args:
+        dataset_path (str): Path to the source parquet dataset.
+        snapshot_path (str): Path of the Arrow IPC snapshot to (re)place.
+    """
+    tmp_path = f"{snapshot_path}.tmp-{os.getpid()}"
+    df = pl.read_parquet(dataset_path).fill_null("").rechunk()
+    df.write_ipc(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, snapshot_path)
+
+
+def _snapshot_version(snapshot_path: str) -> tuple:
+    """
+    Return the identity of the snapshot file, creating it first if it doesn't exist yet.
+    """
+    try:
+        stat = os.stat(snapshot_path)
+    except FileNotFoundError:
+        # Only one worker builds the missing snapshot; the others wait and reuse it.
+        with open(f"{snapshot_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(snapshot_path):
+                publish_order_snapshot(snapshot_path=snapshot_path)
+        stat = os.stat(snapshot_path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def dataset_files(dataset_path: str) -> list[str]:
+    """
+    Return the files of the order dataset: the file itself, the files matching a glob, or
+    every file under a (hive-partitioned) directory, in a stable order.
+    """
+    if os.path.isdir(dataset_path):
+        return sorted(
+            os.path.join(directory, file_name)
+            for directory, _, file_names in os.walk(dataset_path)
+            for file_name in file_names
+        )
+    if any(char in dataset_path for char in "*?["):
+        return sorted(glob.glob(dataset_path, recursive=True))
+    return [dataset_path]
+
+
+def order_data_version() -> tuple:
+    """
+    Return a value that changes whenever the order dataset is replaced.
+
+    Files rewritten inside a directory don't reliably change the directory's own modification
+    time, so every file of the dataset is checked.
+
+    Returns:
+        tuple: The identity (inode, modification time, size) of the snapshot file, or the path
+               and identity of every file of the dataset.
+    """
+    if ORDER_DATA_MODE == "mmap":
+        return _snapshot_version(ORDER_SNAPSHOT_PATH)
+    version = []
+    for path in dataset_files(DATASET_PATH):
+        stat = os.stat(path)
+        version.append((path, stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+def get_order_data() -> pl.DataFrame:
+    """
+    Load the order dataset on first use and keep it for subsequent requests.
+
+    In mmap mode the frame is a zero-copy view of the shared Arrow IPC snapshot, and it is
+    re-mapped when the snapshot file has been swapped (checked every
+    `ORDER_SNAPSHOT_CHECK_INTERVAL` seconds).
+
+    Returns:
+        pl.DataFrame: The order dataset with missing values replaced by empty strings.
+    """
+    global _order_data, _order_data_version, _order_data_checked_at
+
+    if _order_data is not None and (
+        ORDER_DATA_MODE != "mmap"
+        or time.monotonic() - _order_data_checked_at < ORDER_SNAPSHOT_CHECK_INTERVAL
+    ):
+        return _order_data
+
+    with _order_data_lock:
+        if ORDER_DATA_MODE != "mmap":
+            if _order_data is None:
+                _order_data = pl.read_parquet(DATASET_PATH).fill_null("")
+            return _order_data
+
+        version = _snapshot_version(ORDER_SNAPSHOT_PATH)
+        if version != _order_data_version:
+            _order_data = pl.read_ipc(
+                ORDER_SNAPSHOT_PATH, memory_map=True, rechunk=False
+            )
+            _order_data_version = version
+        _order_data_checked_at = time.monotonic()
+        return _order_data
+
+
+def reload_order_data() -> None:
+    """
+    Drop the loaded order dataset so that the next request loads it again.
+    """
+    global _order_data, _order_data_version
+    with _order_data_lock:
+        _order_data = None
+        _order_data_version = None
+
+
+def scan_order_data() -> pl.LazyFrame:
+    """
+    Return the order dataset as a LazyFrame that every endpoint builds its query on.
+
+    In lazy mode this is a parquet scan, so filters and column selections applied before
+    `collect()` are pushed down into the parquet reader and row groups that can't match
+    are skipped using their statistics. Missing values are only replaced after filtering
+    (see `collect_orders`), so filters must treat nulls like empty strings themselves.
+
+    Returns:
+        pl.LazyFrame: The query root for the order dataset.
+    """
+    if ORDER_DATA_MODE == "lazy":
+        return pl.scan_parquet(DATASET_PATH)
+    return get_order_data().lazy()
+
+
+def collect_orders(query: pl.LazyFrame) -> pl.DataFrame:
+    """
+    Execute an order query, replacing missing values with empty strings like the eager dataset.
+    """
+    return query.fill_null("").collect()
+
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -39,15 +199,17 @@ app = FastAPI(
 @app.get("/data", response_class=JSONResponse)
 def get_all_data() -> list[dict]:
     """Retrieve all records in the dataset."""
-    data = df.drop(irrelevant_cols).to_dicts()
+    data = collect_orders(scan_order_data().drop(irrelevant_cols)).to_dicts()
     return data
 
 
 @app.get("/data/customer/{customer_id}")
 def get_customer_data(customer_id: int) -> list[dict]:
     """Retrieve all orders for a specific Customer ID."""
-    filtered_data = df.drop(irrelevant_cols).filter(
-        pl.col("Customer_Id") == customer_id
+    filtered_data = collect_orders(
+        scan_order_data()
+        .filter(pl.col("Customer_Id") == customer_id)
+        .drop(irrelevant_cols)
     )
     if filtered_data.is_empty():
         raise HTTPException(
@@ -59,8 +221,10 @@ def get_customer_data(customer_id: int) -> list[dict]:
 @app.get("/data/product-category/{category}")
 def get_product_category_data(category: ProductCategory) -> list[dict]:
     """Retrieve all orders for a specific Product Category."""
-    filtered_data = df.drop(irrelevant_cols).filter(
-        pl.col("Product_Category") == category.value
+    filtered_data = collect_orders(
+        scan_order_data()
+        .filter(pl.col("Product_Category") == category.value)
+        .drop(irrelevant_cols)
     )
     if filtered_data.is_empty():
         raise HTTPException(
@@ -85,28 +249,31 @@ def get_orders_by_priority(
     - sort_descendingly: Whether to sort in descending order.
     - limit: Maximum number of records to return.
     """
-    filtered_data = df.drop(irrelevant_cols).filter(
-        pl.col("Order_Priority") == priority
+    query = (
+        scan_order_data()
+        .filter(pl.col("Order_Priority").fill_null("") == priority)
+        .drop(irrelevant_cols)
     )
+    if sort_by_date:
+        query = query.sort(by=["Order_Date", "Time"], descending=sort_descendingly)
+    if limit:
+        query = query.head(limit)
+    filtered_data = collect_orders(query)
     if filtered_data.is_empty():
         raise HTTPException(
             status_code=404,
             detail=f"No data found for Order Priority '{priority}'",
         )
-    if sort_by_date:
-        filtered_data = filtered_data.sort(
-            by=["Order_Date", "Time"], descending=sort_descendingly
-        )
-    if limit:
-        filtered_data = filtered_data[:limit]
     return filtered_data.to_dicts()
 
 
 @app.get("/data/total-sales-by-category")
 def get_total_sales_by_category() -> list[dict]:
     """Calculate total sales by Product Category."""
-    sales_summary = (
-        df.drop(irrelevant_cols).group_by("Product_Category").agg(pl.col("Sales").sum())
+    sales_summary = collect_orders(
+        scan_order_data()
+        .group_by(pl.col("Product_Category").fill_null(""))
+        .agg(pl.col("Sales").sum())
     )
     return sales_summary.to_dicts()
 
@@ -115,7 +282,9 @@ def get_total_sales_by_category() -> list[dict]:
 @app.get("/data/high-profit-products")
 def get_high_profit_products(min_profit: float = 100.0) -> list[dict]:
     """Retrieve products with profit greater than the specified value."""
-    filtered_data = df.filter(pl.col("Profit") > min_profit)
+    filtered_data = collect_orders(
+        scan_order_data().filter(pl.col("Profit") > min_profit)
+    )
     if filtered_data.is_empty():
         raise HTTPException(
             status_code=404,
@@ -128,16 +297,25 @@ def get_high_profit_products(min_profit: float = 100.0) -> list[dict]:
 @app.get("/data/shipping-cost-summary")
 def get_shipping_cost_summary() -> dict:
     """Retrieve the average, minimum, and maximum shipping cost."""
-    summary = {
-        "average_shipping_cost": df["Shipping_Cost"].mean(),
-        "min_shipping_cost": df["Shipping_Cost"].min(),
-        "max_shipping_cost": df["Shipping_Cost"].max(),
-    }
+    summary = (
+        scan_order_data()
+        .select(
+            average_shipping_cost=pl.col("Shipping_Cost").mean(),
+            min_shipping_cost=pl.col("Shipping_Cost").min(),
+            max_shipping_cost=pl.col("Shipping_Cost").max(),
+        )
+        .collect()
+        .row(0, named=True)
+    )
     return summary
 
 
 @app.get("/data/profit-by-gender")
 def get_profit_by_gender() -> list[dict]:
     """Calculate total profit by customer gender."""
-    profit_summary = df.group_by("Gender").agg(pl.col("Profit").sum())
+    profit_summary = collect_orders(
+        scan_order_data()
+        .group_by(pl.col("Gender").fill_null(""))
+        .agg(pl.col("Profit").sum())
+    )
     return profit_summary.to_dicts()
@@ -1,7 +1,7 @@
 import uuid
 from typing import Literal
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, Field, validator
 
 
 class Message(BaseModel):
@@ -26,11 +26,21 @@ class Thread(BaseModel):
                          generated UUID if not provided.
         messages (list[Message]): A list of Message objects in the thread.
         user_id (str | None): Optional identifier for the user.
+        max_tool_iterations (int | None): Optional cap on the rounds of tool calls made to
+                                          answer this request, at most (and by default)
+                                          AGENT_MAX_TOOL_ITERATIONS.
+        deadline_seconds (float | None): Optional hard time budget of this request. Tools stop
+                                         AGENT_FINAL_ANSWER_SECONDS before it to leave time for
+                                         the final answer, and the request fails if the LLM
+                                         hasn't answered by then. At most (and by default)
+                                         AGENT_DEADLINE_SECONDS.
     """
 
     id: str | None = str(uuid.uuid4())
     messages: list[Message]
     user_id: str | None = None
+    max_tool_iterations: int | None = Field(default=None, ge=0)
+    deadline_seconds: float | None = Field(default=None, gt=0)
 
     @validator("messages")
     def check_alternating_roles(cls, v):
@@ -60,3 +70,20 @@ class Thread(BaseModel):
             if i % 2 == 0 and v[i].role != "user":
                 raise ValueError(f"Message at index {i} must have the role 'user'.")
         return v
+
+
+class ChatDelta(BaseModel):
+    """
+    Represents the part of a thread added by one chat request, without the earlier messages.
+
+    Attributes:
+        id (str | None): Identifier of the thread.
+        user_id (str | None): Optional identifier for the user.
+        message (Message): The assistant's reply appended to the thread.
+        message_count (int): Number of messages in the thread, including the reply.
+    """
+
+    id: str | None
+    user_id: str | None = None
+    message: Message
+    message_count: int
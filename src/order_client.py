@@ -0,0 +1,218 @@
+import asyncio
+import os
+import random
+import threading
+from functools import cache
+from typing import TYPE_CHECKING, Any
+
+import src.metrics as metrics
+import src.mock_api as mock_api
+from src.utils import create_logger
+
+if TYPE_CHECKING:
+    import httpx
+
+# "local" runs the order tools in-process on the order dataset, "remote" calls the order
+# service (`src.mock_api:app`) at ORDER_SERVICE_URL so chat workers don't load the dataset.
+ORDER_TOOLS_MODE = os.environ.get("ORDER_TOOLS_MODE", "local")
+ORDER_SERVICE_URL = os.environ.get("ORDER_SERVICE_URL", "http://localhost:8001")
+ORDER_SERVICE_TIMEOUT = float(os.environ.get("ORDER_SERVICE_TIMEOUT", "10"))
+ORDER_SERVICE_CONNECT_TIMEOUT = float(os.environ.get("ORDER_SERVICE_CONNECT_TIMEOUT", "2"))
+ORDER_SERVICE_MAX_RETRIES = int(os.environ.get("ORDER_SERVICE_MAX_RETRIES", "2"))
+ORDER_SERVICE_MAX_CONNECTIONS = int(os.environ.get("ORDER_SERVICE_MAX_CONNECTIONS", "32"))
+
+logger = create_logger(logger_name="order_client", log_file="api.log", log_level="info")
+
+
+class OrderServiceError(Exception):
+    """
+    Exception raised when the order service can't answer a request (after retries).
+    """
+
+
+class OrderClient:
+    """
+    Client of the order service, shared by every chat worker thread of the process.
+
+    Requests are made by one pooled `httpx.AsyncClient` (keep-alive connections, timeouts)
+    running on a dedicated event loop thread, so that concurrent tool calls from many
+    worker threads share connections. Idempotent requests are retried on connection
+    errors, timeouts, 429 and 5xx responses with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        base_url: str = ORDER_SERVICE_URL,
+        timeout: float = ORDER_SERVICE_TIMEOUT,
+        connect_timeout: float = ORDER_SERVICE_CONNECT_TIMEOUT,
+        max_retries: int = ORDER_SERVICE_MAX_RETRIES,
+        max_connections: int = ORDER_SERVICE_MAX_CONNECTIONS,
+    ):
+        import httpx
+
+        self.max_retries = max_retries
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="order-client", daemon=True
+        )
+        self._thread.start()
+        self._client: "httpx.AsyncClient" = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    def get(self, path: str, params: dict | None = None) -> Any:
+        """
+        Send a GET request to the order service and return the decoded JSON body.
+
+        Args:
+            path (str): The endpoint path, e.g. "/data/customer/123".
+            params (dict | None): Query parameters; None values are left out.
+
+        Returns:
+            Any: The JSON response.
+
+        Raises:
+            LookupError: If the service found no matching data (404).
+            OrderServiceError: If the service failed or couldn't be reached.
+        """
+        params = {key: value for key, value in (params or {}).items() if value is not None}
+        future = asyncio.run_coroutine_threadsafe(self._get(path, params), self._loop)
+        return future.result()
+
+    async def _get(self, path: str, params: dict) -> Any:
+        import httpx
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client.get(path, params=params)
+            except httpx.TransportError as e:
+                error = OrderServiceError(f"Order service unreachable: {e!r}")
+            else:
+                if response.status_code == 404:
+                    raise LookupError(response.json().get("detail", "No data found."))
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    return response.json()
+                error = OrderServiceError(
+                    f"Order service returned {response.status_code}: {response.text[:200]}"
+                )
+            if attempt == self.max_retries:
+                raise error
+            metrics.increment("order_client.retries")
+            logger.warning(f"{error}, retrying ({attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(random.uniform(0, 0.1 * 2**attempt))
+
+
+@cache
+def get_order_client() -> OrderClient:
+    """
+    Return the shared order service client, creating it on first use.
+    """
+    return OrderClient()
+
+
+def _call_local(fn, *args, **kwargs) -> Any:
+    # The order functions are FastAPI endpoints; translate their "not found" errors so
+    # that both modes fail the same way.
+    from fastapi import HTTPException
+
+    try:
+        return fn(*args, **kwargs)
+    except HTTPException as e:
+        if e.status_code == 404:
+            raise LookupError(e.detail) from None
+        raise
+
+
+def get_all_data() -> list[dict]:
+    """Retrieve all records in the dataset."""
+    if ORDER_TOOLS_MODE == "remote":
+        return get_order_client().get("/data")
+    return _call_local(mock_api.get_all_data)
+
+
+def get_customer_data(customer_id: int) -> list[dict]:
+    """Retrieve all orders for a specific Customer ID."""
+    if ORDER_TOOLS_MODE == "remote":
+        return get_order_client().get(f"/data/customer/{int(customer_id)}")
+    return _call_local(mock_api.get_customer_data, int(customer_id))
+
+
+def get_product_category_data(category: str) -> list[dict]:
+    """Retrieve all orders for a specific Product Category."""
+    category = mock_api.ProductCategory(category)
+    if ORDER_TOOLS_MODE == "remote":
+        return get_order_client().get(f"/data/product-category/{category.value}")
+    return _call_local(mock_api.get_product_category_data, category)
+
+
+def get_orders_by_priority(
+    priority: str,
+    sort_by_date: bool | None = None,
+    sort_descendingly: bool = False,
+    limit: int | None = None,
+) -> list[dict]:
+    """Retrieve all orders with the given priority."""
+    if ORDER_TOOLS_MODE == "remote":
+        return get_order_client().get(
+            f"/data/order-priority/{priority}",
+            params={
+                "sort_by_date": sort_by_date,
+                "sort_descendingly": sort_descendingly,
+                "limit": limit,
+            },
+        )
+    return _call_local(
+        mock_api.get_orders_by_priority,
+        priority,
+        sort_by_date=sort_by_date,
+        sort_descendingly=sort_descendingly,
+        limit=limit,
+    )
+
+
+def get_total_sales_by_category() -> list[dict]:
+    """Calculate total sales by Product Category."""
+    if ORDER_TOOLS_MODE == "remote":
+        return get_order_client().get("/data/total-sales-by-category")
+    return _call_local(mock_api.get_total_sales_by_category)
+
+
+def get_high_profit_products(min_profit: float = 100.0) -> list[dict]:
+    """Retrieve products with profit greater than the specified value."""
+    if ORDER_TOOLS_MODE == "remote":
+        return get_order_client().get(
+            "/data/high-profit-products", params={"min_profit": min_profit}
+        )
+    return _call_local(mock_api.get_high_profit_products, min_profit)
+
+
+def get_shipping_cost_summary() -> dict:
+    """Retrieve the average, minimum, and maximum shipping cost."""
+    if ORDER_TOOLS_MODE == "remote":
+        return get_order_client().get("/data/shipping-cost-summary")
+    return _call_local(mock_api.get_shipping_cost_summary)
+
+
+def get_profit_by_gender() -> list[dict]:
+    """Calculate total profit by customer gender."""
+    if ORDER_TOOLS_MODE == "remote":
+        return get_order_client().get("/data/profit-by-gender")
+    return _call_local(mock_api.get_profit_by_gender)
+
+
+def order_data_version() -> tuple | None:
+    """
+    Return the version of the order data the tools read, for caching their results.
+
+    In remote mode the order service owns the data, so there is no version to check and
+    cached results are only bounded by their TTL.
+    """
+    if ORDER_TOOLS_MODE == "remote":
+        return None
+    return mock_api.order_data_version()
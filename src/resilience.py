@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import cache
+from typing import Any, Callable
+
+import src.metrics as metrics
+from src.utils import create_logger
+
+# Consecutive failures after which a dependency's breaker opens, and how long it stays open
+# before one probe request is let through.
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+# A second (hedged) request is sent when the first one is slower than this percentile of the
+# recent latencies of the dependency; 0 disables hedging.
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", "200"))
+DEPENDENCY_WORKERS = int(os.environ.get("DEPENDENCY_WORKERS", "32"))
+
+logger = create_logger(logger_name="resilience", log_file="api.log", log_level="info")
+
+_breakers: dict[str, "CircuitBreaker"] = {}
+
+
+class CircuitOpenError(Exception):
+    """
+    Exception raised instead of calling a dependency whose circuit breaker is open.
+    """
+
+
+class DependencyTimeoutError(TimeoutError):
+    """
+    Exception raised when a dependency doesn't answer within its timeout.
+    """
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker of one dependency.
+
+    It opens after `failure_threshold` consecutive failures, so that callers fail fast to a
+    degraded path instead of waiting on an unhealthy dependency. After `reset_seconds` it lets
+    one probe call through (half-open): a success closes it, a failure opens it again.
+
+    Transitions are counted in `src.metrics` under "breaker.<name>.<state>".
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        _breakers[name] = self
+
+    def allow(self) -> bool:
+        """
+        Return whether a call may be made now. In the half-open state, only one call is allowed
+        until its outcome is recorded.
+        """
+        with self._lock:
+            if self._state == "open":
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self._transition("half_open")
+            if self._state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        """
+        Record a successful call, closing the breaker.
+        """
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != "closed":
+                self._transition("closed")
+
+    def record_failure(self) -> None:
+        """
+        Record a failed call, opening the breaker past the failure threshold or after a failed probe.
+        """
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == "half_open" or (
+                self._state == "closed" and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._transition("open")
+
+    def _transition(self, state: str) -> None:
+        logger.warning(f"Circuit breaker {self.name!r}: {self._state} -> {state}")
+        self._state = state
+        metrics.increment(f"breaker.{self.name}.{state}")
+
+    def state(self) -> dict:
+        """
+        Return the state of the breaker and its number of consecutive failures.
+        """
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures}
+
+
+def breaker_states() -> dict[str, dict]:
+    """
+    Return the state of every circuit breaker of the process, for monitoring.
+    """
+    return {name: breaker.state() for name, breaker in _breakers.items()}
+
+
+@cache
+def get_dependency_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool that runs the (possibly hedged) calls to dependencies.
+    """
+    return ThreadPoolExecutor(max_workers=DEPENDENCY_WORKERS, thread_name_prefix="dependency")
+
+
+class Dependency:
+    """
+    Calls to one remote dependency (e.g. the embedding service or Qdrant), with a timeout,
+    hedging and a circuit breaker.
+
+    Calls must be idempotent: when one is slower than `hedge_percentile` of the recent
+    latencies, the same call is sent a second time and the first answer wins. Calls that time
+    out can't be interrupted; they finish in the background and their result is dropped.
+
+    Metrics: "dependency.<name>.latency" summary (seconds), and "dependency.<name>.hedged",
+    "dependency.<name>.hedge_won", "dependency.<name>.timeouts" and "dependency.<name>.rejected"
+    counters.
+
+    Attributes:
+        name (str): Name of the dependency, used for its breaker and metrics.
+        timeout (float): Seconds after which a call fails with `DependencyTimeoutError`.
+        hedge_percentile (float): Latency percentile after which a hedged call is sent.
+        breaker (CircuitBreaker): The breaker of the dependency.
+    """
+
+    def __init__(self, name: str, timeout: float, hedge_percentile: float = HEDGE_PERCENTILE):
+        self.name = name
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.breaker = CircuitBreaker(name)
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=HEDGE_WINDOW)
+
+    def hedge_delay(self) -> float | None:
+        """
+        Return the number of seconds after which to send a hedged call, or None to not hedge.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not 0 < self.hedge_percentile < 1 or len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        delay = latencies[min(len(latencies) - 1, int(self.hedge_percentile * len(latencies)))]
+        return delay if delay < self.timeout else None
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Call `fn(*args, **kwargs)` through the breaker, with the dependency's timeout and hedging.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            DependencyTimeoutError: If no call answered within the timeout.
+            Exception: The error of the call, if every call sent failed.
+        """
+        if not self.breaker.allow():
+            metrics.increment(f"dependency.{self.name}.rejected")
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit breaker open).")
+        try:
+            result = self._call(fn, args, kwargs)
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _call(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        executor = get_dependency_executor()
+        deadline = time.monotonic() + self.timeout
+        sent_at: dict[Future, float] = {executor.submit(fn, *args, **kwargs): time.monotonic()}
+        primary = next(iter(sent_at))
+
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is not None:
+            done, _ = wait([primary], timeout=hedge_delay)
+            if not done:
+                metrics.increment(f"dependency.{self.name}.hedged")
+                sent_at[executor.submit(fn, *args, **kwargs)] = time.monotonic()
+
+        pending, error = set(sent_at), None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                latency = time.monotonic() - sent_at[future]
+                with self._lock:
+                    self._latencies.append(latency)
+                metrics.observe(f"dependency.{self.name}.latency", latency)
+                if future is not primary:
+                    metrics.increment(f"dependency.{self.name}.hedge_won")
+                for other in pending:
+                    other.cancel()
+                return future.result()
+
+        if not pending and error is not None:
+            raise error
+        metrics.increment(f"dependency.{self.name}.timeouts")
+        raise DependencyTimeoutError(f"{self.name} did not answer within {self.timeout} seconds.")
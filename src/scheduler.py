@@ -0,0 +1,228 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import cache
+from typing import AsyncIterator, Literal
+
+import src.metrics as metrics
+from src.utils import create_logger
+
+# Chat loops (LLM and tool work) running at the same time in this process; 0 disables scheduling.
+SCHEDULER_MAX_CONCURRENCY = int(os.environ.get("SCHEDULER_MAX_CONCURRENCY", "32"))
+# Chat loops of one user running at the same time, across both lanes.
+SCHEDULER_MAX_PER_USER = int(os.environ.get("SCHEDULER_MAX_PER_USER", "4"))
+# Slots batch traffic may use, so that interactive requests never wait for a full batch to drain.
+SCHEDULER_BATCH_MAX_CONCURRENCY = int(os.environ.get("SCHEDULER_BATCH_MAX_CONCURRENCY", "16"))
+# Share of the capacity of some users relative to the others (default weight 1), e.g. "alice=2,bob=0.5".
+SCHEDULER_USER_WEIGHTS = os.environ.get("SCHEDULER_USER_WEIGHTS", "")
+
+LANES = ("interactive", "batch")
+
+logger = create_logger(logger_name="scheduler", log_file="api.log", log_level="info")
+
+
+def parse_user_weights(weights: str) -> dict[str, float]:
+    """
+    Parse user weights written as comma-separated `user=weight` pairs.
+
+    Args:
+        weights (str): The weights, e.g. "alice=2,bob=0.5".
+
+    Returns:
+        dict[str, float]: The weight of every listed user.
+    """
+    parsed = {}
+    for pair in weights.split(","):
+        if pair.strip():
+            user, weight = pair.rsplit("=", 1)
+            parsed[user.strip()] = float(weight)
+    return parsed
+
+
+@dataclass(slots=True)
+class _Request:
+    user: str
+    lane: str
+    start: float
+    enqueued_at: float
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future
+    granted: bool = False
+    cancelled: bool = False
+
+
+class FairScheduler:
+    """
+    Admission control in front of the chat loop, shared by every request of the process.
+
+    At most `max_concurrency` chat loops run at once, and at most `max_per_user` per user.
+    Waiting requests are served with weighted fair queueing: every user gets a share of the
+    slots proportional to their weight, however many requests they queue, so a user running a
+    large batch can't delay everybody else. The interactive lane (`/chat`) is always served
+    before the batch lane (`/chat/batch`, `scripts/run_batch_chat.py`), and batch traffic never
+    holds more than `batch_max_concurrency` slots.
+
+    It can be used from any event loop; the state is guarded by a lock and waiters are woken
+    up on their own loop.
+
+    Metrics: "scheduler.queue_wait.<lane>" summaries (seconds) and "scheduler.admitted.<lane>"
+    counters; `stats()` reports the current load.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+        max_per_user: int = SCHEDULER_MAX_PER_USER,
+        batch_max_concurrency: int = SCHEDULER_BATCH_MAX_CONCURRENCY,
+        user_weights: dict[str, float] | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.batch_max_concurrency = batch_max_concurrency
+        self.user_weights = user_weights or {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        # Per lane: heap of (virtual finish time, sequence, request), virtual time, and the
+        # virtual finish time of every user's last queued request.
+        self._queues: dict[str, list] = {lane: [] for lane in LANES}
+        self._virtual_time: dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._finish_times: dict[str, dict[str, float]] = {lane: {} for lane in LANES}
+        self._queued: dict[str, int] = {lane: 0 for lane in LANES}
+        self._running: dict[str, int] = {lane: 0 for lane in LANES}
+        self._running_per_user: dict[str, int] = {}
+
+    @asynccontextmanager
+    async def slot(
+        self, user_id: str | None, lane: Literal["interactive", "batch"] = "interactive"
+    ) -> AsyncIterator[None]:
+        """
+        Wait for a slot to run one chat loop, and hold it until the block exits.
+
+        Args:
+            user_id (str | None): The user the work is done for. Requests without a user
+                                  are each scheduled as their own user.
+            lane (str): "interactive" or "batch".
+        """
+        if self.max_concurrency <= 0:
+            yield
+            return
+        user = user_id if user_id is not None else f"anonymous-{next(self._sequence)}"
+        await self._acquire(user, lane)
+        try:
+            yield
+        finally:
+            self._release(user, lane)
+
+    async def _acquire(self, user: str, lane: str) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            finish_times = self._finish_times[lane]
+            start = max(self._virtual_time[lane], finish_times.get(user, 0.0))
+            finish_times[user] = start + 1 / self.user_weights.get(user, 1.0)
+            request = _Request(
+                user=user,
+                lane=lane,
+                start=start,
+                enqueued_at=time.monotonic(),
+                loop=loop,
+                future=loop.create_future(),
+            )
+            heapq.heappush(
+                self._queues[lane], (finish_times[user], next(self._sequence), request)
+            )
+            self._queued[lane] += 1
+            self._dispatch()
+
+        try:
+            await request.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if request.granted:
+                    self._release_locked(user, lane)
+                else:
+                    request.cancelled = True
+                    self._queued[lane] -= 1
+            raise
+        wait = time.monotonic() - request.enqueued_at
+        metrics.observe(f"scheduler.queue_wait.{lane}", wait)
+        metrics.increment(f"scheduler.admitted.{lane}")
+        if wait > 1:
+            logger.info(f"{lane} request of user {user!r} waited {wait:.2f} seconds for a slot.")
+
+    def _release(self, user: str, lane: str) -> None:
+        with self._lock:
+            self._release_locked(user, lane)
+
+    def _release_locked(self, user: str, lane: str) -> None:
+        self._running[lane] -= 1
+        self._running_per_user[user] -= 1
+        if not self._running_per_user[user]:
+            del self._running_per_user[user]
+            # Idle users don't keep credit: their next request starts at the current virtual time.
+            finish_times = self._finish_times[lane]
+            if finish_times.get(user, 0.0) <= self._virtual_time[lane]:
+                finish_times.pop(user, None)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        # Called with the lock held: start waiting requests while there are free slots.
+        while sum(self._running.values()) < self.max_concurrency:
+            request = self._next_request()
+            if request is None:
+                return
+            request.granted = True
+            self._queued[request.lane] -= 1
+            self._running[request.lane] += 1
+            self._running_per_user[request.user] = self._running_per_user.get(request.user, 0) + 1
+            self._virtual_time[request.lane] = max(self._virtual_time[request.lane], request.start)
+            request.loop.call_soon_threadsafe(_wake_up, request.future)
+
+    def _next_request(self) -> _Request | None:
+        for lane in LANES:
+            if lane == "batch" and self._running[lane] >= self.batch_max_concurrency:
+                continue
+            queue, skipped, found = self._queues[lane], [], None
+            while queue:
+                entry = heapq.heappop(queue)
+                request = entry[2]
+                if request.cancelled:
+                    continue
+                if self._running_per_user.get(request.user, 0) >= self.max_per_user:
+                    skipped.append(entry)
+                    continue
+                found = request
+                break
+            for entry in skipped:
+                heapq.heappush(queue, entry)
+            if found is not None:
+                return found
+        return None
+
+    def stats(self) -> dict:
+        """
+        Return the number of running and queued chat loops per lane, and of active users.
+        """
+        with self._lock:
+            return {
+                "running": dict(self._running),
+                "queued": dict(self._queued),
+                "active_users": len(self._running_per_user),
+            }
+
+
+def _wake_up(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+@cache
+def get_scheduler() -> FairScheduler:
+    """
+    Return the scheduler shared by every chat request of the process.
+    """
+    return FairScheduler(user_weights=parse_user_weights(SCHEDULER_USER_WEIGHTS))
@@ -0,0 +1,65 @@
+import threading
+from typing import Any, Callable, Hashable
+
+import src.metrics as metrics
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    While a call for a key is in flight, further calls for the same key wait for it
+    and receive its result (or its exception) instead of repeating the work.
+
+    Every instance counts its executions and coalesced calls in `src.metrics`
+    under "singleflight.<name>.calls" and "singleflight.<name>.coalesced".
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` unless a call with the same key is already in flight,
+        in which case wait for that call and return its result.
+
+        :param key: Identifies calls that are interchangeable.
+        :param fn: Function to execute.
+        :return: The result of the (possibly shared) call.
+        :raises: Whatever exception the shared call raised.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            metrics.increment(f"singleflight.{self.name}.coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.increment(f"singleflight.{self.name}.calls")
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -1,8 +1,20 @@
 
-import src.mock_api as mock_api
-from src.utils import DirectReturnException, query_product_database
+import os
+
+import src.order_client as order_client
+from src.cache import MemoizePolicy, memoize
+from src.utils import (
+    SQL_MAX_ROWS,
+    DirectReturnException,
+    get_catalog_version,
+    query_product_database,
+)
 from src.vectorstore import retrieve_relevant_products
 
+# Set to false to run every tool call against the data.
+TOOL_CACHE_ENABLED = os.environ.get("TOOL_CACHE_ENABLED", "true").lower() == "true"
+TOOL_CACHE_TTL = float(os.environ.get("TOOL_CACHE_TTL", "600"))
+
 
 def get_customer_id(message: str):
     data = {"role": "assistant", "content": f"Please provider your Customer ID: {message}"}
@@ -220,7 +232,7 @@ product_dataset_tools = [
         "type": "function",
         "function": {
             "name": "query_product_database",
-            "description": "Quries the product database using SQL. The database has the following table:```sql\nCREATE TABLE products (\n\tmain_category TEXT, \n\ttitle TEXT, \n\taverage_rating FLOAT, \n\trating_number BIGINT, \n\tfeatures TEXT, \n\tdescription TEXT, \n\tprice TEXT, \n\tstore TEXT, \n\tcategories TEXT, \n\tdetails TEXT, \n\tparent_asin TEXT\n)```",
+            "description": "Quries the product database using SQL. The database has the following tables:```sql\nCREATE TABLE products (\n\tmain_category TEXT, \n\ttitle TEXT, \n\taverage_rating FLOAT, \n\trating_number BIGINT, \n\tfeatures TEXT, \n\tdescription TEXT, \n\tprice REAL, -- in USD, NULL if unknown\n\tstore TEXT, \n\tcategories TEXT, \n\tdetails TEXT, \n\tparent_asin TEXT, \n\trewritten_description TEXT\n)\nCREATE TABLE product_categories ( -- one row per category of a product\n\tparent_asin TEXT, \n\tposition INTEGER, -- 0 is the broadest category\n\tcategory TEXT\n)\nCREATE TABLE product_details ( -- one row per detail of a product, e.g. name='Brand'\n\tparent_asin TEXT, \n\tname TEXT, \n\tvalue TEXT\n)\nCREATE TABLE product_cards ( -- compact summary of every product\n\tparent_asin TEXT PRIMARY KEY, \n\tcard TEXT, -- JSON with the title, price, rating, store and a short description\n\ttoken_count INTEGER\n)```\nTo show products to the user, select their `card` (joined on parent_asin) rather than the long description, features, details and categories columns.\nprice, average_rating, main_category, store, parent_asin, product_categories.category and product_details (name, value) are indexed: compare them directly (e.g. `price < 20`, `category = 'Strings'`) and join the side tables on parent_asin.\n\nQueries are limited in run time, and at most " + str(SQL_MAX_ROWS) + " rows are returned (a final `note` row says when a result was truncated); if a query is rejected, the error explains how to rewrite it.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -229,7 +241,7 @@ product_dataset_tools = [
                         "description": "The sql query to run against the SQLite database. Must be in the SQLite format.",
                     }
                 },
-                "required": ["user_query"],
+                "required": ["sql_query"],
                 "additionalProperties": False,
             },
         },
@@ -238,14 +250,38 @@ product_dataset_tools = [
         "type": "function",
         "function": {
             "name": "retrieve_relevant_products",
-            "description": "Performs semantic search across a database of product description using the provided query. Use this to search for products using their description or their features.",
+            "description": "Performs semantic search across a database of product description using the provided query. Use this to search for products using their description or their features. The optional filters restrict the search to matching products, so there's no need to filter the results with another query.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "query": {
                         "type": "string",
                         "description": "The query that will be fed into the semantic search engine. Should be a description of the product, its name or its features.",
-                    }
+                    },
+                    "min_price": {
+                        "type": "number",
+                        "description": "Only return products costing at least this much (USD). Optional",
+                    },
+                    "max_price": {
+                        "type": "number",
+                        "description": "Only return products costing at most this much (USD). Optional",
+                    },
+                    "min_rating": {
+                        "type": "number",
+                        "description": "Only return products with at least this average rating (1 to 5). Optional",
+                    },
+                    "min_rating_number": {
+                        "type": "integer",
+                        "description": "Only return products with at least this many ratings. Optional",
+                    },
+                    "main_category": {
+                        "type": "string",
+                        "description": "Only return products of this main category, e.g. 'Musical Instruments'. Optional",
+                    },
+                    "store": {
+                        "type": "string",
+                        "description": "Only return products sold by this store or brand, e.g. 'Ernie Ball'. Optional",
+                    },
                 },
                 "required": ["query"],
                 "additionalProperties": False,
@@ -254,18 +290,60 @@ product_dataset_tools = [
     },
 ]
 
-llm_tools_map = {
-    "get_all_data": mock_api.get_all_data,
-    "get_customer_data": mock_api.get_customer_data,
-    "get_product_category_data": mock_api.get_product_category_data,
-    "get_orders_by_priority": mock_api.get_orders_by_priority,
-    "get_total_sales_by_category": mock_api.get_total_sales_by_category,
-    "get_high_profit_products": mock_api.get_high_profit_products,
-    "get_shipping_cost_summary": mock_api.get_shipping_cost_summary,
-    "get_profit_by_gender": mock_api.get_profit_by_gender,
+tool_functions = {
+    "get_all_data": order_client.get_all_data,
+    "get_customer_data": order_client.get_customer_data,
+    "get_product_category_data": order_client.get_product_category_data,
+    "get_orders_by_priority": order_client.get_orders_by_priority,
+    "get_total_sales_by_category": order_client.get_total_sales_by_category,
+    "get_high_profit_products": order_client.get_high_profit_products,
+    "get_shipping_cost_summary": order_client.get_shipping_cost_summary,
+    "get_profit_by_gender": order_client.get_profit_by_gender,
     "get_customer_id": get_customer_id,
     "query_product_database": query_product_database,
     "retrieve_relevant_products": retrieve_relevant_products
     # "handle_order_query": handle_order_query,
     # "handle_product_query": handle_product_query,
 }
+
+# Deterministic tools are memoized per arguments and version of the dataset they read.
+# `get_customer_id` depends on the request and `retrieve_relevant_products` has its own
+# caches, so they are not memoized.
+tool_cache_policies = {
+    "get_all_data": MemoizePolicy(
+        version=order_client.order_data_version, maxsize=1, ttl=TOOL_CACHE_TTL
+    ),
+    "get_customer_data": MemoizePolicy(
+        version=order_client.order_data_version, maxsize=1024, ttl=TOOL_CACHE_TTL
+    ),
+    "get_product_category_data": MemoizePolicy(
+        version=order_client.order_data_version, maxsize=16, ttl=TOOL_CACHE_TTL
+    ),
+    "get_orders_by_priority": MemoizePolicy(
+        version=order_client.order_data_version, maxsize=64, ttl=TOOL_CACHE_TTL
+    ),
+    "get_total_sales_by_category": MemoizePolicy(
+        version=order_client.order_data_version, maxsize=1, ttl=TOOL_CACHE_TTL
+    ),
+    "get_high_profit_products": MemoizePolicy(
+        version=order_client.order_data_version, maxsize=64, ttl=TOOL_CACHE_TTL
+    ),
+    "get_shipping_cost_summary": MemoizePolicy(
+        version=order_client.order_data_version, maxsize=1, ttl=TOOL_CACHE_TTL
+    ),
+    "get_profit_by_gender": MemoizePolicy(
+        version=order_client.order_data_version, maxsize=1, ttl=TOOL_CACHE_TTL
+    ),
+    "query_product_database": MemoizePolicy(
+        version=get_catalog_version, maxsize=512, ttl=TOOL_CACHE_TTL
+    ),
+}
+
+llm_tools_map = {
+    name: (
+        memoize(f"tool.{name}", fn, tool_cache_policies[name])
+        if TOOL_CACHE_ENABLED and name in tool_cache_policies
+        else fn
+    )
+    for name, fn in tool_functions.items()
+}
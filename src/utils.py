@@ -1,33 +1,266 @@
+import contextvars
 import json
 import logging
 import os
+import re
 import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from contextlib import closing
+from functools import cache
 from pathlib import Path
 
-import src.models as models
+import src.metrics as metrics
+from src.conversation import ChatMessage, Conversation
+
+
+# Read-only connections memory-map up to this many bytes of the product database, so that
+# every worker process reads the same pages of the OS page cache instead of its own copy.
+PRODUCT_DB_MMAP_SIZE = int(os.environ.get("PRODUCT_DB_MMAP_SIZE", str(256 * 1024**2)))
+
+# Limits applied to the SQL written by the LLM (see `query_product_database`).
+SQL_QUERY_TIMEOUT = float(os.environ.get("SQL_QUERY_TIMEOUT", "2"))
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", "100"))
+# Tables with fewer rows than this may always be scanned in full.
+SQL_FULL_SCAN_MIN_ROWS = int(os.environ.get("SQL_FULL_SCAN_MIN_ROWS", "1000"))
+# Number of SQLite VM instructions between two checks of the query deadline.
+SQL_PROGRESS_INTERVAL = 10000
+# Threads running the tool calls of chat requests that have a deadline.
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", "32"))
+TOOL_TIMEOUT_MESSAGE = (
+    "Not completed: the time budget of this request ran out while this tool was running. "
+    "Answer the user with the information gathered so far."
+)
+
+_product_db_connections = threading.local()
+_FULL_SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+# The tables a query reads, with their alias if any: query plans name the alias, not the table.
+_TABLE_REFERENCE_PATTERN = re.compile(
+    r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE
+)
+# The WHERE and ON conditions of a query, i.e. the parts an index could serve.
+_FILTER_CLAUSE_PATTERN = re.compile(
+    r"\b(?:WHERE|ON)\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bUNION\b|\bJOIN\b|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _dict_row_factory(cursor: sqlite3.Cursor, row: tuple) -> dict:
+    return {col[0]: row[i] for i, col in enumerate(cursor.description)}
+
+
+def get_product_db_connection(
+    db_url: str = "data/products_information.db",
+) -> sqlite3.Connection:
+    """
+    Return this thread's read-only connection to the product database, opening it if needed.
+
+    Connections are reused across queries and reopened when the database file has been replaced.
+
+    :param db_url: URL to the database file, defaults to "data/products_information.db".
+    :return: A read-only connection that returns rows as dictionaries.
+    """
+    connections = _product_db_connections.__dict__
+    stat = os.stat(db_url)
+    file_version = (stat.st_ino, stat.st_mtime_ns)
+    cached = connections.get(db_url)
+    if cached is not None:
+        connection, version = cached
+        if version == file_version:
+            return connection
+        connection.close()
+
+    connection = sqlite3.connect(f"file:{db_url}?mode=ro", uri=True)
+    connection.execute(f"PRAGMA mmap_size = {PRODUCT_DB_MMAP_SIZE}")
+    connection.row_factory = _dict_row_factory
+    connections[db_url] = (connection, file_version)
+    return connection
+
+
+def execute_product_query(
+    sql_query: str, db_url: str = "data/products_information.db", params: tuple = ()
+) -> list[dict]:
+    """
+    Execute a trusted read-only SQL query on the product database and return the results.
+
+    :param sql_query: SQL query string to execute.
+    :param db_url: URL to the database file, defaults to "data/products_information.db".
+    :param params: Values for the `?` placeholders in the query, if any.
+    :return: List of rows as dictionaries.
+    """
+    connection = get_product_db_connection(db_url)
+    with closing(connection.cursor()) as cursor:
+        rows = cursor.execute(sql_query, params).fetchall()
+    return rows
+
+
+class QueryRejectedError(Exception):
+    """
+    Exception raised when a generated SQL query is refused or aborted by the guarded executor.
+
+    The message explains the reason, so that the LLM can rewrite its query.
+    """
+
+
+def _indexed_columns(connection: sqlite3.Connection, table_name: str) -> set[str]:
+    columns = set()
+    for index in connection.execute(f'PRAGMA index_list("{table_name}")').fetchall():
+        leading_column = connection.execute(
+            f'PRAGMA index_info("{index["name"]}")'
+        ).fetchone()
+        if leading_column and leading_column["name"]:
+            columns.add(leading_column["name"])
+    return columns
+
+
+def _table_size(connection: sqlite3.Connection, table_name: str) -> int:
+    # Row count recorded by ANALYZE (also covers WITHOUT ROWID tables), else counted up to the
+    # threshold that matters.
+    try:
+        row = connection.execute(
+            "SELECT MAX(CAST(stat AS INTEGER)) AS size FROM sqlite_stat1 WHERE tbl = ?",
+            (table_name,),
+        ).fetchone()
+        if row["size"]:
+            return row["size"]
+    except sqlite3.OperationalError:
+        pass
+    try:
+        row = connection.execute(
+            f'SELECT COUNT(*) AS size FROM (SELECT 1 FROM "{table_name}" LIMIT ?)',
+            (SQL_FULL_SCAN_MIN_ROWS,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row["size"]
+
+
+def _table_aliases(sql_query: str) -> dict[str, str]:
+    aliases = {}
+    for table_name, alias in _TABLE_REFERENCE_PATTERN.findall(sql_query):
+        aliases[table_name.lower()] = table_name
+        if alias:
+            aliases[alias.lower()] = table_name
+    return aliases
+
+
+def check_query_plan(connection: sqlite3.Connection, sql_query: str, params: tuple = ()):
+    """
+    Reject a query whose plan scans a large table in full although one of the columns its
+    WHERE or ON conditions filter on is indexed, i.e. when a better access path is available.
+
+    :param connection: Connection to the database the query will run on.
+    :param sql_query: SQL query string to check.
+    :param params: Values for the `?` placeholders in the query, if any.
+    :raises QueryRejectedError: If the plan contains such a full scan.
+    """
+    plan = connection.execute(f"EXPLAIN QUERY PLAN {sql_query}", params).fetchall()
+    filter_clauses = " ".join(_FILTER_CLAUSE_PATTERN.findall(sql_query))
+    aliases = _table_aliases(sql_query)
+    for step in plan:
+        match = _FULL_SCAN_PATTERN.match(step["detail"])
+        if not match:
+            continue
+        table_name = aliases.get(match.group(1).lower(), match.group(1))
+        referenced_indexed_columns = sorted(
+            column
+            for column in _indexed_columns(connection, table_name)
+            if re.search(rf"\b{re.escape(column)}\b", filter_clauses, re.IGNORECASE)
+        )
+        if not referenced_indexed_columns:
+            continue
+        table_size = _table_size(connection, table_name)
+        if table_size >= SQL_FULL_SCAN_MIN_ROWS:
+            metrics.increment("sql.rejected.full_scan")
+            raise QueryRejectedError(
+                f"Query rejected: it scans all ~{table_size} rows of table '{table_name}' "
+                f"although the column(s) {referenced_indexed_columns} are indexed. Filter on "
+                "these columns directly (e.g. `column = value`, `IN (...)` or a range) instead "
+                "of wrapping them in functions, casts or leading-wildcard LIKE patterns."
+            )
 
 
 def query_product_database(
-    sql_query: str, db_url: str = "data/products_information.db"
+    sql_query: str,
+    db_url: str = "data/products_information.db",
+    params: tuple = (),
 ) -> list[dict]:
     """
-    Execute a read-only SQL query on the product database and return the results.
+    Execute a read-only SQL query written by the LLM on the product database, with guards.
+
+    The query plan is checked first (see `check_query_plan`) and the query is interrupted after
+    `SQL_QUERY_TIMEOUT` seconds. Only the first `SQL_MAX_ROWS` rows are returned, followed by
+    a `{"note": ...}` row telling the LLM the result was truncated if there were more.
 
     :param sql_query: SQL query string to execute.
     :param db_url: URL to the database file, defaults to "data/products_information.db".
+    :param params: Values for the `?` placeholders in the query, if any.
     :return: List of rows as dictionaries.
+    :raises QueryRejectedError: If the query is refused or times out; the message says why.
     """
-    with closing(sqlite3.connect(f"file:{db_url}?mode=ro", uri=True)) as connection:
-        connection.row_factory = lambda cursor, row: {
-            col[0]: row[i] for i, col in enumerate(cursor.description)
-        }
+    connection = get_product_db_connection(db_url)
+    check_query_plan(connection, sql_query, params)
+
+    deadline = time.monotonic() + SQL_QUERY_TIMEOUT
+    connection.set_progress_handler(
+        lambda: time.monotonic() > deadline, SQL_PROGRESS_INTERVAL
+    )
+    try:
         with closing(connection.cursor()) as cursor:
-            rows = cursor.execute(sql_query).fetchall()
+            rows = cursor.execute(sql_query, params).fetchmany(SQL_MAX_ROWS + 1)
+    except sqlite3.OperationalError as e:
+        if str(e) != "interrupted":
+            raise
+        metrics.increment("sql.rejected.timeout")
+        raise QueryRejectedError(
+            f"Query aborted: it ran for more than {SQL_QUERY_TIMEOUT:g} seconds. Avoid joins "
+            "without conditions and make the query more selective."
+        ) from None
+    finally:
+        connection.set_progress_handler(None, 0)
+
+    if len(rows) > SQL_MAX_ROWS:
+        metrics.increment("sql.truncated")
+        rows = rows[:SQL_MAX_ROWS]
+        rows.append(
+            {
+                "note": f"Truncated to the first {SQL_MAX_ROWS} rows. Add a LIMIT, filter the "
+                "rows further or aggregate them (COUNT, AVG, GROUP BY ...) to see the rest."
+            }
+        )
     return rows
 
 
+def get_catalog_version(db_url: str = "data/products_information.db") -> int:
+    """
+    Return the version of the product catalog, stored as the database's `user_version`.
+
+    The version is bumped whenever products or their embeddings are (re)ingested, and
+    is part of every cache key derived from the catalog.
+
+    :param db_url: URL to the database file, defaults to "data/products_information.db".
+    :return: The current catalog version.
+    """
+    connection = get_product_db_connection(db_url)
+    return connection.execute("PRAGMA user_version").fetchone()["user_version"]
+
+
+def bump_catalog_version(db_url: str = "data/products_information.db") -> int:
+    """
+    Increment the catalog version so that every cache derived from the catalog is invalidated.
+
+    :param db_url: URL to the database file, defaults to "data/products_information.db".
+    :return: The new catalog version.
+    """
+    with closing(sqlite3.connect(db_url, isolation_level=None)) as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        version = connection.execute("PRAGMA user_version").fetchone()[0] + 1
+        connection.execute(f"PRAGMA user_version = {version}")
+        connection.execute("COMMIT")
+    return version
+
+
 class DirectReturnException(Exception):
     """
     Exception to be raised when an immediate return is necessary.
@@ -43,48 +276,118 @@ class DirectReturnException(Exception):
         return f"DirectReturnException(message={self.message!r})"
 
 
+@cache
+def get_tool_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool that runs the tool calls of chat requests with a deadline.
+
+    :return: The shared thread pool.
+    """
+    return ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+
 def handle_function_calls(
-    function_map: dict, response_message, messages: list[models.Message | dict]
-) -> list[models.Message | dict] | None:
+    function_map: dict,
+    response_message: ChatMessage,
+    messages: Conversation | list,
+    deadline: float | None = None,
+) -> Conversation | list:
     """
     Handle function tool calls and map them to actual function executions.
 
+    With a deadline, every call runs on the tool thread pool and is answered with
+    `TOOL_TIMEOUT_MESSAGE` if it hasn't returned by then. Calls that time out can't be
+    interrupted; they finish in the background and their result is dropped.
+
     :param function_map: A dictionary mapping function names to function objects.
-    :param response_message: The message containing tool call information.
-    :param messages: List to append results of function calls.
-    :return: Updated list of messages.
+    :param response_message: The assistant message containing the tool calls.
+    :param messages: Conversation (or list) to append the result of every call to.
+    :param deadline: Optional `time.monotonic()` time by which the calls must have returned.
+    :return: Updated conversation.
     :raises: Exception if no tool calls are present or if function mapping is not found.
     """
     if not response_message.tool_calls:
         raise ValueError("No tool calls found in the response message.")
 
     for tool_call in response_message.tool_calls:
-        function_name = tool_call.function.name
-        if function_name in function_map:
-            function_args = json.loads(tool_call.function.arguments)
-            print(f"Function arguments: {function_args}")
-
-            function_to_call = function_map[function_name]
-            try:
-                function_response = function_to_call(**function_args)
-            except DirectReturnException:
-                raise
-            except Exception as e:
-                function_response = str(e)
-
-            messages.append(
-                {
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": function_name,
-                    "content": str(function_response),
-                }
-            )
-            return messages
-        else:
+        function_name = tool_call.name
+        if function_name not in function_map:
             print(f"Function {function_name} not found.")
             raise KeyError(f"Function {function_name} not found in function map.")
 
+        function_args = json.loads(tool_call.arguments)
+        print(f"Function arguments: {function_args}")
+
+        function_to_call = function_map[function_name]
+        if deadline is not None:
+            # The call runs in a copy of this context (e.g. for speculative retrieval).
+            future = get_tool_executor().submit(
+                contextvars.copy_context().run, function_to_call, **function_args
+            )
+            done, _ = wait([future], timeout=max(deadline - time.monotonic(), 0))
+            if not done:
+                future.cancel()
+                metrics.increment("agent.tool_timeouts")
+                messages.append(ChatMessage.tool_result(tool_call, TOOL_TIMEOUT_MESSAGE))
+                continue
+            function_to_call, function_args = future.result, {}
+        try:
+            function_response = function_to_call(**function_args)
+        except DirectReturnException:
+            raise
+        except Exception as e:
+            function_response = str(e)
+
+        messages.append(ChatMessage.tool_result(tool_call, str(function_response)))
+    return messages
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket that spaces out calls to a rate-limited provider.
+
+    A rate of 0 (or less) disables limiting.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self._lock = threading.Lock()
+        self.set_rate(requests_per_minute=requests_per_minute, burst=burst)
+
+    def set_rate(self, requests_per_minute: float, burst: int = 1):
+        """
+        Change the allowed rate. Takes effect for the next call to `acquire`.
+
+        :param requests_per_minute: Maximum sustained number of calls per minute.
+        :param burst: Number of calls allowed back-to-back before spacing kicks in.
+        """
+        with self._lock:
+            self.requests_per_minute = requests_per_minute
+            self.burst = max(burst, 1)
+            self._tokens = float(self.burst)
+            self._updated_at = time.monotonic()
+
+    def acquire(self) -> float:
+        """
+        Block until the caller is allowed to make one call.
+
+        :return: Number of seconds spent waiting.
+        """
+        if self.requests_per_minute <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            rate_per_second = self.requests_per_minute / 60
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated_at) * rate_per_second
+            )
+            self._updated_at = now
+            # Reserve a token now, even if it goes negative, so waiters queue up in order.
+            self._tokens -= 1
+            wait_time = max(0.0, -self._tokens / rate_per_second)
+        if wait_time:
+            time.sleep(wait_time)
+        return wait_time
+
 
 def create_logger(logger_name: str, log_file: str, log_level: str) -> logging.Logger:
     """
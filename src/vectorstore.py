@@ -1,22 +1,137 @@
+import json
 import os
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from functools import cache
+from typing import TYPE_CHECKING
 
-from qdrant_client import QdrantClient
+import numpy as np
 
+import src.metrics as metrics
+from src.cache import TTLCache
 from src.emb import embed_query
-from src.utils import create_logger, log_execution_time, query_product_database
+from src.resilience import Dependency
+from src.singleflight import SingleFlight
+from src.utils import (
+    create_logger,
+    execute_product_query,
+    get_catalog_version,
+    log_execution_time,
+)
+
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Filter, ScoredPoint, SearchParams
 
 COLLECTION_NAME = os.environ.get("QDRANT_COLLECTION_NAME", "products_information")
+RETRIEVAL_CACHE_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", "300"))
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", "4096"))
+# Search-time HNSW beam width (higher = better recall, slower); unset uses the collection's `ef_construct`.
+QDRANT_HNSW_EF = os.environ.get("QDRANT_HNSW_EF")
+QDRANT_HNSW_EF = int(QDRANT_HNSW_EF) if QDRANT_HNSW_EF else None
+# For quantized collections: re-score the candidates with the original vectors, and how many
+# more candidates than `limit` to fetch for that.
+QDRANT_QUANTIZATION_RESCORE = os.environ.get("QDRANT_QUANTIZATION_RESCORE", "true").lower() == "true"
+QDRANT_QUANTIZATION_OVERSAMPLING = os.environ.get("QDRANT_QUANTIZATION_OVERSAMPLING")
+QDRANT_QUANTIZATION_OVERSAMPLING = (
+    float(QDRANT_QUANTIZATION_OVERSAMPLING) if QDRANT_QUANTIZATION_OVERSAMPLING else None
+)
+# Number of candidates fetched from Qdrant, and number of products returned to the LLM.
+RETRIEVAL_LIMIT = int(os.environ.get("RETRIEVAL_LIMIT", "10"))
+RETRIEVAL_TOP_N = int(os.environ.get("RETRIEVAL_TOP_N", "3"))
+# Set to a value in [0, 1] to rerank the candidates with maximal marginal relevance:
+# 1 ranks by relevance only, lower values favour products unlike the ones already picked.
+RETRIEVAL_MMR_LAMBDA = os.environ.get("RETRIEVAL_MMR_LAMBDA")
+RETRIEVAL_MMR_LAMBDA = float(RETRIEVAL_MMR_LAMBDA) if RETRIEVAL_MMR_LAMBDA else None
+# Artificial delay before returning products, to stay under strict LLM provider rate limits.
+RETRIEVAL_THROTTLE_SECONDS = float(os.environ.get("RETRIEVAL_THROTTLE_SECONDS", "0"))
+# "card" returns the compact product cards precomputed by `scripts/create_sqlite_database.py`,
+# "full" returns every column of the products table (long descriptions, details and categories).
+PRODUCT_RESULT_FORMAT = os.environ.get("PRODUCT_RESULT_FORMAT", "card")
+# Embed and search the latest user message while the first completion is generated (see
+# `start_speculative_retrieval`). A retrieval tool call uses that result if at least
+# `SPECULATION_MIN_OVERLAP` of its query words appear in the user message.
+SPECULATIVE_RETRIEVAL = os.environ.get("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+SPECULATION_MIN_OVERLAP = float(os.environ.get("SPECULATION_MIN_OVERLAP", "0.8"))
+SPECULATION_WORKERS = int(os.environ.get("SPECULATION_WORKERS", "4"))
+# Seconds after which an embedding or a vector search is given up, and the retrieval degrades
+# to the last result of the query (kept for RETRIEVAL_STALE_TTL seconds) or to keyword search.
+EMBEDDING_TIMEOUT_SECONDS = float(os.environ.get("EMBEDDING_TIMEOUT_SECONDS", "5"))
+QDRANT_TIMEOUT_SECONDS = float(os.environ.get("QDRANT_TIMEOUT_SECONDS", "3"))
+RETRIEVAL_STALE_TTL = float(os.environ.get("RETRIEVAL_STALE_TTL", "86400"))
 
 logger = create_logger(logger_name="vectorstore", log_file="api.log", log_level="info")
 
+# Concurrent identical retrievals share one in-flight embedding, search and hydration.
+embedding_flight = SingleFlight(name="embed_query")
+search_flight = SingleFlight(name="vector_search")
+hydration_flight = SingleFlight(name="product_hydration")
+
+# Level 1 maps a normalized query to its ranked ASINs, level 2 maps an ASIN to its product record.
+# Both are emptied when the catalog version changes.
+query_cache = TTLCache(
+    name="retrieval_query", maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL
+)
+product_cache = TTLCache(name="product_detail", maxsize=PRODUCT_CACHE_SIZE)
+# Last ranked ASINs of every query, across catalog versions, served when vector search fails.
+stale_query_cache = TTLCache(
+    name="retrieval_stale", maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_STALE_TTL
+)
+
+# The remote services retrieval depends on, each with a timeout, hedging and a circuit breaker.
+embedding_dependency = Dependency(name="embedding", timeout=EMBEDDING_TIMEOUT_SECONDS)
+qdrant_dependency = Dependency(name="qdrant", timeout=QDRANT_TIMEOUT_SECONDS)
+_cached_catalog_version: int | None = None
+
+
+@dataclass
+class SpeculativeRetrieval:
+    """
+    A retrieval started on the user's message before the LLM asked for it.
+
+    Attributes:
+        query (str): The normalized user message.
+        words (set[str]): The words of `query`, to match tool queries against.
+        future (Future): Resolves to the query embedding and the ranked ASINs (unfiltered).
+        hits (int): Number of tool calls that used this result.
+    """
+
+    query: str
+    words: set[str]
+    future: Future
+    hits: int = 0
+
+
+_speculation: ContextVar[SpeculativeRetrieval | None] = ContextVar(
+    "speculative_retrieval", default=None
+)
 
-def get_qdrant_client() -> QdrantClient:
+
+@cache
+def get_qdrant_client() -> "QdrantClient":
     """
     Initialize and return a Qdrant client using provided configuration from environment variables.
 
+    The client is created (and `qdrant_client` imported) on first use, then shared
+    by every retrieval so that its connection pool is reused. If `QDRANT_SNAPSHOT_PATH` is
+    set, the embedding snapshot in that directory (see `scripts/ingest_embeddings.py
+    --export-snapshot`) is loaded into an in-memory index instead of using a Qdrant server.
+
     Returns:
         QdrantClient: An instance of QdrantClient connected to the specified Qdrant server.
     """
+    from qdrant_client import QdrantClient
+
+    QDRANT_SNAPSHOT_PATH = os.environ.get("QDRANT_SNAPSHOT_PATH")
+    if QDRANT_SNAPSHOT_PATH:
+        from src.embedding_snapshot import load_in_memory_index
+
+        logger.info(f"Loading the embedding snapshot {QDRANT_SNAPSHOT_PATH} in memory.")
+        return load_in_memory_index(QDRANT_SNAPSHOT_PATH, COLLECTION_NAME)
     QDRANT_URL = os.environ.get(
         "QDRANT_URL",
         "https://a15c0e2e-c3d5-4404-add5-4042e47fbb25.europe-west3-0.gcp.cloud.qdrant.io:6333",
@@ -25,50 +140,569 @@ def get_qdrant_client() -> QdrantClient:
     return client
 
 
+@cache
+def get_search_params() -> "SearchParams":
+    """
+    Build the search parameters of every vector search from the `QDRANT_*` settings.
+
+    Returns:
+        SearchParams: The HNSW and quantization search parameters.
+    """
+    from qdrant_client import models
+
+    return models.SearchParams(
+        hnsw_ef=QDRANT_HNSW_EF,
+        quantization=models.QuantizationSearchParams(
+            rescore=QDRANT_QUANTIZATION_RESCORE,
+            oversampling=QDRANT_QUANTIZATION_OVERSAMPLING,
+        ),
+    )
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so that trivially different phrasings share work and cache entries.
+
+    The normalized query is only a key: the query itself is what gets embedded, since case
+    matters for brand names, model numbers and acronyms.
+
+    Args:
+        query (str): The raw search query.
+
+    Returns:
+        str: The query lower-cased, with surrounding and repeated whitespace removed.
+    """
+    return " ".join(query.split()).casefold()
+
+
+def build_payload_filter(filters: dict | None) -> "Filter | None":
+    """
+    Translate product filters into a Qdrant payload filter applied inside the ANN search.
+
+    Args:
+        filters (dict | None): Any of `min_price`, `max_price`, `min_rating`,
+                               `min_rating_number`, `main_category` and `store`.
+                               Keys with a None value are ignored.
+
+    Returns:
+        Filter | None: The payload filter, or None if there is nothing to filter on.
+    """
+    from qdrant_client import models
+
+    filters = {
+        key: value for key, value in (filters or {}).items() if value is not None
+    }
+    conditions = []
+    if "min_price" in filters or "max_price" in filters:
+        conditions.append(
+            models.FieldCondition(
+                key="price",
+                range=models.Range(
+                    gte=filters.get("min_price"), lte=filters.get("max_price")
+                ),
+            )
+        )
+    if "min_rating" in filters:
+        conditions.append(
+            models.FieldCondition(
+                key="average_rating", range=models.Range(gte=filters["min_rating"])
+            )
+        )
+    if "min_rating_number" in filters:
+        conditions.append(
+            models.FieldCondition(
+                key="rating_number",
+                range=models.Range(gte=filters["min_rating_number"]),
+            )
+        )
+    for key in ("main_category", "store"):
+        if key in filters:
+            conditions.append(
+                models.FieldCondition(
+                    key=key, match=models.MatchValue(value=filters[key])
+                )
+            )
+    return models.Filter(must=conditions) if conditions else None
+
+
+def search_products(
+    query_embeddings: list[float],
+    limit: int = RETRIEVAL_LIMIT,
+    with_vectors: bool = False,
+    filters: dict | None = None,
+) -> list["ScoredPoint"]:
+    """
+    Run a vector search and return the matching points, best match first.
+
+    Args:
+        query_embeddings (list[float]): The embedding of the search query.
+        limit (int): Maximum number of points to return.
+        with_vectors (bool): Whether to return the stored vectors too (needed for MMR).
+        filters (dict | None): Product filters applied inside the search (see `build_payload_filter`).
+
+    Returns:
+        list[ScoredPoint]: The matching points with their payload and score.
+    """
+    search_result = qdrant_dependency.call(
+        get_qdrant_client().query_points,
+        collection_name=COLLECTION_NAME,
+        query=query_embeddings,
+        query_filter=build_payload_filter(filters),
+        search_params=get_search_params(),
+        with_payload=True,
+        with_vectors=with_vectors,
+        limit=limit,
+    ).points
+    logger.debug(f"{search_result=}")
+    return search_result
+
+
+def embed_search_query(query: str) -> list[float]:
+    """
+    Embed a search query through the embedding service's timeout, hedging and circuit breaker.
+    """
+    return embedding_dependency.call(embed_query, query=query)
+
+
+def mmr_rerank(
+    query_embeddings: list[float],
+    candidate_vectors: list[list[float]],
+    top_n: int,
+    mmr_lambda: float,
+) -> list[int]:
+    """
+    Select `top_n` candidates with maximal marginal relevance (MMR).
+
+    Each step picks the candidate that maximises
+    `mmr_lambda * sim(query, candidate) - (1 - mmr_lambda) * max(sim(candidate, selected))`,
+    which skips near-duplicate variants of products that were already picked.
+
+    Args:
+        query_embeddings (list[float]): The embedding of the search query.
+        candidate_vectors (list[list[float]]): The embeddings of the candidates, best match first.
+        top_n (int): Number of candidates to select.
+        mmr_lambda (float): Trade-off between relevance (1) and diversity (0).
+
+    Returns:
+        list[int]: The indices of the selected candidates, in selection order.
+    """
+    vectors = np.array(candidate_vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    query = np.array(query_embeddings, dtype=np.float32)
+    query /= np.linalg.norm(query) + 1e-12
+
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    selected: list[int] = []
+    remaining = list(range(len(vectors)))
+    while remaining and len(selected) < top_n:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        selected.append(remaining.pop(int(np.argmax(scores))))
+    return selected
+
+
+def select_product_asins(
+    query_embeddings: list[float],
+    limit: int = RETRIEVAL_LIMIT,
+    top_n: int = RETRIEVAL_TOP_N,
+    mmr_lambda: float | None = RETRIEVAL_MMR_LAMBDA,
+    filters: dict | None = None,
+) -> list[str]:
+    """
+    Search for `limit` candidates and return the ASINs of the `top_n` products to show, best first.
+
+    Args:
+        query_embeddings (list[float]): The embedding of the search query.
+        limit (int): Number of candidates fetched from Qdrant.
+        top_n (int): Number of products to return.
+        mmr_lambda (float | None): If set, rerank the candidates with MMR instead of keeping the score order.
+        filters (dict | None): Product filters applied inside the search (see `build_payload_filter`).
+
+    Returns:
+        list[str]: The selected ASINs, without duplicates.
+    """
+    points = search_products(
+        query_embeddings,
+        limit=limit,
+        with_vectors=mmr_lambda is not None,
+        filters=filters,
+    )
+    # Several points may belong to the same product; keep the best-scoring one.
+    unique_points, seen_asins = [], set()
+    for point in points:
+        if point.payload["parent_asin"] not in seen_asins:
+            seen_asins.add(point.payload["parent_asin"])
+            unique_points.append(point)
+    if mmr_lambda is not None and len(unique_points) > top_n:
+        selected = mmr_rerank(
+            query_embeddings,
+            [point.vector for point in unique_points],
+            top_n=top_n,
+            mmr_lambda=mmr_lambda,
+        )
+        unique_points = [unique_points[i] for i in selected]
+    return [point.payload["parent_asin"] for point in unique_points[:top_n]]
+
+
+def refresh_catalog_version() -> int:
+    """
+    Read the current catalog version and empty the retrieval caches if it has changed.
+
+    Returns:
+        int: The current catalog version.
+    """
+    global _cached_catalog_version
+    catalog_version = get_catalog_version()
+    if catalog_version != _cached_catalog_version:
+        if _cached_catalog_version is not None:
+            logger.info(
+                f"Catalog version changed from {_cached_catalog_version} "
+                f"to {catalog_version}, clearing retrieval caches."
+            )
+        query_cache.clear()
+        product_cache.clear()
+        _cached_catalog_version = catalog_version
+    return catalog_version
+
+
+def fetch_products(asins: tuple[str, ...]) -> dict[str, dict]:
+    """
+    Fetch the product cards (or full records, see `PRODUCT_RESULT_FORMAT`) of the given ASINs
+    from the product database.
+
+    Args:
+        asins (tuple[str, ...]): The ASINs to look up.
+
+    Returns:
+        dict[str, dict]: The product record of every ASIN found, keyed by ASIN.
+    """
+    placeholders = ", ".join("?" * len(asins))
+    if PRODUCT_RESULT_FORMAT == "full":
+        rows = execute_product_query(
+            sql_query=f"SELECT * FROM products WHERE parent_asin IN ({placeholders})",
+            params=asins,
+        )
+        return {row["parent_asin"]: row for row in rows}
+    rows = execute_product_query(
+        sql_query=f"SELECT parent_asin, card FROM product_cards WHERE parent_asin IN ({placeholders})",
+        params=asins,
+    )
+    return {row["parent_asin"]: json.loads(row["card"]) for row in rows}
+
+
+def keyword_search_products(query: str, filters: dict | None, limit: int) -> list[str]:
+    """
+    Find products whose title or features contain words of the query, best match first, using
+    the full-text index of the product database. This is the degraded retrieval path for when
+    the embedding service or Qdrant is unavailable.
+
+    Args:
+        query (str): The normalized search query.
+        filters (dict | None): Product filters (see `build_payload_filter`), applied in SQL.
+        limit (int): Maximum number of products returned.
+
+    Returns:
+        list[str]: The ASINs of the products found.
+    """
+    words = query_words(query)
+    if not words:
+        return []
+    filters = filters or {}
+    conditions, params = ["products_fts MATCH ?"], [" OR ".join(f'"{word}"' for word in words)]
+    for key, condition in (
+        ("min_price", "p.price >= ?"),
+        ("max_price", "p.price <= ?"),
+        ("min_rating", "p.average_rating >= ?"),
+        ("min_rating_number", "p.rating_number >= ?"),
+        ("main_category", "p.main_category = ?"),
+        ("store", "p.store = ?"),
+    ):
+        if filters.get(key) is not None:
+            conditions.append(condition)
+            params.append(filters[key])
+    rows = execute_product_query(
+        sql_query=f"""
+            SELECT p.parent_asin FROM products_fts JOIN products AS p ON p.rowid = products_fts.rowid
+            WHERE {" AND ".join(conditions)}
+            ORDER BY products_fts.rank LIMIT ?
+        """,
+        params=(*params, limit),
+    )
+    return [row["parent_asin"] for row in rows]
+
+
+def degraded_retrieval(
+    query: str, filters: dict, top_n: int, stale_key: tuple, catalog_version: int
+) -> list[dict]:
+    """
+    Answer a retrieval without the embedding service and Qdrant: with the last result of the
+    same query if there is one, otherwise with keyword search.
+
+    Metrics: "retrieval.degraded.cache" and "retrieval.degraded.keyword" counters.
+    """
+    asins = stale_query_cache.get(stale_key)
+    if asins is not None:
+        metrics.increment("retrieval.degraded.cache")
+        return hydrate_products(asins, catalog_version)
+    metrics.increment("retrieval.degraded.keyword")
+    return hydrate_products(keyword_search_products(query, filters, limit=top_n), catalog_version)
+
+
+def hydrate_products(asins: list[str], catalog_version: int) -> list[dict]:
+    """
+    Return the product records of the given ASINs, in the same order, using the product cache.
+
+    Args:
+        asins (list[str]): The ASINs to hydrate.
+        catalog_version (int): The catalog version the records must belong to.
+
+    Returns:
+        list[dict]: One record per ASIN found in the product database.
+    """
+    products = {}
+    for asin in asins:
+        product = product_cache.get((catalog_version, asin))
+        if product is not None:
+            products[asin] = product
+
+    missing = tuple(asin for asin in dict.fromkeys(asins) if asin not in products)
+    if missing:
+        fetched = hydration_flight.do(
+            (catalog_version, missing), fetch_products, missing
+        )
+        for asin, product in fetched.items():
+            product_cache.set((catalog_version, asin), product)
+        products.update(fetched)
+
+    return [products[asin] for asin in dict.fromkeys(asins) if asin in products]
+
+
+@cache
+def get_speculation_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool that runs speculative retrievals.
+    """
+    return ThreadPoolExecutor(
+        max_workers=SPECULATION_WORKERS, thread_name_prefix="speculative-retrieval"
+    )
+
+
+def query_words(query: str) -> set[str]:
+    """
+    Split a normalized query into its set of words.
+    """
+    return set(re.findall(r"\w+", query))
+
+
+def _speculate(key: str, query: str) -> tuple[list[float], list[str]]:
+    query_embeddings = embedding_flight.do(key, embed_search_query, query)
+    asins = select_product_asins(query_embeddings)
+    return query_embeddings, asins
+
+
+def start_speculative_retrieval(message: str) -> Token | None:
+    """
+    Start embedding and searching `message` in the background, for the retrieval tool calls
+    made in the current context (see `retrieve_relevant_products`).
+
+    Args:
+        message (str): The latest user message.
+
+    Returns:
+        Token | None: Token to pass to `finish_speculative_retrieval`, or None if
+                      speculation is disabled or there is nothing to search.
+    """
+    key = normalize_query(message)
+    if not SPECULATIVE_RETRIEVAL or not key:
+        return None
+    future = get_speculation_executor().submit(_speculate, key, message)
+    metrics.increment("speculative.started")
+    return _speculation.set(
+        SpeculativeRetrieval(query=key, words=query_words(key), future=future)
+    )
+
+
+def finish_speculative_retrieval(token: Token | None) -> None:
+    """
+    Stop offering the speculative result of the current context and record whether it was used.
+
+    Args:
+        token (Token | None): The token returned by `start_speculative_retrieval`.
+    """
+    if token is None:
+        return
+    speculation = _speculation.get()
+    _speculation.reset(token)
+    if speculation is None:
+        return
+    speculation.future.cancel()
+    metrics.observe("speculative.hit_rate", 1.0 if speculation.hits else 0.0)
+
+
+def claim_speculative_retrieval(query: str) -> SpeculativeRetrieval | None:
+    """
+    Return the speculative retrieval of the current context if it matches `query`.
+
+    It matches if at least `SPECULATION_MIN_OVERLAP` of the words of `query` appear in the
+    speculated user message, which covers the LLM rephrasing the message into a shorter query.
+
+    Args:
+        query (str): The normalized query of the retrieval tool call.
+
+    Returns:
+        SpeculativeRetrieval | None: The matching speculation, or None.
+    """
+    speculation = _speculation.get()
+    if speculation is None:
+        return None
+    words = query_words(query)
+    overlap = len(words & speculation.words) / len(words) if words else 0.0
+    if overlap < SPECULATION_MIN_OVERLAP or speculation.future.cancelled():
+        metrics.increment("speculative.miss")
+        return None
+    speculation.hits += 1
+    metrics.increment("speculative.hit")
+    return speculation
+
+
+def speculative_asins(
+    query: str, filters: dict, limit: int, top_n: int
+) -> list[str] | None:
+    """
+    Rank products for `query` using the matching speculative retrieval, if there is one.
+
+    Args:
+        query (str): The normalized query of the retrieval tool call.
+        filters (dict): Product filters of the call (see `build_payload_filter`).
+        limit (int): Number of candidates fetched from the vector search.
+        top_n (int): Number of products returned.
+
+    Returns:
+        list[str] | None: The selected ASINs, or None if there is no usable speculation.
+    """
+    speculation = claim_speculative_retrieval(query)
+    if speculation is None:
+        return None
+    try:
+        query_embeddings, asins = speculation.future.result()
+    except Exception as e:
+        logger.warning(f"Speculative retrieval failed, retrieving normally: {e}")
+        return None
+    has_filters = any(value is not None for value in filters.values())
+    if has_filters or (limit, top_n) != (RETRIEVAL_LIMIT, RETRIEVAL_TOP_N):
+        # Only the embedding can be reused; search again with this call's parameters.
+        asins = select_product_asins(
+            query_embeddings, limit=limit, top_n=top_n, filters=filters
+        )
+    return asins
+
+
 @log_execution_time(logger=logger)
-def retrieve_relevant_products(query: str) -> list[dict]:
+def retrieve_relevant_products(
+    query: str,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    min_rating: float | None = None,
+    min_rating_number: int | None = None,
+    main_category: str | None = None,
+    store: str | None = None,
+    limit: int = RETRIEVAL_LIMIT,
+    top_n: int = RETRIEVAL_TOP_N,
+) -> list[dict]:
     """
     Retrieve the most relevant products to a given query using Qdrant vector search
     and then fetch additional details from the product database.
 
+    The optional price, rating, category and store filters are applied inside the vector
+    search on the typed payload fields, so they don't need a separate database query.
+
+    Only the `top_n` selected products are hydrated, and they are returned in ranking order
+    (vector score, or MMR if `RETRIEVAL_MMR_LAMBDA` is set), as compact product cards unless
+    `PRODUCT_RESULT_FORMAT` is "full".
+
+    The ranked ASINs of a normalized query are cached for `RETRIEVAL_CACHE_TTL` seconds and
+    product records are cached per ASIN, both for the current catalog version. On a miss,
+    concurrent calls with the same query, or resolving to the same products, are coalesced
+    so that only one of them hits the embedding service, Qdrant and SQLite. If a speculative
+    retrieval of the user's message matches the query, its embedding (and ranking, when no
+    filter is set) is used instead, and the result isn't cached under the query.
+
+    Calls to the embedding service and Qdrant time out, are hedged and go through circuit
+    breakers (see `src.resilience`). When they fail, the products are retrieved from the last
+    result of the query or, failing that, by keyword search (see `degraded_retrieval`).
+
     Args:
         query (str): The search query for which relevant products are to be retrieved.
+        min_price (float | None): Only return products costing at least this much.
+        max_price (float | None): Only return products costing at most this much.
+        min_rating (float | None): Only return products with at least this average rating.
+        min_rating_number (int | None): Only return products with at least this many ratings.
+        main_category (str | None): Only return products of this main category.
+        store (str | None): Only return products sold by this store.
+        limit (int): Number of candidates fetched from the vector search.
+        top_n (int): Number of products returned.
 
     Returns:
-        list[dict]: A list of dictionaries containing detailed information of relevant products.
+        list[dict]: The card (title, price, rating, store and short description) of every
+                    relevant product.
     """
-    vectorstore_client = get_qdrant_client()
+    # The normalized query keys the caches and coalesced calls; the query itself is embedded.
+    key = normalize_query(query)
+    filters = {
+        "min_price": min_price,
+        "max_price": max_price,
+        "min_rating": min_rating,
+        "min_rating_number": min_rating_number,
+        "main_category": main_category,
+        "store": store,
+    }
     try:
-        query_embeddings = embed_query(query=query)
-        search_result = vectorstore_client.query_points(
-            collection_name=COLLECTION_NAME,
-            query=query_embeddings,
-            with_payload=True,
-            limit=10,
-        ).points
-        logger.debug(f"{search_result=}")
-        asins = [point.payload["parent_asin"] for point in search_result]
+        catalog_version = refresh_catalog_version()
+        cache_key = (
+            catalog_version,
+            key,
+            tuple(filters.values()),
+            limit,
+            top_n,
+            RETRIEVAL_MMR_LAMBDA,
+        )
+        stale_key = cache_key[1:]
+        asins = query_cache.get(cache_key)
+        if asins is None:
+            # A speculative embedding may still need a vector search with this call's filters.
+            try:
+                asins = speculative_asins(key, filters=filters, limit=limit, top_n=top_n)
+                if asins is None:
+                    query_embeddings = embedding_flight.do(key, embed_search_query, query)
+                    asins = search_flight.do(
+                        cache_key,
+                        select_product_asins,
+                        query_embeddings,
+                        limit=limit,
+                        top_n=top_n,
+                        filters=filters,
+                    )
+                    query_cache.set(cache_key, asins)
+                    stale_query_cache.set(stale_key, asins)
+            except Exception as e:
+                logger.warning(f"Vector retrieval failed, degrading: {e!r}")
+                return degraded_retrieval(key, filters, top_n, stale_key, catalog_version)
         logger.info(f"Retrieved {len(asins)} relevant chunks.")
         if not asins:
             logger.info("No relevant ASINs found.")
             return []
 
         # Fetch product details from the database using the retrieved ASINs
-        retrieved_chunks = query_product_database(
-            sql_query=f"SELECT * FROM products WHERE parent_asin IN {tuple(asins)}"
-        )
-
-        # Throttle LLM request rate (remove this in production)
-        ## Begin
-        import time
+        retrieved_chunks = hydrate_products(asins, catalog_version)
 
-        time.sleep(10)
-        retrieved_chunks = retrieved_chunks[:3]
-        ## End
+        if RETRIEVAL_THROTTLE_SECONDS:
+            time.sleep(RETRIEVAL_THROTTLE_SECONDS)
 
         return retrieved_chunks
     except Exception as e:
         logger.exception(f"Failed to retrieve relevant context: {e}")
         raise
-    finally:
-        vectorstore_client.close()
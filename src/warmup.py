@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+import src.metrics as metrics
+from src.utils import create_logger
+
+# Warm-up steps run (in this order) before the worker reports itself ready on `/ready`.
+WARMUP_STEPS = os.environ.get(
+    "WARMUP_STEPS", "clients,product_db,order_data,retrieval"
+).split(",")
+# Synthetic product searches run by the "retrieval" step, separated by "|".
+WARMUP_QUERIES = os.environ.get(
+    "WARMUP_QUERIES", "guitar strings|microphone stand|drum sticks|keyboard"
+).split("|")
+PRODUCT_DB_PATH = "data/products_information.db"
+# Order tools without arguments, whose (memoized) results are the same for every user.
+WARMUP_ORDER_TOOLS = (
+    "get_total_sales_by_category",
+    "get_shipping_cost_summary",
+    "get_profit_by_gender",
+)
+
+logger = create_logger(logger_name="warmup", log_file="api.log", log_level="info")
+
+_lock = threading.Lock()
+_state = {"status": "pending", "steps": {}}
+
+
+def preload_dependencies():
+    """
+    Import the heavy client libraries and open their connection pools ahead of the first request.
+
+    Every client is independent, so a failing dependency only costs its own lazy load later.
+    """
+    from src.emb import get_embedding_client
+    from src.llm import get_client
+    from src.order_client import ORDER_TOOLS_MODE, get_order_client
+    from src.vectorstore import get_qdrant_client
+
+    # In remote mode the order service holds the dataset; only its client is needed here.
+    steps = [get_client, get_embedding_client, get_qdrant_client]
+    if ORDER_TOOLS_MODE == "remote":
+        steps.append(get_order_client)
+    for step in steps:
+        start_time = time.time()
+        try:
+            step()
+            logger.info(
+                f"Preloaded {step.__name__} in {time.time() - start_time:.4f} seconds"
+            )
+        except Exception as e:
+            logger.error(f"Failed to preload {step.__name__}: {e}")
+
+
+def warm_product_db():
+    """
+    Read the product database into the OS page cache, up to the memory-mapped size that
+    queries read it through, so that the first product queries don't wait on the disk.
+    """
+    from src.utils import PRODUCT_DB_MMAP_SIZE, execute_product_query
+
+    remaining = PRODUCT_DB_MMAP_SIZE
+    with open(PRODUCT_DB_PATH, "rb") as f:
+        while remaining > 0 and (chunk := f.read(min(remaining, 8 * 1024**2))):
+            remaining -= len(chunk)
+    execute_product_query("SELECT SUM(token_count) AS tokens FROM product_cards")
+
+
+def warm_order_data():
+    """
+    Load the order data (or open the connections to the order service) and fill the tool
+    cache with the results of the order tools that take no arguments.
+    """
+    from src.mock_api import get_order_data
+    from src.order_client import ORDER_TOOLS_MODE
+    from src.tools import llm_tools_map
+
+    if ORDER_TOOLS_MODE != "remote":
+        get_order_data()
+    for name in WARMUP_ORDER_TOOLS:
+        llm_tools_map[name]()
+
+
+def warm_retrieval():
+    """
+    Run synthetic product searches: the embedding service, Qdrant and the retrieval caches
+    see traffic, and the dependencies' latency windows get their first samples.
+    """
+    from src.vectorstore import retrieve_relevant_products
+
+    for query in WARMUP_QUERIES:
+        retrieve_relevant_products(query=query)
+
+
+STEPS = {
+    "clients": preload_dependencies,
+    "product_db": warm_product_db,
+    "order_data": warm_order_data,
+    "retrieval": warm_retrieval,
+}
+
+
+def run_warmup() -> None:
+    """
+    Run the configured warm-up steps, then mark the worker ready.
+
+    A failing step is logged and reported by `warmup_state` but doesn't block readiness:
+    the worker can still serve requests, they are just slower until the dependency recovers.
+    """
+    with _lock:
+        _state["status"] = "running"
+    start_time = time.monotonic()
+    for name in WARMUP_STEPS:
+        name = name.strip()
+        if not name:
+            continue
+        step_start = time.monotonic()
+        try:
+            STEPS[name]()
+            result = {"status": "ok"}
+        except Exception as e:
+            logger.error(f"Warm-up step {name!r} failed: {e!r}")
+            result = {"status": "failed", "error": repr(e)}
+        result["seconds"] = round(time.monotonic() - step_start, 3)
+        with _lock:
+            _state["steps"][name] = result
+    elapsed = time.monotonic() - start_time
+    metrics.observe("warmup.seconds", elapsed)
+    logger.info(f"Warm-up finished in {elapsed:.2f} seconds.")
+    mark_ready()
+
+
+def mark_ready() -> None:
+    """
+    Mark the worker ready without (or after) warming up.
+    """
+    with _lock:
+        _state["status"] = "ready"
+
+
+def is_ready() -> bool:
+    """
+    Return whether the warm-up has finished.
+    """
+    with _lock:
+        return _state["status"] == "ready"
+
+
+def warmup_state() -> dict:
+    """
+    Return the warm-up status ("pending", "running" or "ready") and the outcome of every step run.
+    """
+    with _lock:
+        return {"status": _state["status"], "steps": dict(_state["steps"])}
@@ -0,0 +1,4 @@
+import os
+
+# `src.llm` refuses to import without a chat model; tests never call the LLM.
+os.environ.setdefault("CHAT_MODEL", "test-model")
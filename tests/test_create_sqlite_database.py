@@ -0,0 +1,22 @@
+import sqlite3
+from contextlib import closing
+
+import polars as pl
+
+from create_sqlite_database import build_database
+
+DATASET_PATH = "data/product_information.parquet"
+
+
+def test_build_database_streams_several_batches(tmp_path):
+    dataset_path = tmp_path / "products.parquet"
+    pl.read_parquet(DATASET_PATH, n_rows=450).write_parquet(dataset_path, row_group_size=200)
+    db_path = tmp_path / "products.db"
+
+    build_database(str(dataset_path), str(db_path), "products", batch_size=100)
+
+    with closing(sqlite3.connect(db_path)) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 450
+        assert connection.execute("SELECT COUNT(*) FROM product_cards").fetchone()[0] == 450
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["products.db", "products.parquet"]
@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import src.emb as emb
+from src.emb import EmbeddingBatcher, estimate_tokens
+
+
+def fake_client(create):
+    return SimpleNamespace(embeddings=SimpleNamespace(create=create))
+
+
+def test_batcher_fails_every_caller_when_embeddings_are_missing(monkeypatch):
+    def create(input, **kwargs):
+        # One embedding short.
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[1.0]) for _ in input[1:]])
+
+    monkeypatch.setattr(emb, "get_embedding_client", lambda: fake_client(create))
+    batcher = EmbeddingBatcher(max_wait_ms=50, max_batch_size=8)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(batcher.embed, f"query {i}", timeout=5) for i in range(3)]
+        for future in futures:
+            with pytest.raises(ValueError, match="embeddings for"):
+                future.result(timeout=10)
+
+
+def test_batcher_splits_queries_by_token_budget(monkeypatch):
+    lock, requests = threading.Lock(), []
+
+    def create(input, **kwargs):
+        with lock:
+            requests.append(list(input))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[len(text)]) for text in input])
+
+    monkeypatch.setattr(emb, "get_embedding_client", lambda: fake_client(create))
+    batcher = EmbeddingBatcher(max_wait_ms=200, max_batch_size=8, max_batch_tokens=100)
+    texts = ["x" * 160 * (i + 1) for i in range(4)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        embeddings = list(executor.map(lambda text: batcher.embed(text, timeout=5), texts))
+
+    assert embeddings == [[len(text)] for text in texts]
+    for request in requests:
+        assert len(request) == 1 or sum(estimate_tokens(text) for text in request) <= 100
+
+
+def test_short_response_is_an_error_instead_of_misaligned_embeddings(monkeypatch):
+    def create(input, **kwargs):
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[1.0]) for _ in input[:-1]])
+
+    monkeypatch.setattr(emb, "get_embedding_client", lambda: fake_client(create))
+    with pytest.raises(ValueError, match="returned 2 embeddings for 3 texts"):
+        emb.batch_embed(["a", "b", "c"], batch_size=8)
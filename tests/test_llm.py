@@ -0,0 +1,86 @@
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import src.llm as llm
+import src.models as models
+from src.utils import TOOL_TIMEOUT_MESSAGE
+
+
+class FakeClient:
+    """
+    Chat client answering with scripted messages after a delay, honouring the request timeout.
+    """
+
+    def __init__(self, replies, delay=0.0):
+        self.replies = list(replies)
+        self.delay = delay
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, **options):
+        return self
+
+    def create(self, timeout=None, **request):
+        self.requests.append(request)
+        if timeout is not None and self.delay > timeout:
+            time.sleep(timeout)
+            raise openai.APITimeoutError(request=httpx.Request("POST", "http://llm"))
+        time.sleep(self.delay)
+        message = self.replies.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def reply(content=None, tool_calls=()):
+    return SimpleNamespace(role="assistant", content=content, tool_calls=list(tool_calls))
+
+
+def tool_call(name):
+    return SimpleNamespace(
+        id="call-1", function=SimpleNamespace(name=name, arguments=json.dumps({}))
+    )
+
+
+def thread(deadline_seconds):
+    return models.Thread(
+        messages=[models.Message(role="user", content="What did I order?")],
+        deadline_seconds=deadline_seconds,
+    )
+
+
+def test_completion_past_the_deadline_fails_the_request(monkeypatch):
+    monkeypatch.setattr(llm, "get_client", lambda: FakeClient([reply("late")], delay=5))
+
+    started_at = time.monotonic()
+    with pytest.raises(llm.DeadlineExceededError):
+        llm.handle_user_chat(thread(deadline_seconds=0.5))
+    assert time.monotonic() - started_at < 1.5
+
+
+def test_slow_tool_is_cut_off_to_leave_time_for_the_answer(monkeypatch):
+    client = FakeClient([reply(tool_calls=[tool_call("slow_tool")]), reply("partial answer")])
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    monkeypatch.setattr(llm, "AGENT_FINAL_ANSWER_SECONDS", 0.5)
+    monkeypatch.setitem(llm.llm_tools_map, "slow_tool", lambda: time.sleep(2))
+
+    started_at = time.monotonic()
+    message = llm.handle_user_chat(thread(deadline_seconds=1))
+
+    assert message.content == "partial answer"
+    assert time.monotonic() - started_at < 1.5
+    assert client.requests[-1]["messages"][-1]["content"] == TOOL_TIMEOUT_MESSAGE
+
+
+def test_thread_cannot_extend_the_server_budget(monkeypatch):
+    client = FakeClient([reply("late")], delay=5)
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    monkeypatch.setattr(llm, "AGENT_DEADLINE_SECONDS", 0.5)
+
+    started_at = time.monotonic()
+    with pytest.raises(llm.DeadlineExceededError):
+        llm.handle_user_chat(thread(deadline_seconds=1e9))
+    assert time.monotonic() - started_at < 1.5
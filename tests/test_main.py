@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+import src.main as main
+
+
+def test_batch_results_are_streamed_uncompressed(monkeypatch):
+    async def stream_batch(lines, concurrency):
+        for index, line in enumerate(lines):
+            yield {"type": "result", "index": index, "thread": json.loads(line)}
+
+    monkeypatch.setattr(main, "stream_batch", stream_batch)
+    boundary = "boundary"
+    lines = [json.dumps({"n": i}) for i in range(3)]
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="threads.jsonl"\r\n'
+        f"Content-Type: application/jsonl\r\n\r\n" + "\n".join(lines) + f"\r\n--{boundary}--\r\n"
+    ).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/chat/batch",
+        "raw_path": b"/chat/batch",
+        "query_string": b"",
+        "root_path": "",
+        "server": ("test", 80),
+        "client": ("test", 1234),
+        "headers": [
+            (b"host", b"test"),
+            (b"accept-encoding", b"gzip"),
+            (b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    }
+    sent, requests = [], [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(main.fastapi_app(scope, receive, send))
+
+    headers = dict(sent[0]["headers"])
+    assert headers[b"content-encoding"] == b"identity"
+    # Every record reaches the client as soon as it is yielded.
+    chunks = [message["body"] for message in sent[1:] if message.get("body")]
+    assert [json.loads(chunk)["index"] for chunk in chunks] == [0, 1, 2]
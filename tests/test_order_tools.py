@@ -0,0 +1,29 @@
+import os
+
+import polars as pl
+
+import src.mock_api as mock_api
+from src.tools import llm_tools_map
+
+ORDER_DATA_PATH = "data/order_data.parquet"
+
+
+def test_order_tools_cache_follows_a_glob_dataset(tmp_path, monkeypatch):
+    orders = pl.read_parquet(ORDER_DATA_PATH)
+    half = orders.height // 2
+    orders.head(half).write_parquet(tmp_path / "part-0.parquet")
+    orders.tail(orders.height - half).write_parquet(tmp_path / "part-1.parquet")
+    monkeypatch.setattr(mock_api, "ORDER_DATA_MODE", "lazy")
+    monkeypatch.setattr(mock_api, "DATASET_PATH", str(tmp_path / "*.parquet"))
+
+    summary = llm_tools_map["get_shipping_cost_summary"]()
+    assert summary == mock_api.get_shipping_cost_summary()
+
+    # Rewriting one file of the dataset changes the version, so the cached result is dropped.
+    version = mock_api.order_data_version()
+    orders.head(1).with_columns(pl.lit(10_000.0).alias("Shipping_Cost")).write_parquet(
+        tmp_path / "part-1.parquet"
+    )
+    os.utime(tmp_path / "part-1.parquet", ns=(0, 0))
+    assert mock_api.order_data_version() != version
+    assert llm_tools_map["get_shipping_cost_summary"]() != summary
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+import src.metrics as metrics
+from src.resilience import CircuitBreaker, CircuitOpenError, Dependency, DependencyTimeoutError
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def test_breaker_opens_after_consecutive_failures_and_half_opens_after_reset():
+    breaker = CircuitBreaker("test-breaker", failure_threshold=3, reset_seconds=0.1)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state()["state"] == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.15)
+    # Half-open: a single probe goes through.
+    assert breaker.allow()
+    assert breaker.state()["state"] == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state()["state"] == "open"
+
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state() == {"state": "closed", "consecutive_failures": 0}
+
+
+def test_dependency_fails_fast_once_its_breaker_is_open():
+    dependency = Dependency("test-failing", timeout=1)
+    dependency.breaker.failure_threshold = 2
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            dependency.call(fail)
+    with pytest.raises(CircuitOpenError):
+        dependency.call(fail)
+    assert metrics.get_counter("dependency.test-failing.rejected") == 1
+
+
+def test_dependency_times_out():
+    dependency = Dependency("test-slow", timeout=0.1)
+    with pytest.raises(DependencyTimeoutError):
+        dependency.call(time.sleep, 1)
+    assert metrics.get_counter("dependency.test-slow.timeouts") == 1
+
+
+def test_slow_call_is_hedged_past_the_latency_percentile():
+    dependency = Dependency("test-hedged", timeout=2, hedge_percentile=0.9)
+    for _ in range(50):
+        dependency.call(lambda: None)
+    assert dependency.hedge_delay() is not None
+
+    calls, lock = [], threading.Lock()
+
+    def first_call_is_slow():
+        with lock:
+            calls.append(len(calls))
+            slow = len(calls) == 1
+        time.sleep(1 if slow else 0)
+        return "slow" if slow else "hedged"
+
+    started_at = time.monotonic()
+    assert dependency.call(first_call_is_slow) == "hedged"
+    assert time.monotonic() - started_at < 0.5
+    assert metrics.get_counter("dependency.test-hedged.hedged") == 1
+    assert metrics.get_counter("dependency.test-hedged.hedge_won") == 1
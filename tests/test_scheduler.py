@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from src.scheduler import FairScheduler
+
+
+async def hold(scheduler, user, lane, started, release):
+    async with scheduler.slot(user, lane=lane):
+        started.append((user, lane))
+        await release.wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_per_user_cap_lets_other_users_through():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=3, max_per_user=1, batch_max_concurrency=3)
+        started, release = [], asyncio.Event()
+        tasks = [
+            asyncio.create_task(hold(scheduler, user, "interactive", started, release))
+            for user in ("alice", "alice", "alice", "bob")
+        ]
+        await settle()
+        assert sorted(started) == [("alice", "interactive"), ("bob", "interactive")]
+        assert scheduler.stats()["queued"]["interactive"] == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        assert len(started) == 4
+
+    asyncio.run(main())
+
+
+def test_interactive_requests_go_before_batch_requests():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, max_per_user=4, batch_max_concurrency=1)
+        started, release = [], asyncio.Event()
+        first = asyncio.create_task(hold(scheduler, "carol", "interactive", started, release))
+        await settle()
+        waiting = [
+            asyncio.create_task(hold(scheduler, "batch-user", "batch", started, release)),
+            asyncio.create_task(hold(scheduler, "dave", "interactive", started, release)),
+        ]
+        await settle()
+        release.set()
+        await asyncio.gather(first, *waiting)
+        assert started == [
+            ("carol", "interactive"),
+            ("dave", "interactive"),
+            ("batch-user", "batch"),
+        ]
+
+    asyncio.run(main())
+
+
+def test_batch_lane_is_capped():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=4, max_per_user=4, batch_max_concurrency=2)
+        started, release = [], asyncio.Event()
+        tasks = [
+            asyncio.create_task(hold(scheduler, f"user-{i}", "batch", started, release))
+            for i in range(4)
+        ]
+        await settle()
+        assert scheduler.stats()["running"] == {"interactive": 0, "batch": 2}
+        # The slots batch traffic may not use stay free for interactive requests.
+        tasks.append(asyncio.create_task(hold(scheduler, "erin", "interactive", started, release)))
+        await settle()
+        assert scheduler.stats()["running"] == {"interactive": 1, "batch": 2}
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_released():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, max_per_user=4, batch_max_concurrency=1)
+        started, release = [], asyncio.Event()
+        first = scheduler.slot("frank", lane="interactive")
+        await first.__aenter__()
+        waiter = asyncio.create_task(hold(scheduler, "grace", "interactive", started, release))
+        await settle()
+        # The freed slot is granted to the waiter, which is cancelled before it gets to run.
+        await first.__aexit__(None, None, None)
+        assert scheduler.stats()["running"]["interactive"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert started == []
+        assert scheduler.stats()["running"] == {"interactive": 0, "batch": 0}
+
+        release.set()
+        await hold(scheduler, "heidi", "interactive", started, release)
+        assert started == [("heidi", "interactive")]
+
+    asyncio.run(main())
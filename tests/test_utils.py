@@ -0,0 +1,128 @@
+import sqlite3
+from contextlib import closing
+
+import time
+
+import pytest
+
+import src.utils as utils
+from src.conversation import ChatMessage, ToolCall
+from src.utils import (
+    TOOL_TIMEOUT_MESSAGE,
+    QueryRejectedError,
+    handle_function_calls,
+    query_product_database,
+)
+
+
+@pytest.fixture
+def product_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "SQL_FULL_SCAN_MIN_ROWS", 100)
+    db_path = tmp_path / "products.db"
+    with closing(sqlite3.connect(db_path)) as connection:
+        connection.executescript(
+            """
+            CREATE TABLE products (parent_asin TEXT, title TEXT, price REAL);
+            CREATE INDEX idx_products_price ON products (price);
+            CREATE TABLE product_cards (
+                parent_asin TEXT PRIMARY KEY, card TEXT, token_count INTEGER
+            ) WITHOUT ROWID;
+            CREATE INDEX idx_product_cards_token_count ON product_cards (token_count);
+            """
+        )
+        connection.executemany(
+            "INSERT INTO products VALUES (?, ?, ?)",
+            [(f"A{i}", f"product {i}", i) for i in range(200)],
+        )
+        connection.executemany(
+            "INSERT INTO product_cards VALUES (?, ?, ?)",
+            [(f"A{i}", "{}", i) for i in range(200)],
+        )
+        connection.commit()
+    return str(db_path)
+
+
+@pytest.mark.parametrize(
+    "sql_query",
+    [
+        "SELECT title FROM products WHERE CAST(price AS REAL) < 20",
+        "SELECT p.title FROM products p WHERE CAST(p.price AS REAL) < 20",
+        "SELECT p.title FROM products AS p WHERE CAST(p.price AS REAL) < 20",
+    ],
+)
+def test_full_scan_of_indexed_column_is_rejected(product_db, sql_query):
+    with pytest.raises(QueryRejectedError, match="table 'products'"):
+        query_product_database(sql_query, db_url=product_db)
+
+
+def test_full_scan_of_without_rowid_table_is_rejected(product_db):
+    with pytest.raises(QueryRejectedError, match="table 'product_cards'"):
+        query_product_database(
+            "SELECT c.card FROM product_cards c WHERE c.token_count + 0 > 150",
+            db_url=product_db,
+        )
+
+
+def test_indexed_range_query_is_accepted(product_db):
+    rows = query_product_database(
+        "SELECT p.title FROM products p WHERE p.price < 3 ORDER BY p.price", db_url=product_db
+    )
+    assert [row["title"] for row in rows] == ["product 0", "product 1", "product 2"]
+
+
+def test_large_result_is_truncated_with_a_note(product_db, monkeypatch):
+    monkeypatch.setattr(utils, "SQL_MAX_ROWS", 10)
+
+    rows = query_product_database(
+        "SELECT title FROM products WHERE price >= 0 ORDER BY price", db_url=product_db
+    )
+
+    assert [row["title"] for row in rows[:10]] == [f"product {i}" for i in range(10)]
+    assert "Truncated to the first 10 rows" in rows[10]["note"]
+
+
+@pytest.fixture(scope="module")
+def catalog_db(tmp_path_factory):
+    from create_sqlite_database import build_database
+
+    db_path = tmp_path_factory.mktemp("catalog") / "products_information.db"
+    build_database("data/product_information.parquet", str(db_path), "products")
+    return str(db_path)
+
+
+def test_full_scan_guard_applies_to_the_catalog(catalog_db):
+    with pytest.raises(QueryRejectedError, match="table 'products'"):
+        query_product_database(
+            "SELECT p.title FROM products p WHERE CAST(p.price AS REAL) < 20", db_url=catalog_db
+        )
+    rows = query_product_database(
+        "SELECT p.title FROM products p WHERE p.price < 20 LIMIT 5", db_url=catalog_db
+    )
+    assert len(rows) == 5
+
+
+@pytest.mark.parametrize("deadline", [None, 5.0])
+def test_timeout_raised_by_a_tool_is_reported_as_its_error(deadline):
+    def socket_tool():
+        raise TimeoutError("socket timed out")
+
+    response = ChatMessage(
+        role="assistant", content=None, tool_calls=(ToolCall("call-1", "socket_tool", "{}"),)
+    )
+    messages = handle_function_calls(
+        {"socket_tool": socket_tool},
+        response,
+        [],
+        deadline=None if deadline is None else time.monotonic() + deadline,
+    )
+    assert messages[0].content == "socket timed out"
+
+
+def test_tool_running_past_the_deadline_is_cut_off():
+    response = ChatMessage(
+        role="assistant", content=None, tool_calls=(ToolCall("call-1", "slow_tool", "{}"),)
+    )
+    messages = handle_function_calls(
+        {"slow_tool": lambda: time.sleep(1)}, response, [], deadline=time.monotonic() + 0.1
+    )
+    assert messages[0].content == TOOL_TIMEOUT_MESSAGE
@@ -0,0 +1,84 @@
+from concurrent.futures import Future
+
+import src.vectorstore as vectorstore
+from src.resilience import CircuitOpenError
+
+
+def test_filtered_speculative_retrieval_degrades_when_the_search_fails(monkeypatch):
+    def open_circuit(*args, **kwargs):
+        raise CircuitOpenError("qdrant is unavailable (circuit breaker open).")
+
+    degraded = []
+
+    def degraded_retrieval(query, filters, top_n, stale_key, catalog_version):
+        degraded.append(query)
+        return [{"title": "keyword match"}]
+
+    monkeypatch.setattr(vectorstore, "refresh_catalog_version", lambda: 1)
+    monkeypatch.setattr(vectorstore, "select_product_asins", open_circuit)
+    monkeypatch.setattr(vectorstore, "degraded_retrieval", degraded_retrieval)
+    future = Future()
+    future.set_result(([[0.0]], ["A1"]))
+    token = vectorstore._speculation.set(
+        vectorstore.SpeculativeRetrieval(
+            query="electric guitar strings",
+            words=vectorstore.query_words("electric guitar strings"),
+            future=future,
+        )
+    )
+    try:
+        products = vectorstore.retrieve_relevant_products("guitar strings", max_price=20)
+    finally:
+        vectorstore._speculation.reset(token)
+
+    assert products == [{"title": "keyword match"}]
+    assert degraded == ["guitar strings"]
+
+
+def test_original_query_is_embedded_and_normalized_query_is_the_cache_key(monkeypatch):
+    embedded = []
+
+    def embed_search_query(query):
+        embedded.append(query)
+        return [[0.0]]
+
+    monkeypatch.setattr(vectorstore, "refresh_catalog_version", lambda: 1)
+    monkeypatch.setattr(vectorstore, "embed_search_query", embed_search_query)
+    monkeypatch.setattr(vectorstore, "select_product_asins", lambda *args, **kwargs: ["A1"])
+    monkeypatch.setattr(vectorstore, "hydrate_products", lambda asins, version: asins)
+    vectorstore.query_cache.clear()
+
+    assert vectorstore.retrieve_relevant_products("  Fender  USB-C  Pedal ") == ["A1"]
+    assert vectorstore.retrieve_relevant_products("fender usb-c pedal") == ["A1"]
+    assert embedded == ["  Fender  USB-C  Pedal "]
+
+
+def test_failed_vector_retrieval_falls_back_to_the_last_result_then_keyword_search(monkeypatch):
+    vector_search_up = True
+
+    def embed_search_query(query):
+        if not vector_search_up:
+            raise CircuitOpenError("embedding is unavailable (circuit breaker open).")
+        return [[0.0]]
+
+    keyword_searches = []
+
+    def keyword_search_products(query, filters, limit):
+        keyword_searches.append(query)
+        return ["K1"]
+
+    monkeypatch.setattr(vectorstore, "refresh_catalog_version", lambda: 1)
+    monkeypatch.setattr(vectorstore, "embed_search_query", embed_search_query)
+    monkeypatch.setattr(vectorstore, "select_product_asins", lambda *args, **kwargs: ["V1"])
+    monkeypatch.setattr(vectorstore, "keyword_search_products", keyword_search_products)
+    monkeypatch.setattr(vectorstore, "hydrate_products", lambda asins, version: asins)
+    vectorstore.query_cache.clear()
+    vectorstore.stale_query_cache.clear()
+
+    assert vectorstore.retrieve_relevant_products("drum sticks") == ["V1"]
+    vector_search_up = False
+    vectorstore.query_cache.clear()
+    # The last result of the same query is served first, keyword search otherwise.
+    assert vectorstore.retrieve_relevant_products("drum sticks") == ["V1"]
+    assert vectorstore.retrieve_relevant_products("guitar picks") == ["K1"]
+    assert keyword_searches == ["guitar picks"]